@@ -0,0 +1,382 @@
+"""
+Benchmarks for the word side of the puzzle pipeline.
+
+Runs `find_substrings`, `is_word`, `same_meaning`, `has_potential_suffix` and
+`build_visual_genome_phrases` over fixed phrase corpora, with a deterministic fake
+`is_visual_word` standing in for the LLM. For every benchmark we report wall time,
+CPU time, classifier calls, WordNet lookups and peak allocated bytes, per phrase.
+
+Usage:
+    python benchmarks/bench_substrings.py                   # print results
+    python benchmarks/bench_substrings.py --update          # (re)write the baseline
+    python benchmarks/bench_substrings.py --check           # compare against baseline
+
+CPU times are also reported relative to a fixed pure-Python reference loop timed in
+the same run, so results from different machines stay comparable.
+`--check` fails if any call count differs from the baseline, or if relative CPU
+time per phrase regressed by more than `--tolerance` (relative). Run it before
+merging changes to the substring search; the test suite checks the call counts
+only, since timings under pytest are too noisy to compare.
+
+The committed baseline (baselines/substrings.json) was recorded with WordNet 3.0,
+the version nltk's `wordnet` download provides. Call counts depend on the lexicon,
+so results from another lexicon version are reported as such rather than compared.
+Re-record it with `--update` whenever a change is expected to move the numbers.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+import zlib
+from contextlib import contextmanager
+from unittest import mock
+
+import rebus.rebus
+import rebus.word.wordnet
+from rebus.candidates import build_visual_genome_phrases
+from rebus.rebus import find_substrings, has_potential_suffix
+from rebus.word.wordnet import is_word, same_meaning
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "substrings.json")
+
+REFERENCE_LOOP_ITERATIONS = 200_000
+
+# each item is timed this many times and the fastest run kept, which filters out
+# scheduler noise on the sub-millisecond items
+TIMING_REPEATS = 5
+
+# fixed corpora of increasing phrase length
+CORPORA = {
+    "short": [
+        "garden bloom",
+        "carpet ants",
+        "bus stop",
+        "red barn",
+        "toy boat",
+        "snow man",
+        "pine tree",
+        "sea shell",
+    ],
+    "medium": [
+        "garden flower blooming",
+        "carpenter ants marching",
+        "man riding horse",
+        "dog chasing ball",
+        "woman holding umbrella",
+        "cat sitting on bench",
+        "boat floating on water",
+        "bird perched on branch",
+    ],
+    "long": [
+        "man wearing hat standing next to car",
+        "woman carrying basket of apples",
+        "children playing soccer in the park",
+        "train passing under a stone bridge",
+        "fisherman casting net from wooden boat",
+        "painter standing beside an easel outdoors",
+        "waiter pouring water into glass",
+        "tourist photographing the old lighthouse",
+    ],
+}
+
+WORD_PAIRS = [
+    ("gar", "garden"),
+    ("den", "garden"),
+    ("ant", "ants"),
+    ("car", "carpenter"),
+    ("pen", "carpenter"),
+    ("arch", "marching"),
+    ("bloom", "blooming"),
+    ("horse", "horses"),
+]
+
+
+def fake_is_visual_word_result(word: str) -> bool:
+    """Deterministic stand-in for the LLM classifier; stable across runs and machines"""
+    return zlib.crc32(word.strip().lower().encode()) % 3 != 0
+
+
+class CallCounter:
+    def __init__(self):
+        self.classifier_calls = 0
+        self.wordnet_lookups = 0
+
+    def reset(self):
+        self.classifier_calls = 0
+        self.wordnet_lookups = 0
+
+
+class _CountingWordNet:
+    """Proxy around the WordNet reader that counts synset lookups"""
+
+    def __init__(self, wordnet, counter: CallCounter):
+        self._wordnet = wordnet
+        self._counter = counter
+
+    def synsets(self, *args, **kwargs):
+        self._counter.wordnet_lookups += 1
+        return self._wordnet.synsets(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._wordnet, name)
+
+
+@contextmanager
+def instrumented(counter: CallCounter):
+    """Swaps in the fake classifier and the counting WordNet proxy"""
+
+    async def fake_is_visual_word(substring: str) -> bool:
+        counter.classifier_calls += 1
+        return fake_is_visual_word_result(substring)
+
+    wordnet = _CountingWordNet(rebus.word.wordnet.get_wordnet(), counter)
+    with (
+        mock.patch.object(rebus.rebus, "is_visual_word", fake_is_visual_word),
+        mock.patch.object(rebus.word.wordnet, "_wordnet", wordnet),
+    ):
+        yield
+
+
+def synthetic_relationships(phrases: list[str]) -> list[dict]:
+    """
+    Visual Genome style relationship records built from (subject, predicate, object)
+    phrases
+    """
+    relationships = []
+    for phrase in phrases:
+        words = phrase.split()
+        subject, predicate, obj = words[0], " ".join(words[1:-1]), words[-1]
+        relationships.append(
+            {
+                "relationships": [
+                    {
+                        "subject": {"name": subject},
+                        "predicate": predicate,
+                        "object": {"names": [obj]},
+                    }
+                ]
+            }
+        )
+    return relationships
+
+
+def reference_loop_cpu_time(repeats: int = 3) -> float:
+    """
+    CPU time of a fixed string and dict workload, similar in kind to the substring
+    search; the best of `repeats` runs
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        cpu_start = time.process_time()
+        seen = {}
+        for i in range(REFERENCE_LOOP_ITERATIONS):
+            key = str(i)[-3:]
+            seen[key] = seen.get(key, 0) + len(key)
+        best = min(best, time.process_time() - cpu_start)
+    return best
+
+
+def _measure(name: str, items: list, run_one, counter: CallCounter) -> dict:
+    """
+    Runs `run_one` over `items` in two passes: one for timings (best of
+    `TIMING_REPEATS`) and call counts, one under tracemalloc for allocations
+    (tracemalloc distorts timings too much to share a pass)
+    """
+    # warm up lazy corpora etc. so the first item does not pay for them
+    run_one(items[0])
+
+    per_item = []
+    for item in items:
+        wall_time = cpu_time = float("inf")
+        for _ in range(TIMING_REPEATS):
+            counter.reset()
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            run_one(item)
+            wall_time = min(wall_time, time.perf_counter() - wall_start)
+            cpu_time = min(cpu_time, time.process_time() - cpu_start)
+        per_item.append(
+            {
+                "item": str(item),
+                "wall_time_s": wall_time,
+                "cpu_time_s": cpu_time,
+                "classifier_calls": counter.classifier_calls,
+                "wordnet_lookups": counter.wordnet_lookups,
+            }
+        )
+
+    tracemalloc.start()
+    try:
+        for result, item in zip(per_item, items):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            run_one(item)
+            _, peak = tracemalloc.get_traced_memory()
+            result["alloc_peak_bytes"] = peak - baseline
+    finally:
+        tracemalloc.stop()
+
+    n = len(per_item)
+    return {
+        "name": name,
+        "items": n,
+        "wall_time_s": sum(r["wall_time_s"] for r in per_item),
+        "cpu_time_s": sum(r["cpu_time_s"] for r in per_item),
+        "cpu_time_per_item_s": sum(r["cpu_time_s"] for r in per_item) / n,
+        "classifier_calls": sum(r["classifier_calls"] for r in per_item),
+        "wordnet_lookups": sum(r["wordnet_lookups"] for r in per_item),
+        "alloc_peak_bytes_per_item": sum(r["alloc_peak_bytes"] for r in per_item) / n,
+        "per_item": per_item,
+    }
+
+
+def run_benchmarks(
+    corpora: dict[str, list[str]] = CORPORA,
+    word_pairs: list[tuple[str, str]] = WORD_PAIRS,
+) -> dict[str, dict]:
+    counter = CallCounter()
+    results = {}
+    with instrumented(counter):
+        for corpus_name, phrases in corpora.items():
+            results[f"find_substrings[{corpus_name}]"] = _measure(
+                f"find_substrings[{corpus_name}]",
+                phrases,
+                lambda phrase: asyncio.run(find_substrings(phrase)),
+                counter,
+            )
+
+        words = sorted(
+            {
+                word
+                for phrases in corpora.values()
+                for p in phrases
+                for word in p.split()
+            }
+        )
+        results["is_word"] = _measure("is_word", words, is_word, counter)
+        results["same_meaning"] = _measure(
+            "same_meaning", word_pairs, lambda pair: same_meaning(*pair), counter
+        )
+
+        def suffix_scan(phrase: str):
+            chars = [char for char in phrase if char.isalpha()]
+            for start in range(len(chars)):
+                for length in range(2, len(chars) - start + 1):
+                    has_potential_suffix(chars, start, length)
+
+        for corpus_name, phrases in corpora.items():
+            results[f"has_potential_suffix[{corpus_name}]"] = _measure(
+                f"has_potential_suffix[{corpus_name}]", phrases, suffix_scan, counter
+            )
+
+        medium = corpora["medium"]
+        results["build_visual_genome_phrases"] = _measure(
+            "build_visual_genome_phrases",
+            [synthetic_relationships(medium)],
+            build_visual_genome_phrases,
+            counter,
+        )
+
+    reference = reference_loop_cpu_time()
+    lexicon = rebus.word.wordnet.lexicon_version()
+    for result in results.values():
+        result["lexicon_version"] = lexicon
+        result["reference_cpu_time_s"] = reference
+        result["cpu_time_ratio"] = result["cpu_time_per_item_s"] / reference
+    return results
+
+
+def check_against_baseline(
+    results: dict, baseline: dict, tolerance: float | None
+) -> list[str]:
+    """
+    Returns a list of human readable regressions (empty if none). With `tolerance`
+    None only call counts are compared.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if base.get("lexicon_version") != result["lexicon_version"]:
+            regressions.append(
+                f"{name}: baseline recorded with {base.get('lexicon_version')}, "
+                f"not {result['lexicon_version']}; re-record it with --update"
+            )
+            continue
+        for key in ("classifier_calls", "wordnet_lookups"):
+            if result[key] != base[key]:
+                regressions.append(
+                    f"{name}: {key} changed {base[key]} -> {result[key]}"
+                )
+        if tolerance is None:
+            continue
+        limit = base["cpu_time_ratio"] * (1 + tolerance)
+        if result["cpu_time_ratio"] > limit:
+            regressions.append(
+                f"{name}: cpu time per item {result['cpu_time_ratio']:.4f}x the "
+                f"reference loop exceeds baseline {base['cpu_time_ratio']:.4f}x "
+                f"(+{tolerance:.0%})"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--update",
+        "--save",
+        dest="update",
+        action="store_true",
+        help="Write results as the new baseline",
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="Compare results to the baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative CPU time regression per item (default: 0.25)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.check and not args.update and not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}; run with --update to create one")
+
+    results = run_benchmarks()
+    for name, result in results.items():
+        print(
+            f"{name:<40} items={result['items']:<4} "
+            f"wall={result['wall_time_s']:.4f}s cpu={result['cpu_time_s']:.4f}s "
+            f"classifier={result['classifier_calls']:<5} "
+            f"wordnet={result['wordnet_lookups']:<5} "
+            f"alloc/item={result['alloc_peak_bytes_per_item']:.0f}B "
+            f"cpu/ref={result['cpu_time_ratio']:.4f}"
+        )
+
+    if args.update:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = check_against_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -32,15 +32,16 @@ def build_visual_genome_phrases(visual_genome_relationships: list[dict]) -> list
     return list(phrases)
 
 
-# # Load the data
-print("Loading data...")
-with open("/users/thesofakillers/Downloads/relationships.json") as f:
-    data = json.load(f)
-
-# Get phrases
-print("Building phrases...")
-phrases = build_visual_genome_phrases(data)
-
-print(f"built {len(phrases)} phrases")
-print("preview:")
-print(phrases[:100])
+if __name__ == "__main__":
+    # # Load the data
+    print("Loading data...")
+    with open("/users/thesofakillers/Downloads/relationships.json") as f:
+        data = json.load(f)
+
+    # Get phrases
+    print("Building phrases...")
+    phrases = build_visual_genome_phrases(data)
+
+    print(f"built {len(phrases)} phrases")
+    print("preview:")
+    print(phrases[:100])
@@ -0,0 +1,215 @@
+"""
+Columnar storage for large collections of `RebusPuzzle`s.
+
+Instead of one Python object per puzzle and per substring, a `PuzzleTable` keeps:
+- all phrases in one concatenated UTF-8 buffer, indexed by `phrase_offsets`
+- all substring spans in flat int32 `starts`/`stops` arrays, indexed per puzzle by
+  `substring_offsets`
+
+Puzzles are materialized on access (`table[i]`). Tables can be written to a binary
+file and re-opened memory-mapped, so loaders page in only the puzzles they touch.
+
+File layout (little-endian on every host; big-endian hosts byteswap on save and
+copy the integer columns on open):
+    header            magic, format version, #puzzles, #substrings, #phrase bytes
+    phrase_offsets    int64[#puzzles + 1]
+    substring_offsets int64[#puzzles + 1]
+    starts            int32[#substrings]
+    stops             int32[#substrings]
+    phrase_data       uint8[#phrase bytes]
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Iterable, Iterator
+
+from rebus.structs import RebusPuzzle, RebusSubstring
+
+MAGIC = b"RBPZ"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sIQQQ")
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _alpha_chars(phrase: str) -> str:
+    return "".join(char for char in phrase if char.isalpha())
+
+
+def _little_endian_bytes(column) -> memoryview:
+    view = memoryview(column)
+    if not _NATIVE_LITTLE_ENDIAN and view.itemsize > 1:
+        swapped = array(view.format, view)
+        swapped.byteswap()
+        view = memoryview(swapped)
+    return view.cast("B")
+
+
+class PuzzleTable:
+    """
+    Read-only columnar view over many puzzles. Substring texts are not stored: they
+    are recovered from the phrase, as `find_substrings` slices them from the
+    phrase's alphabetic characters.
+    """
+
+    def __init__(
+        self,
+        phrase_data,
+        phrase_offsets,
+        substring_offsets,
+        starts,
+        stops,
+        _mmap: mmap.mmap | None = None,
+    ):
+        self.phrase_data = phrase_data
+        self.phrase_offsets = phrase_offsets
+        self.substring_offsets = substring_offsets
+        self.starts = starts
+        self.stops = stops
+        self._mmap = _mmap
+
+    @classmethod
+    def from_puzzles(cls, puzzles: Iterable[RebusPuzzle]) -> "PuzzleTable":
+        phrase_data = bytearray()
+        phrase_offsets = array("q", [0])
+        substring_offsets = array("q", [0])
+        starts = array("i")
+        stops = array("i")
+
+        for puzzle in puzzles:
+            alpha_chars = _alpha_chars(puzzle.phrase)
+            for substring in puzzle.substrings:
+                if alpha_chars[substring.start : substring.stop] != substring.text:
+                    raise ValueError(
+                        f"Substring {substring!r} does not match phrase "
+                        f"{puzzle.phrase!r}"
+                    )
+                starts.append(substring.start)
+                stops.append(substring.stop)
+            phrase_data += puzzle.phrase.encode()
+            phrase_offsets.append(len(phrase_data))
+            substring_offsets.append(len(starts))
+
+        return cls(bytes(phrase_data), phrase_offsets, substring_offsets, starts, stops)
+
+    def __len__(self) -> int:
+        return len(self.phrase_offsets) - 1
+
+    def _check_index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("puzzle index out of range")
+        return index
+
+    def phrase(self, index: int) -> str:
+        index = self._check_index(index)
+        start, stop = self.phrase_offsets[index], self.phrase_offsets[index + 1]
+        return bytes(self.phrase_data[start:stop]).decode()
+
+    def spans(self, index: int) -> list[tuple[int, int]]:
+        """(start, stop) of each substring of puzzle `index`, without materializing"""
+        index = self._check_index(index)
+        first, last = self.substring_offsets[index], self.substring_offsets[index + 1]
+        return list(zip(self.starts[first:last], self.stops[first:last]))
+
+    def __getitem__(self, index: int) -> RebusPuzzle:
+        phrase = self.phrase(index)
+        alpha_chars = _alpha_chars(phrase)
+        return RebusPuzzle(
+            phrase=phrase,
+            substrings=[
+                RebusSubstring(text=alpha_chars[start:stop], start=start, stop=stop)
+                for start, stop in self.spans(index)
+            ],
+        )
+
+    def __iter__(self) -> Iterator[RebusPuzzle]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    MAGIC,
+                    FORMAT_VERSION,
+                    len(self),
+                    len(self.starts),
+                    len(self.phrase_data),
+                )
+            )
+            f.writelines(
+                _little_endian_bytes(column)
+                for column in (
+                    self.phrase_offsets,
+                    self.substring_offsets,
+                    self.starts,
+                    self.stops,
+                    self.phrase_data,
+                )
+            )
+
+    @classmethod
+    def open(cls, path: str) -> "PuzzleTable":
+        """Memory-maps a table written by `save`; call `close()` when done"""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, num_puzzles, num_substrings, num_phrase_bytes = (
+            _HEADER.unpack_from(mapped)
+        )
+        if magic != MAGIC:
+            mapped.close()
+            raise ValueError(f"{path} is not a PuzzleTable file")
+        if version != FORMAT_VERSION:
+            mapped.close()
+            raise ValueError(f"Unsupported PuzzleTable format version {version}")
+
+        view = memoryview(mapped)
+        offset = _HEADER.size
+        columns = []
+        for typecode, itemsize, count in (
+            ("q", 8, num_puzzles + 1),
+            ("q", 8, num_puzzles + 1),
+            ("i", 4, num_substrings),
+            ("i", 4, num_substrings),
+            ("B", 1, num_phrase_bytes),
+        ):
+            nbytes = itemsize * count
+            column = view[offset : offset + nbytes].cast(typecode)
+            if not _NATIVE_LITTLE_ENDIAN and itemsize > 1:
+                # the file is little-endian; swap a copy instead of the mapping
+                swapped = array(typecode, column)
+                swapped.byteswap()
+                column.release()
+                column = swapped
+            columns.append(column)
+            offset += nbytes
+        phrase_offsets, substring_offsets, starts, stops, phrase_data = columns
+        return cls(
+            phrase_data, phrase_offsets, substring_offsets, starts, stops, _mmap=mapped
+        )
+
+    def close(self):
+        """Releases the memory map of a table returned by `open`"""
+        if self._mmap is None:
+            return
+        for column in (
+            self.phrase_data,
+            self.phrase_offsets,
+            self.substring_offsets,
+            self.starts,
+            self.stops,
+        ):
+            if isinstance(column, memoryview):
+                column.release()
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self) -> "PuzzleTable":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
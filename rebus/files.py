@@ -0,0 +1,49 @@
+"""
+File helpers shared by the stores and command line tools.
+
+Everything that other processes may read while it is being written (cache entries,
+images, manifests, metric snapshots) is written under a temporary name and renamed
+into place, so readers never see a partial file.
+
+Example:
+    with atomic_path("scenes/garden.png") as tmp_path:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+"""
+
+import os
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+def temporary_path(path: str) -> str:
+    """
+    A sibling of `path` to write to before renaming it into place; unique per
+    process and thread, so concurrent writers of the same path never share one
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """
+    Yields a temporary path for the caller to write; it replaces `path` if the block
+    succeeds, and is removed if it raises
+    """
+    tmp_path = temporary_path(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def read_phrases(path: str) -> list[str]:
+    """The non-blank lines of a text file, stripped; one phrase per line"""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
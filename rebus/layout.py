@@ -0,0 +1,123 @@
+"""
+Per-phrase lookup tables for the substring search.
+
+`find_substrings` tests O(n^2) windows of a phrase, and for each one needs the word
+containing the window and whether a common suffix could start right after it.
+`PhraseLayout` precomputes both once per phrase, so each window costs two array
+lookups instead of re-splitting the phrase and rebuilding the suffix table.
+"""
+
+import functools
+from array import array
+
+# common English suffixes, grouped by shared endings
+SUFFIX_GROUPS = [
+    ["ed"],  # ed -> d
+    ["ing"],  # ing -> ng -> g
+    ["es", "ies"],  # es/ies -> s
+    ["er"],  # er -> r
+    ["est"],  # est -> st -> t
+    ["ful"],  # ful -> ul -> l
+    ["less"],  # less -> ess -> ss -> s
+    ["able", "ible"],  # able/ible -> ble -> le -> e
+    ["ly"],  # ly -> y
+    ["ment"],  # ment -> ent -> nt -> t
+    ["ness"],  # ness -> ess -> ss -> s
+    ["tion", "sion"],  # tion/sion -> ion -> on -> n
+]
+
+# every suffix and every partial suffix (its tails), e.g. "ing", "ng", "g"
+POTENTIAL_SUFFIXES = frozenset(
+    suffix[i:]
+    for group in SUFFIX_GROUPS
+    for suffix in group
+    for i in range(len(suffix))
+)
+
+# only this many characters after a window are compared against the suffixes
+SUFFIX_LOOKAHEAD = 3
+
+
+class PhraseLayout:
+    """
+    Args:
+        phrase: the candidate phrase, as passed to `find_substrings`
+
+    Attributes:
+        text: the phrase's alphabetic characters; windows index into this
+        words: the phrase's whitespace-separated words
+        word_starts, word_stops: each word's [start, stop) position
+        word_ids: word id at each position (half-open intervals)
+        suffix_starts: 1 at each position a (partial) common suffix could start;
+            built on first use, since parent-word lookups do not need it
+
+    Word positions count every character of a word, like `get_parent_word` always
+    has. For phrases of letters and whitespace only (e.g. from `candidates.py`)
+    they are exactly the indices into `text`.
+    """
+
+    __slots__ = (
+        "_suffix_starts",
+        "phrase",
+        "text",
+        "word_ids",
+        "word_starts",
+        "word_stops",
+        "words",
+    )
+
+    def __init__(self, phrase: str):
+        self.phrase = phrase
+        self.text = "".join(char for char in phrase if char.isalpha())
+        self.words = phrase.split()
+
+        self.word_starts = array("i")
+        self.word_stops = array("i")
+        self.word_ids = array("i")
+        position = 0
+        for word_id, word in enumerate(self.words):
+            self.word_starts.append(position)
+            self.word_ids.extend([word_id] * len(word))
+            position += len(word)
+            self.word_stops.append(position)
+        if self.words:
+            # a window ending the phrase starts at its very end
+            self.word_ids.append(len(self.words) - 1)
+        self._suffix_starts: bytes | None = None
+
+    @property
+    def suffix_starts(self) -> bytes:
+        if self._suffix_starts is None:
+            text = self.text
+            self._suffix_starts = bytes(
+                any(
+                    text[position : position + length] in POTENTIAL_SUFFIXES
+                    for length in range(1, SUFFIX_LOOKAHEAD + 1)
+                    if position + length <= len(text)
+                )
+                for position in range(len(text) + 1)
+            )
+        return self._suffix_starts
+
+    def parent_word(self, start: int, stop: int) -> str:
+        """
+        The word containing positions [start, stop), or "" if the window spans
+        several words or is out of bounds. See `rebus.rebus.get_parent_word`.
+        """
+        if not 0 <= start <= stop < len(self.word_ids):
+            return ""
+        word_id = self.word_ids[start]
+        if start == stop and word_id > 0 and start == self.word_starts[word_id]:
+            # an empty window on a word boundary belongs to the earlier word
+            word_id -= 1
+        return self.words[word_id] if stop <= self.word_stops[word_id] else ""
+
+    def has_potential_suffix(self, stop: int) -> bool:
+        """Whether a common suffix (or the tail of one) could start at `stop`"""
+        return bool(self.suffix_starts[stop])
+
+
+@functools.lru_cache(maxsize=1024)
+def cached_layout(phrase: str) -> PhraseLayout:
+    """`PhraseLayout` of `phrase`, shared between calls for the same phrase"""
+    return PhraseLayout(phrase)
@@ -0,0 +1,337 @@
+"""
+Incremental puzzle generation over a changing phrase corpus.
+
+A manifest records, for every phrase processed, its `RebusPuzzle` and the versions
+of everything that produced it: the lexicon (WordNet), the `IS_VISUAL_WORD_PROMPT`
+text and model, and the substring algorithm. A rerun on a refreshed corpus only
+processes phrases that are new, or whose recorded versions differ from the current
+ones, and reuses the stored puzzles for the rest.
+
+Phrases that fail are recorded with their error and retried on the next run.
+
+Example:
+    python -m rebus.manifest phrases.txt puzzles.manifest.jsonl
+    # new 1204, stale 0, failed 3, unchanged 98112, removed 310
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+
+from rebus.files import atomic_path, read_phrases
+from rebus.rebus import SUBSTRING_ALGORITHM_VERSION, find_puzzle
+from rebus.structs import RebusPuzzle, puzzle_from_dict, puzzle_to_dict
+from rebus.word.llm import VISUAL_WORD_MODEL
+from rebus.word.prompts import IS_VISUAL_WORD_PROMPT
+from rebus.word.wordnet import lexicon_version
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FORMAT_VERSION = 2
+
+
+def phrase_hash(phrase: str) -> str:
+    return hashlib.sha256(phrase.encode()).hexdigest()
+
+
+def current_dependencies() -> dict[str, str]:
+    """Versions of everything `find_substrings` results depend on"""
+    return {
+        "lexicon": lexicon_version(),
+        "visual_word_prompt": hashlib.sha256(
+            IS_VISUAL_WORD_PROMPT.encode()
+        ).hexdigest()[:16],
+        "visual_word_model": VISUAL_WORD_MODEL,
+        "algorithm": str(SUBSTRING_ALGORITHM_VERSION),
+    }
+
+
+@dataclass
+class ManifestDiff:
+    new: list[str] = field(default_factory=list)
+    stale: list[str] = field(default_factory=list)  # dependencies changed
+    failed: list[str] = field(default_factory=list)  # last attempt raised
+    unchanged: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)  # no longer in the corpus
+    changed_dependencies: set[str] = field(default_factory=set)
+
+    @property
+    def to_process(self) -> list[str]:
+        return self.new + self.stale + self.failed
+
+    def summary(self) -> str:
+        text = (
+            f"new {len(self.new)}, stale {len(self.stale)}, "
+            f"failed {len(self.failed)}, unchanged {len(self.unchanged)}, "
+            f"removed {len(self.removed)}"
+        )
+        if self.changed_dependencies:
+            text += f" (changed: {', '.join(sorted(self.changed_dependencies))})"
+        return text
+
+
+def _journal_header() -> str:
+    return json.dumps({"format_version": MANIFEST_FORMAT_VERSION}) + "\n"
+
+
+def append_journal(path: str, lines: list[str]):
+    """Appends journal lines written by `Manifest` to the file at `path`"""
+    if lines:
+        with open(path, "a") as f:
+            if f.tell() == 0:  # new manifest
+                f.write(_journal_header())
+            f.write("".join(lines))
+
+
+class Manifest:
+    """
+    Stored as a JSONL journal: a header line, then one line per recorded puzzle,
+    failure or removal, later lines superseding earlier ones for the same phrase.
+    Changes are appended (see `take_journal`), so checkpointing a large corpus
+    costs only the lines added since the last checkpoint; `save` compacts the
+    journal to one line per phrase.
+    """
+
+    def __init__(self, entries: dict[str, dict] | None = None):
+        # phrase hash -> {"phrase", "dependencies", "puzzle"}, or "error" in place
+        # of "puzzle" if processing the phrase failed
+        self.entries = entries or {}
+        self.journal_lines = 0  # lines read by `load`, superseded ones included
+        self.format_version = MANIFEST_FORMAT_VERSION  # of the file it was loaded from
+        self._journal: list[str] = []
+
+    @classmethod
+    def load(cls, path: str) -> "Manifest":
+        """Loads the manifest at `path`, or an empty one if it does not exist"""
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return cls()
+        if not lines:
+            return cls()
+        header = json.loads(lines[0])
+        if header["format_version"] == 1:  # one JSON document
+            manifest = cls(header["entries"])
+            manifest.format_version = 1
+            return manifest
+        if header["format_version"] != MANIFEST_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported manifest format {header['format_version']}, "
+                f"expected {MANIFEST_FORMAT_VERSION}"
+            )
+
+        manifest = cls()
+        for number, line in enumerate(lines[1:], start=2):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                if number == len(lines):  # cut off by an interrupted append
+                    logger.warning("Ignoring truncated last line of %s", path)
+                    break
+                raise
+            key = record.pop("key")
+            if record.get("removed"):
+                manifest.entries.pop(key, None)
+            else:
+                manifest.entries[key] = record
+        manifest.journal_lines = len(lines) - 1
+        return manifest
+
+    def save(self, path: str):
+        """Atomically rewrites the manifest at `path`, one line per phrase"""
+        with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+            f.write(_journal_header())
+            for key, entry in self.entries.items():
+                f.write(json.dumps({"key": key, **entry}) + "\n")
+        self.journal_lines = len(self.entries)
+        self.format_version = MANIFEST_FORMAT_VERSION
+        self._journal.clear()
+
+    def take_journal(self) -> list[str]:
+        """Journal lines for the changes since the last call, for `append_journal`"""
+        lines, self._journal = self._journal, []
+        return lines
+
+    def _set(self, key: str, entry: dict):
+        self.entries[key] = entry
+        self._journal.append(json.dumps({"key": key, **entry}) + "\n")
+
+    def diff(
+        self, phrases: Iterable[str], dependencies: dict[str, str]
+    ) -> ManifestDiff:
+        diff = ManifestDiff()
+        seen = set()
+        for phrase in phrases:
+            key = phrase_hash(phrase)
+            if key in seen:
+                continue
+            seen.add(key)
+            entry = self.entries.get(key)
+            if entry is None:
+                diff.new.append(phrase)
+            elif entry["dependencies"] != dependencies:
+                diff.stale.append(phrase)
+                diff.changed_dependencies.update(
+                    name
+                    for name in dependencies.keys() | entry["dependencies"].keys()
+                    if entry["dependencies"].get(name) != dependencies.get(name)
+                )
+            elif "error" in entry:
+                diff.failed.append(phrase)
+            else:
+                diff.unchanged.append(phrase)
+        diff.removed = [
+            entry["phrase"] for key, entry in self.entries.items() if key not in seen
+        ]
+        return diff
+
+    def record(self, puzzle: RebusPuzzle, dependencies: dict[str, str]):
+        self._set(
+            phrase_hash(puzzle.phrase),
+            {
+                "phrase": puzzle.phrase,
+                "dependencies": dependencies,
+                "puzzle": puzzle_to_dict(puzzle),
+            },
+        )
+
+    def record_failure(self, phrase: str, dependencies: dict[str, str], error: str):
+        """Marks `phrase` as failed, so the next run retries it"""
+        self._set(
+            phrase_hash(phrase),
+            {"phrase": phrase, "dependencies": dependencies, "error": error},
+        )
+
+    def remove(self, phrases: Iterable[str]):
+        for phrase in phrases:
+            key = phrase_hash(phrase)
+            if self.entries.pop(key, None) is not None:
+                self._journal.append(json.dumps({"key": key, "removed": True}) + "\n")
+
+    def puzzle(self, phrase: str) -> RebusPuzzle | None:
+        """The phrase's stored puzzle, or None if it is unknown or failed"""
+        entry = self.entries.get(phrase_hash(phrase))
+        return (
+            puzzle_from_dict(entry["puzzle"]) if entry and "puzzle" in entry else None
+        )
+
+    def error(self, phrase: str) -> str | None:
+        entry = self.entries.get(phrase_hash(phrase))
+        return entry.get("error") if entry else None
+
+
+async def process_corpus(
+    phrases: list[str],
+    manifest_path: str,
+    process: Callable[[str], Awaitable[RebusPuzzle]] = find_puzzle,
+    dependencies: dict[str, str] | None = None,
+    concurrency: int = 8,
+    checkpoint_every: int = 100,
+) -> tuple[list[RebusPuzzle | None], ManifestDiff]:
+    """
+    Brings the manifest at `manifest_path` up to date with `phrases`, and returns
+    the puzzles of all phrases (in order, None for phrases that failed) along with
+    what changed. A phrase that fails is recorded with its error and retried on
+    the next run; the others are unaffected. Progress is appended to the manifest
+    every `checkpoint_every` phrases, so an interrupted run resumes where it
+    stopped.
+
+    Args:
+        process: turns a phrase into its puzzle
+        dependencies: current dependency versions; `current_dependencies()` by
+            default
+    """
+    dependencies = dependencies or current_dependencies()
+    manifest = await asyncio.to_thread(Manifest.load, manifest_path)
+    diff = manifest.diff(phrases, dependencies)
+    logger.info("Corpus diff: %s", diff.summary())
+    manifest.remove(diff.removed)
+    if (
+        manifest.format_version != MANIFEST_FORMAT_VERSION
+        or manifest.journal_lines > 2 * len(manifest.entries)
+    ):
+        # an older format can't be appended to, and a journal of mostly
+        # superseded lines is worth compacting before appending more
+        await asyncio.to_thread(manifest.save, manifest_path)
+
+    slots = asyncio.Semaphore(concurrency)
+    writing = asyncio.Lock()
+    done = failed = 0
+
+    async def checkpoint():
+        async with writing:
+            lines = manifest.take_journal()
+            await asyncio.to_thread(append_journal, manifest_path, lines)
+
+    async def run(phrase: str):
+        nonlocal done, failed
+        async with slots:
+            try:
+                puzzle = await process(phrase)
+            except Exception as e:
+                logger.exception("Failed to process %r", phrase)
+                manifest.record_failure(
+                    phrase, dependencies, f"{type(e).__name__}: {e}"
+                )
+                failed += 1
+            else:
+                manifest.record(puzzle, dependencies)
+        done += 1
+        if done % checkpoint_every == 0:
+            await checkpoint()
+            logger.info("Processed %d/%d phrases", done, len(diff.to_process))
+
+    try:
+        await asyncio.gather(*[run(phrase) for phrase in diff.to_process])
+    finally:
+        await checkpoint()
+    if failed:
+        logger.warning("%d phrases failed; they are retried on the next run", failed)
+    return [manifest.puzzle(phrase) for phrase in phrases], diff
+
+
+def _write_puzzles(path: str, puzzles: Iterable[RebusPuzzle]):
+    with open(path, "w") as f:
+        for puzzle in puzzles:
+            f.write(json.dumps(puzzle_to_dict(puzzle)) + "\n")
+
+
+async def _main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Generate puzzles for new or changed phrases only"
+    )
+    parser.add_argument("phrases", help="Text file, one phrase per line")
+    parser.add_argument("manifest", help="Manifest JSONL file; created if missing")
+    parser.add_argument("--output", "-o", help="Also write all puzzles as JSONL")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only print what would be processed"
+    )
+    args = parser.parse_args()
+
+    phrases = await asyncio.to_thread(read_phrases, args.phrases)
+
+    if args.dry_run:
+        manifest = await asyncio.to_thread(Manifest.load, args.manifest)
+        print(manifest.diff(phrases, current_dependencies()).summary())
+        return
+
+    puzzles, diff = await process_corpus(
+        phrases, args.manifest, concurrency=args.concurrency
+    )
+    print(diff.summary())
+    if args.output:
+        await asyncio.to_thread(
+            _write_puzzles, args.output, [p for p in puzzles if p is not None]
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,337 @@
+"""
+Minimal in-process metrics: counters, gauges and histograms with labels.
+
+Metrics are registered on a module-level registry and can be exported either in the
+Prometheus text format (see `serve`) or as periodic JSON snapshots (see
+`start_snapshot_writer`).
+
+Example:
+    LLM_CALLS = metrics.counter("rebus_llm_calls_total", "Calls made to the LLM API")
+    LLM_CALLS.inc()
+
+    metrics.serve(port=9100)  # curl localhost:9100/metrics
+"""
+
+import bisect
+import itertools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rebus.files import atomic_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+DEFAULT_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _label_key(labelnames: tuple[str, ...], labels: dict) -> tuple[str, ...]:
+    try:
+        if len(labels) == len(labelnames):
+            return tuple([str(labels[name]) for name in labelnames])
+    except KeyError:
+        pass
+    raise ValueError(f"Expected labels {labelnames}, got {tuple(labels)}")
+
+
+def _format_labels(
+    labelnames: tuple[str, ...], values: tuple[str, ...], **extra
+) -> str:
+    pairs = list(zip(labelnames, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def _prometheus_lines(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+    def _snapshot(self) -> list[dict]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            {"labels": dict(zip(self.labelnames, key)), "value": value}
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """Value that can go up and down, e.g. a queue depth"""
+
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Distribution of observed values over fixed cumulative buckets"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label key -> [per-bucket counts..., sum, count]; bucket i counts values in
+        # (buckets[i - 1], buckets[i]], and is made cumulative only when exported
+        self._values: dict[tuple[str, ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time spent inside the block, in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(_label_key(self.labelnames, labels))
+        return state[-1] if state else 0
+
+    def _items(self) -> list[tuple[tuple[str, ...], list[float]]]:
+        """Sorted (label key, state) pairs, with cumulative bucket counts"""
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for _, state in items:
+            state[: len(self.buckets)] = itertools.accumulate(
+                state[: len(self.buckets)]
+            )
+        return items
+
+    def _prometheus_lines(self) -> list[str]:
+        lines = []
+        for key, state in self._items():
+            for bound, bucket_count in zip(self.buckets, state):
+                labels = _format_labels(self.labelnames, key, le=_format_value(bound))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+    def _snapshot(self) -> list[dict]:
+        return [
+            {
+                "labels": dict(zip(self.labelnames, key)),
+                "buckets": {
+                    _format_value(bound): bucket_count
+                    for bound, bucket_count in zip(self.buckets, state)
+                },
+                "sum": state[-2],
+                "count": state[-1],
+            }
+            for key, state in self._items()
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name!r} already registered as {metric.type}")
+            return metric
+
+    def counter(
+        self, name: str, help: str, labelnames: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets)
+
+    def render_prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric._prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """JSON-serializable view of all metrics"""
+        return {
+            "timestamp": time.time(),
+            "metrics": {
+                name: {
+                    "type": metric.type,
+                    "help": metric.help,
+                    "samples": metric._snapshot(),
+                }
+                for name, metric in sorted(self._metrics.items())
+            },
+        }
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.counter(name, help, labelnames)
+
+
+def gauge(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.gauge(name, help, labelnames)
+
+
+def histogram(
+    name: str,
+    help: str,
+    labelnames: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+) -> Histogram:
+    return REGISTRY.histogram(name, help, labelnames, buckets)
+
+
+def serve(
+    port: int = 9100, host: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY
+) -> ThreadingHTTPServer:
+    """
+    Serves `registry` in the Prometheus text format on http://host:port/metrics
+    from a daemon thread. Call `.shutdown()` on the returned server to stop it.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("metrics server: " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", *server.server_address[:2])
+    return server
+
+
+def write_snapshot(path: str, registry: MetricsRegistry = REGISTRY):
+    """Atomically writes a JSON snapshot of `registry` to `path`"""
+    with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(registry.snapshot(), f, indent=2)
+
+
+def start_snapshot_writer(
+    path: str, interval: float = 60.0, registry: MetricsRegistry = REGISTRY
+) -> threading.Event:
+    """
+    Writes a JSON snapshot to `path` every `interval` seconds from a daemon thread.
+    Set the returned event to stop the writer (a final snapshot is written).
+    """
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            write_snapshot(path, registry)
+        write_snapshot(path, registry)
+
+    threading.Thread(target=run, daemon=True).start()
+    return stop
@@ -0,0 +1,316 @@
+"""
+Streaming pipeline from candidate phrases to scene images.
+
+Items flow through a chain of async stages connected by bounded queues. Each stage
+runs `concurrency` workers; when a stage falls behind, its input queue fills up and
+the stages before it block on `put`. A slow image stage therefore throttles
+substring discovery (and its LLM calls) instead of letting puzzles pile up.
+
+`Pipeline.format_stats` gives a one-line per-stage readout (throughput, queue depth,
+busy workers), which `stream` logs every `report_interval` seconds. The same values
+are exported as metrics.
+
+Example:
+    async with SceneScheduler(urls, output_store=store) as scheduler:
+        pipeline = Pipeline(rebus_stages(scheduler.submit))
+        async for puzzle, result in pipeline.stream(phrases, report_interval=10):
+            print(puzzle.phrase, result.paths)
+"""
+
+import asyncio
+import hashlib
+import inspect
+import logging
+import time
+from collections.abc import AsyncIterable, Awaitable, Callable, Iterable
+from dataclasses import dataclass
+from typing import Any
+
+from rebus import metrics
+from rebus.files import read_phrases
+from rebus.rebus import find_puzzle
+from rebus.scene.jobs import SceneJob, SceneResult
+from rebus.scene.workflow import scene_job_for_puzzle
+from rebus.structs import RebusPuzzle, puzzle_to_dict
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_ITEMS = metrics.counter(
+    "rebus_pipeline_items_total",
+    "Items handled by each pipeline stage, by outcome (ok/dropped/error)",
+    ("stage", "outcome"),
+)
+PIPELINE_QUEUE_DEPTH = metrics.gauge(
+    "rebus_pipeline_queue_depth",
+    "Items waiting in each stage's input queue",
+    ("stage",),
+)
+PIPELINE_IN_FLIGHT = metrics.gauge(
+    "rebus_pipeline_in_flight", "Items being processed by each stage", ("stage",)
+)
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], Awaitable[Any]]  # returns None to drop the item
+    concurrency: int = 1
+    queue_size: int = 16  # bound of the queue feeding this stage
+
+
+@dataclass
+class StageStats:
+    processed: int = 0
+    dropped: int = 0
+    errors: int = 0
+    in_flight: int = 0
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage]):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.stats = {stage.name: StageStats() for stage in stages}
+        self._queues: list[asyncio.Queue] = []
+        self._start: float | None = None
+
+    def _queue_depth(self, i: int) -> int:
+        return self._queues[i].qsize() if self._queues else 0
+
+    def _update_depth(self, i: int):
+        if i < len(self.stages):  # the last queue feeds the consumer, not a stage
+            PIPELINE_QUEUE_DEPTH.set(self._queues[i].qsize(), stage=self.stages[i].name)
+
+    async def _put(self, i: int, item):
+        # updated on put as well as get, so the gauge stays current while the
+        # queue's stage is stalled and nothing is taken out
+        await self._queues[i].put(item)
+        self._update_depth(i)
+
+    def snapshot(self) -> dict[str, dict]:
+        """Per-stage counters, queue depth and throughput (items/s since start)"""
+        elapsed = time.monotonic() - self._start if self._start else 0.0
+        snapshot = {}
+        for i, stage in enumerate(self.stages):
+            stats = self.stats[stage.name]
+            snapshot[stage.name] = {
+                **vars(stats),
+                "queue_depth": self._queue_depth(i),
+                "queue_size": stage.queue_size,
+                "concurrency": stage.concurrency,
+                "throughput": stats.processed / elapsed if elapsed > 0 else 0.0,
+            }
+        return snapshot
+
+    def format_stats(self) -> str:
+        """
+        One line for all stages, e.g.
+        substrings 4.2/s queue 16/16 busy 8/8 | scene 0.5/s queue 2/4 busy 2/2
+        """
+        return " | ".join(
+            f"{name} {s['throughput']:.1f}/s queue {s['queue_depth']}/{s['queue_size']}"
+            f" busy {s['in_flight']}/{s['concurrency']}"
+            + (f" errors {s['errors']}" if s["errors"] else "")
+            for name, s in self.snapshot().items()
+        )
+
+    async def _feed(self, items: Iterable | AsyncIterable):
+        try:
+            if isinstance(items, AsyncIterable):
+                async for item in items:
+                    await self._put(0, item)
+            else:
+                for item in items:
+                    await self._put(0, item)
+        except Exception:
+            # let the stages drain, so that `stream` gets to raise this
+            for _ in range(self.stages[0].concurrency):
+                await self._put(0, _DONE)
+            raise
+        for _ in range(self.stages[0].concurrency):
+            await self._put(0, _DONE)
+
+    async def _work(self, i: int, remaining: list[int]):
+        stage = self.stages[i]
+        stats = self.stats[stage.name]
+        inbox = self._queues[i]
+        while (item := await inbox.get()) is not _DONE:
+            self._update_depth(i)
+            stats.in_flight += 1
+            PIPELINE_IN_FLIGHT.inc(stage=stage.name)
+            try:
+                result = await stage.fn(item)
+            except Exception:
+                logger.exception("Stage %r failed on %r", stage.name, item)
+                stats.errors += 1
+                outcome = "error"
+            else:
+                outcome = "ok" if result is not None else "dropped"
+            finally:
+                stats.in_flight -= 1
+                PIPELINE_IN_FLIGHT.dec(stage=stage.name)
+            PIPELINE_ITEMS.inc(stage=stage.name, outcome=outcome)
+            if outcome == "ok":
+                stats.processed += 1
+                await self._put(i + 1, result)
+            elif outcome == "dropped":
+                stats.processed += 1
+                stats.dropped += 1
+
+        remaining[i] -= 1
+        if remaining[i] == 0:  # last worker of this stage: close the next one
+            next_workers = (
+                self.stages[i + 1].concurrency if i + 1 < len(self.stages) else 1
+            )
+            for _ in range(next_workers):
+                await self._put(i + 1, _DONE)
+
+    async def _report(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("Pipeline: %s", self.format_stats())
+
+    async def stream(
+        self, items: Iterable | AsyncIterable, report_interval: float | None = None
+    ):
+        """
+        Feeds `items` through the stages and yields the last stage's outputs as they
+        finish (not in input order). Items a stage fails on are logged and dropped.
+        """
+        self._queues = [
+            asyncio.Queue(maxsize=stage.queue_size) for stage in self.stages
+        ]
+        # the consumer applies backpressure to the last stage like any other stage
+        self._queues.append(asyncio.Queue(maxsize=self.stages[-1].queue_size))
+        self._start = time.monotonic()
+        remaining = [stage.concurrency for stage in self.stages]
+        tasks = [asyncio.create_task(self._feed(items))] + [
+            asyncio.create_task(self._work(i, remaining))
+            for i, stage in enumerate(self.stages)
+            for _ in range(stage.concurrency)
+        ]
+        if report_interval:
+            tasks.append(asyncio.create_task(self._report(report_interval)))
+
+        output = self._queues[-1]
+        try:
+            while (result := await output.get()) is not _DONE:
+                yield result
+            # surface errors from the feeder (e.g. a failing input iterator)
+            for task in tasks:
+                if task.done() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if report_interval:
+                logger.info("Pipeline finished: %s", self.format_stats())
+
+    async def run(self, items: Iterable | AsyncIterable, **kwargs) -> list:
+        return [result async for result in self.stream(items, **kwargs)]
+
+
+def phrase_seed(phrase: str) -> int:
+    """Stable noise seed for a phrase, so reruns hit the scene output store"""
+    return int.from_bytes(hashlib.sha256(phrase.encode()).digest()[:8], "little")
+
+
+def rebus_stages(
+    generate: Callable[[SceneJob], Awaitable[SceneResult]],
+    substring_concurrency: int = 8,
+    scene_concurrency: int = 2,
+    queue_size: int = 16,
+    seed_for: Callable[[str], int] = phrase_seed,
+    **job_kwargs,
+) -> list[Stage]:
+    """
+    Stages for phrase -> RebusPuzzle -> (RebusPuzzle, SceneResult). Phrases without
+    any substrings are dropped.
+
+    Args:
+        generate: runs a scene job, e.g. `SceneScheduler.submit` or
+            `ComfyClient.generate`; may also be a plain function (run in a thread)
+        queue_size: bound of each stage's input queue
+        job_kwargs: passed on to `scene_job_for_puzzle`
+    """
+
+    async def find_solvable_puzzle(phrase: str) -> RebusPuzzle | None:
+        puzzle = await find_puzzle(phrase)
+        return puzzle if puzzle.substrings else None
+
+    async def draw_scene(puzzle: RebusPuzzle) -> tuple[RebusPuzzle, SceneResult]:
+        job = scene_job_for_puzzle(puzzle, seed=seed_for(puzzle.phrase), **job_kwargs)
+        if inspect.iscoroutinefunction(generate):
+            result = await generate(job)
+        else:
+            result = await asyncio.to_thread(generate, job)
+        return puzzle, result
+
+    return [
+        Stage("substrings", find_solvable_puzzle, substring_concurrency, queue_size),
+        Stage("scene", draw_scene, scene_concurrency, queue_size),
+    ]
+
+
+def _append_line(f, line: str):
+    f.write(line + "\n")
+    f.flush()
+
+
+async def _main():
+    import argparse
+    import json
+
+    from rebus.scene.output_cache import SceneOutputStore
+    from rebus.scene.scheduler import SceneScheduler
+
+    parser = argparse.ArgumentParser(
+        description="Generate rebus puzzles and their scenes from a phrase list"
+    )
+    parser.add_argument("phrases", help="Text file, one candidate phrase per line")
+    parser.add_argument(
+        "--comfy-url", action="append", required=True, help="Repeat for each backend"
+    )
+    parser.add_argument("--store", required=True, help="Scene output store directory")
+    parser.add_argument("--output", "-o", required=True, help="Output JSONL file")
+    parser.add_argument("--substring-concurrency", type=int, default=8)
+    parser.add_argument("--scene-concurrency", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    args = parser.parse_args()
+
+    phrases = await asyncio.to_thread(read_phrases, args.phrases)
+
+    async with SceneScheduler(
+        args.comfy_url, output_store=SceneOutputStore(args.store)
+    ) as scheduler:
+        pipeline = Pipeline(
+            rebus_stages(
+                scheduler.submit,
+                substring_concurrency=args.substring_concurrency,
+                scene_concurrency=args.scene_concurrency,
+                queue_size=args.queue_size,
+            )
+        )
+        out = await asyncio.to_thread(open, args.output, "a")
+        try:
+            async for puzzle, result in pipeline.stream(
+                phrases, report_interval=args.report_interval
+            ):
+                record = {
+                    **puzzle_to_dict(puzzle),
+                    "seed": result.job.seed,
+                    "paths": result.paths,
+                }
+                await asyncio.to_thread(_append_line, out, json.dumps(record))
+        finally:
+            await asyncio.to_thread(out.close)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -1,113 +1,197 @@
 import asyncio
 import logging
-
-from rebus.word.wordnet import same_meaning, is_word
-from rebus.word.llm import is_visual_word
-from rebus.structs import RebusSubstring
-
-logging.basicConfig(
-    level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s"
+import time
+
+from rebus import metrics, tracing
+from rebus.layout import (
+    POTENTIAL_SUFFIXES,
+    SUFFIX_LOOKAHEAD,
+    PhraseLayout,
+    cached_layout,
 )
+from rebus.word.wordnet import same_meaning, is_word, get_wordnet
+from rebus.word.llm import is_visual_word, get_client
+from rebus.structs import RebusPuzzle, RebusSubstring
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
 
+# bump whenever a change to the substring search can change its results; stored
+# puzzles from older versions are then regenerated (see `rebus.manifest`)
+SUBSTRING_ALGORITHM_VERSION = 1
 
-async def is_valid_substring(substring: str, parent_word: str) -> bool:
-    """Check if a substring is valid for rebus purposes."""
-    if not is_word(substring):
-        logger.debug("%r is not a word", substring)
-        return False
+STAGE_LATENCY = metrics.histogram(
+    "rebus_stage_latency_seconds",
+    "Latency of puzzle pipeline stages; per-substring checks are summed per phrase",
+    ("stage",),
+)
+SUBSTRINGS_CHECKED = metrics.histogram(
+    "rebus_substrings_checked",
+    "Substrings checked per phrase",
+    buckets=metrics.DEFAULT_COUNT_BUCKETS,
+)
+SUBSTRINGS_ACCEPTED = metrics.histogram(
+    "rebus_substrings_accepted",
+    "Substrings accepted per phrase",
+    buckets=metrics.DEFAULT_COUNT_BUCKETS,
+)
 
-    if substring == parent_word or same_meaning(substring, parent_word):
-        logger.debug("%r has same meaning as parent word %r", substring, parent_word)
-        return False
 
-    if not await is_visual_word(substring):
-        logger.debug("%r is not a visual word", substring)
-        return False
+def warmup():
+    """
+    Eagerly creates the LLM client and loads WordNet, which otherwise happens
+    lazily on the first `find_substrings` call
+    """
+    get_client()
+    get_wordnet()
+
+
+class StageSeconds(dict):
+    """
+    Time spent per stage, summed over the substrings of a phrase and observed in
+    `STAGE_LATENCY` once, rather than once per substring checked
+    """
+
+    def add(self, stage: str, start: float):
+        """Adds the time since `start` (a `time.perf_counter()` value) to `stage`"""
+        self[stage] = self.get(stage, 0.0) + time.perf_counter() - start
+
+    def observe(self):
+        for stage, seconds in self.items():
+            STAGE_LATENCY.observe(seconds, stage=stage)
+
 
-    return True
+async def is_valid_substring(
+    substring: str, parent_word: str, stage_seconds: StageSeconds | None = None
+) -> bool:
+    """
+    Check if a substring is valid for rebus purposes.
+
+    Time spent in each check is added to `stage_seconds` if given, and observed
+    right away otherwise.
+    """
+    seconds = StageSeconds() if stage_seconds is None else stage_seconds
+    try:
+        start = time.perf_counter()
+        with tracing.span("is_word"):
+            substring_is_word = is_word(substring)
+        seconds.add("is_word", start)
+        if not substring_is_word:
+            logger.debug("%r is not a word", substring)
+            return False
+
+        start = time.perf_counter()
+        with tracing.span("same_meaning"):
+            shares_meaning = substring == parent_word or same_meaning(
+                substring, parent_word
+            )
+        seconds.add("same_meaning", start)
+        if shares_meaning:
+            logger.debug(
+                "%r has same meaning as parent word %r", substring, parent_word
+            )
+            return False
+
+        start = time.perf_counter()
+        with tracing.span("is_visual_word"):
+            substring_is_visual = await is_visual_word(substring)
+        seconds.add("is_visual_word", start)
+        if not substring_is_visual:
+            logger.debug("%r is not a visual word", substring)
+            return False
+
+        return True
+    finally:
+        if stage_seconds is None:
+            seconds.observe()
 
 
 def has_potential_suffix(chars: list[str], start: int, length: int) -> bool:
     """Check if adding more characters could form a common suffix like -ed or -ing."""
-    remaining = len(chars) - (start + length)
-    if remaining < 1:
+    stop = start + length
+    if len(chars) - stop < 1:
         return False
-
-    next_chars = "".join(chars[start + length : start + length + 3])
-
-    suffix_groups = [
-        ["ed"],  # ed -> d
-        ["ing"],  # ing -> ng -> g
-        ["es", "ies"],  # es/ies -> s
-        ["er"],  # er -> r
-        ["est"],  # est -> st -> t
-        ["ful"],  # ful -> ul -> l
-        ["less"],  # less -> ess -> ss -> s
-        ["able", "ible"],  # able/ible -> ble -> le -> e
-        ["ly"],  # ly -> y
-        ["ment"],  # ment -> ent -> nt -> t
-        ["ness"],  # ness -> ess -> ss -> s
-        ["tion", "sion"],  # tion/sion -> ion -> on -> n
-    ]
-
-    # Generate all possible partial suffixes
-    potential_suffixes = set()
-    for group in suffix_groups:
-        for suffix in group:
-            potential_suffixes.add(suffix)
-            for i in range(1, len(suffix)):
-                potential_suffixes.add(suffix[i:])
-
-    return any(next_chars.startswith(suffix) for suffix in potential_suffixes)
+    next_chars = "".join(chars[stop : stop + SUFFIX_LOOKAHEAD])
+    return any(
+        next_chars[:i] in POTENTIAL_SUFFIXES for i in range(1, len(next_chars) + 1)
+    )
 
 
 async def find_substrings(candidate: str) -> list[RebusSubstring]:
     """Find valid rebus substrings within a candidate string."""
-    candidate_chars = [char for char in candidate if char.isalpha()]
+    with tracing.span("find_substrings", phrase=candidate) as span_args:
+        rebus_substrings = await _find_substrings(candidate)
+        span_args["num_substrings"] = len(rebus_substrings)
+    return rebus_substrings
+
+
+async def find_puzzle(phrase: str) -> RebusPuzzle:
+    """The puzzle for `phrase`; it has no substrings if none were found"""
+    return RebusPuzzle(phrase=phrase, substrings=await find_substrings(phrase))
+
 
+async def _find_substrings(candidate: str) -> list[RebusSubstring]:
+    start_time = time.perf_counter()
+    num_checked = 0
     rebus_substrings = []
-    num_chars = len(candidate_chars)
-
-    min_length = 2
-
-    start = 0
-    while start < num_chars:
-        last_found_valid = None
-        remaining = num_chars - start
-
-        # Try increasingly longer substrings until we find an invalid one
-        for length in range(min_length, remaining + 1):
-            substring = "".join(candidate_chars[start : start + length])
-            parent_word = get_parent_word(start, start + length, candidate)
-
-            logger.debug("Checking substring: %r", substring)
-            if await is_valid_substring(substring, parent_word):
-                logger.debug("Found valid substring: %r; checking next char", substring)
-                last_found_valid = RebusSubstring(
-                    text=substring, start=start, stop=start + length
-                )
-            elif last_found_valid:
-                # Check if we should continue due to potential suffix
-                if has_potential_suffix(candidate_chars, start, length):
+    stage_seconds = StageSeconds()
+    try:
+        layout = PhraseLayout(candidate)
+        text = layout.text
+
+        num_chars = len(text)
+
+        min_length = 2
+
+        start = 0
+        while start < num_chars:
+            last_found_valid = None
+            remaining = num_chars - start
+
+            # Try increasingly longer substrings until we find an invalid one
+            for length in range(min_length, remaining + 1):
+                substring = text[start : start + length]
+                parent_word = layout.parent_word(start, start + length)
+
+                logger.debug("Checking substring: %r", substring)
+                num_checked += 1
+                with tracing.span("is_valid_substring", substring=substring):
+                    is_valid = await is_valid_substring(
+                        substring, parent_word, stage_seconds
+                    )
+                if is_valid:
                     logger.debug(
-                        "Found potential suffix after %r; continuing", substring
+                        "Found valid substring: %r; checking next char", substring
+                    )
+                    last_found_valid = RebusSubstring(
+                        text=substring, start=start, stop=start + length
                     )
+                elif last_found_valid:
+                    # Check if we should continue due to potential suffix
+                    if layout.has_potential_suffix(start + length):
+                        logger.debug(
+                            "Found potential suffix after %r; continuing", substring
+                        )
+                        continue
+                    logger.debug("Found invalid substring; jumping start")
+                    # Stop if we hit an invalid substring after finding a valid one
+                    break
+                else:
                     continue
-                logger.debug("Found invalid substring; jumping start")
-                break  # Stop if we hit an invalid substring after finding a valid one
-            else:
-                continue
-
-        if last_found_valid:
-            rebus_substrings.append(last_found_valid)
-            start = last_found_valid.stop  # Move start to after the found substring
-        else:
-            start += 1  # Only advance by 1 if no substring was found
 
-    return rebus_substrings
+            if last_found_valid:
+                rebus_substrings.append(last_found_valid)
+                # Move start to after the found substring
+                start = last_found_valid.stop
+            else:
+                start += 1  # Only advance by 1 if no substring was found
+        return rebus_substrings
+    finally:
+        # recorded for failed calls too, so slow-then-raising calls show up
+        SUBSTRINGS_CHECKED.observe(num_checked)
+        SUBSTRINGS_ACCEPTED.observe(len(rebus_substrings))
+        stage_seconds.observe()
+        STAGE_LATENCY.observe(time.perf_counter() - start_time, stage="find_substrings")
 
 
 def get_parent_word(start_idx: int, end_idx: int, candidate: str) -> str:
@@ -123,17 +207,7 @@ def get_parent_word(start_idx: int, end_idx: int, candidate: str) -> str:
         - If start_idx=3, end_idx=8 (pointing to "lowor" in alpha_only), Returns ""
           since the substring spans multiple words
     """
-    words = candidate.split()
-    current_idx = 0
-
-    for word in words:
-        word_length = len(word)
-        if current_idx <= start_idx <= end_idx <= current_idx + word_length:
-            return word
-        current_idx += word_length
-        continue  # to the next word
-
-    return ""  # Substring spans multiple words
+    return cached_layout(candidate).parent_word(start_idx, end_idx)
 
 
 if __name__ == "__main__":
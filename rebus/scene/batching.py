@@ -0,0 +1,82 @@
+"""
+Node classes that let one sampler call generate several scene jobs at once.
+
+ComfyUI samples a whole latent batch with one noise seed and one conditioning.
+These nodes build per-item versions of both:
+- `RebusBatchNoise` draws each item's noise from its own seed, exactly as a
+  batch-of-one run with that seed would, so results do not depend on batching
+- `RebusBatchConditioning` stacks the jobs' conditionings along the batch
+  dimension. ComfyUI applies a conditioning whose batch size matches the latent
+  per item. The jobs must share the same area layout (see `jobs.batch_key`)
+
+They follow ComfyUI's node conventions (methods return tuples) and are merged into
+the worker's node mappings, so the dry-run backend can replace them with stubs.
+"""
+
+
+class IncompatibleBatchError(ValueError):
+    """The conditionings cannot be stacked into one batch (e.g. token lengths differ)"""
+
+
+class BatchedRandomNoise:
+    """Per-item seeded noise, with the interface SamplerCustomAdvanced expects"""
+
+    def __init__(self, seeds: list[int]):
+        self.seeds = list(seeds)
+        self.seed = self.seeds[0]
+
+    def generate_noise(self, input_latent):
+        import comfy.sample
+        import torch
+
+        latent_image = input_latent["samples"]
+        if latent_image.shape[0] != len(self.seeds):
+            raise ValueError(
+                f"Latent batch of {latent_image.shape[0]} for {len(self.seeds)} seeds"
+            )
+        return torch.cat(
+            [
+                comfy.sample.prepare_noise(latent_image[i : i + 1], seed)
+                for i, seed in enumerate(self.seeds)
+            ]
+        )
+
+
+class RebusBatchNoise:
+    def batch(self, noise_seeds: list[int]):
+        return (BatchedRandomNoise(noise_seeds),)
+
+
+class RebusBatchConditioning:
+    def batch(self, conditionings: list[list]):
+        """
+        Stacks per-job conditionings (each a list of [tensor, options] entries, as
+        returned by MultiAreaConditioning) into one batched conditioning
+        """
+        import torch
+
+        num_entries = {len(conditioning) for conditioning in conditionings}
+        if len(num_entries) != 1:
+            raise IncompatibleBatchError("Conditionings have different entry counts")
+
+        batched = []
+        for entries in zip(*conditionings):
+            tensors = [tensor for tensor, _ in entries]
+            if len({tuple(tensor.shape) for tensor in tensors}) != 1:
+                raise IncompatibleBatchError("Conditioning shapes differ")
+            options = dict(entries[0][1])
+            pooled = [
+                entry_options.get("pooled_output") for _, entry_options in entries
+            ]
+            if pooled[0] is not None:
+                if len({tuple(p.shape) for p in pooled}) != 1:
+                    raise IncompatibleBatchError("Pooled output shapes differ")
+                options["pooled_output"] = torch.cat(pooled)
+            batched.append([torch.cat(tensors), options])
+        return (batched,)
+
+
+REBUS_NODE_CLASS_MAPPINGS = {
+    "RebusBatchNoise": RebusBatchNoise,
+    "RebusBatchConditioning": RebusBatchConditioning,
+}
@@ -0,0 +1,298 @@
+"""
+Async client for a ComfyUI server's HTTP API.
+
+Requests go over a small pool of keep-alive connections (stdlib `http.client`, run
+in worker threads), with at most `max_connections` in flight. Job progress is
+tracked by polling the server's queue and history endpoints.
+
+Example:
+    async with ComfyClient("http://127.0.0.1:8188") as client:
+        result = await client.generate(scene_job_for_puzzle(puzzle, seed=42))
+"""
+
+import asyncio
+import http.client
+import json
+import logging
+import queue
+import time
+import urllib.parse
+from collections.abc import Callable
+from uuid import uuid4
+
+from rebus import metrics, tracing
+from rebus.scene.jobs import SceneJob, SceneResult
+from rebus.scene.workflow import build_workflow
+
+logger = logging.getLogger(__name__)
+
+COMFY_REQUESTS = metrics.counter(
+    "rebus_comfy_requests_total",
+    "HTTP requests made to ComfyUI servers, by endpoint and status",
+    ("endpoint", "status"),
+)
+COMFY_JOB_SECONDS = metrics.histogram(
+    "rebus_comfy_job_seconds", "Time from submitting a scene job to its images"
+)
+
+
+class ComfyError(RuntimeError):
+    """The ComfyUI server rejected a request or failed to run a job"""
+
+
+class ComfyUnavailableError(ComfyError):
+    """The ComfyUI server could not be reached or answered with a server error"""
+
+
+class ComfyConnectionError(ComfyUnavailableError):
+    """
+    The connection failed mid-request (e.g. timed out or was reset), so the server
+    may or may not have acted on the request
+    """
+
+
+class ComfyPromptLostError(ComfyUnavailableError):
+    """The server no longer knows a submitted prompt, e.g. because it restarted"""
+
+
+class ComfyTimeoutError(ComfyError):
+    """A prompt did not finish before its deadline"""
+
+
+class ComfyClient:
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = 4,
+        timeout: float = 60.0,
+        poll_interval: float = 0.5,
+        job_timeout: float | None = None,
+    ):
+        """
+        Args:
+            base_url: e.g. "http://127.0.0.1:8188"
+            max_connections: size of the connection pool / max requests in flight
+            timeout: per-request socket timeout, in seconds
+            poll_interval: how often to poll for job progress, in seconds
+            job_timeout: max seconds `generate` waits for a prompt to finish;
+                unbounded if None
+        """
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported ComfyUI URL {base_url!r}")
+        self.base_url = base_url.rstrip("/")
+        self._url = url
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.client_id = uuid4().hex
+        self._connections: queue.LifoQueue = queue.LifoQueue()
+        self._slots = asyncio.Semaphore(max_connections)
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        cls = (
+            http.client.HTTPSConnection
+            if self._url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        return cls(self._url.hostname, self._url.port, timeout=self.timeout)
+
+    def _request_sync(
+        self, method: str, path: str, body: bytes | None
+    ) -> tuple[int, bytes]:
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            connection = self._new_connection()
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            connection.request(
+                method, self._url.path + path, body=body, headers=headers
+            )
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()  # do not return a broken connection to the pool
+            raise
+        self._connections.put(connection)
+        return response.status, data
+
+    async def _request(
+        self, method: str, path: str, payload: dict | None = None
+    ) -> bytes:
+        endpoint = path.split("?")[0].split("/")[1]
+        body = json.dumps(payload).encode() if payload is not None else None
+        async with self._slots:
+            try:
+                status, data = await asyncio.to_thread(
+                    self._request_sync, method, path, body
+                )
+            except (OSError, http.client.HTTPException) as e:
+                COMFY_REQUESTS.inc(endpoint=endpoint, status="error")
+                # a refused connection never got the request to the server
+                error = (
+                    ComfyUnavailableError
+                    if isinstance(e, ConnectionRefusedError)
+                    else ComfyConnectionError
+                )
+                raise error(f"{method} {self.base_url}{path} failed: {e}") from e
+        COMFY_REQUESTS.inc(endpoint=endpoint, status=status)
+        if status != 200:
+            error = ComfyUnavailableError if status >= 500 else ComfyError
+            raise error(
+                f"{method} {self.base_url}{path} returned {status}: {data[:500]!r}"
+            )
+        return data
+
+    async def _get_json(self, path: str) -> dict:
+        return json.loads(await self._request("GET", path))
+
+    async def system_stats(self) -> dict:
+        return await self._get_json("/system_stats")
+
+    async def queue_remaining(self) -> int:
+        info = await self._get_json("/prompt")
+        return info["exec_info"]["queue_remaining"]
+
+    async def submit_graph(
+        self,
+        graph: dict,
+        extra_pnginfo: dict | None = None,
+        prompt_id: str | None = None,
+    ) -> str:
+        """
+        Queues a workflow graph, returning its prompt id. Passing a `prompt_id`
+        lets the caller look the prompt up even if the response never arrives.
+        """
+        payload = {"prompt": graph, "client_id": self.client_id}
+        if prompt_id is not None:
+            payload["prompt_id"] = prompt_id
+        if extra_pnginfo is not None:
+            payload["extra_data"] = {"extra_pnginfo": extra_pnginfo}
+        response = json.loads(await self._request("POST", "/prompt", payload))
+        if response.get("node_errors"):
+            raise ComfyError(f"Workflow rejected: {response['node_errors']}")
+        return response["prompt_id"]
+
+    async def _history_entry(self, prompt_id: str) -> dict | None:
+        history = await self._get_json(f"/history/{prompt_id}")
+        if prompt_id not in history:
+            return None
+        entry = history[prompt_id]
+        status = entry.get("status", {})
+        if status.get("status_str") == "error" or not status.get("completed", True):
+            raise ComfyError(f"Prompt {prompt_id} failed: {status}")
+        return entry
+
+    async def wait(
+        self,
+        prompt_id: str,
+        on_progress: Callable[[str, str], None] | None = None,
+        timeout: float | None = None,
+    ) -> dict:
+        """
+        Polls until the prompt has finished and returns its history entry.
+        `on_progress(prompt_id, status)` is called whenever the status changes
+        ("queued", "running", "success").
+
+        Raises `ComfyPromptLostError` if the server no longer knows the prompt
+        (e.g. it restarted), and `ComfyTimeoutError` if it has not finished
+        within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        last_status = None
+        while True:
+            entry = await self._history_entry(prompt_id)
+            if entry is None:
+                current = await self._get_json("/queue")
+                if any(item[1] == prompt_id for item in current["queue_running"]):
+                    status = "running"
+                elif any(item[1] == prompt_id for item in current["queue_pending"]):
+                    status = "queued"
+                else:
+                    # it may have finished between the two requests
+                    entry = await self._history_entry(prompt_id)
+                    if entry is None:
+                        raise ComfyPromptLostError(
+                            f"{self.base_url} lost prompt {prompt_id}"
+                        )
+            if entry is not None:
+                if on_progress is not None:
+                    on_progress(prompt_id, "success")
+                return entry
+
+            if status != last_status:
+                last_status = status
+                if on_progress is not None:
+                    on_progress(prompt_id, status)
+            if deadline is not None and time.monotonic() >= deadline:
+                raise ComfyTimeoutError(
+                    f"Prompt {prompt_id} on {self.base_url} did not finish "
+                    f"within {timeout}s"
+                )
+            await asyncio.sleep(self.poll_interval)
+
+    async def fetch_image(self, filename: str, subfolder: str, type: str) -> bytes:
+        query = urllib.parse.urlencode(
+            {"filename": filename, "subfolder": subfolder, "type": type}
+        )
+        return await self._request("GET", f"/view?{query}")
+
+    async def generate(
+        self,
+        job: SceneJob,
+        on_progress: Callable[[str, str], None] | None = None,
+    ) -> SceneResult:
+        """Runs `job` on the server and downloads its images"""
+        start = time.perf_counter()
+        with tracing.span("comfy_generate", job_id=job.job_id, server=self.base_url):
+            prompt_id = await self.submit_job(job)
+            return await self.collect(job, prompt_id, on_progress, start)
+
+    async def submit_job(self, job: SceneJob, prompt_id: str | None = None) -> str:
+        """Queues `job`'s workflow, returning its prompt id for `collect`"""
+        graph, extra_pnginfo = build_workflow(job)
+        prompt_id = await self.submit_graph(graph, extra_pnginfo, prompt_id)
+        logger.debug("Submitted job %s as prompt %s", job.job_id, prompt_id)
+        return prompt_id
+
+    async def collect(
+        self,
+        job: SceneJob,
+        prompt_id: str,
+        on_progress: Callable[[str, str], None] | None = None,
+        submitted_at: float | None = None,
+    ) -> SceneResult:
+        """
+        Waits for a prompt from `submit_job` to finish and downloads its images.
+        Safe to call again for the same prompt after it raised.
+
+        Args:
+            submitted_at: `time.perf_counter()` before the prompt was submitted; if
+                given, the time since is recorded as the job's latency
+        """
+        entry = await self.wait(prompt_id, on_progress, self.job_timeout)
+        images = []
+        for output in entry["outputs"].values():
+            for image in output.get("images", []):
+                images.append(
+                    await self.fetch_image(
+                        image["filename"], image["subfolder"], image["type"]
+                    )
+                )
+        if submitted_at is not None:
+            COMFY_JOB_SECONDS.observe(time.perf_counter() - submitted_at)
+        return SceneResult(job=job, images=images)
+
+    def close(self):
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                return
+
+    async def __aenter__(self) -> "ComfyClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,138 @@
+"""
+Content-addressed cache for CLIPTextEncodeFlux conditioning.
+
+Area prompts for common visual words ("a gar (fish)", "a den (cave)") recur across
+thousands of puzzles, and every T5-XXL encode of them gives the same result. The
+cache keys encodings by (clip model, clip_l text, t5xxl text, guidance) and keeps
+them in two tiers: an in-memory LRU, and optionally one tensor file per entry on
+disk, which survives restarts and can be shared between workers.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from rebus import metrics
+from rebus.files import atomic_path
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = metrics.counter(
+    "rebus_conditioning_cache_total",
+    "Conditioning cache lookups, by the tier that served them (memory/disk/miss)",
+    ("tier",),
+)
+
+
+class UnreadableEntryError(Exception):
+    """A cache entry file is truncated or corrupt"""
+
+
+# what a truncated or corrupt entry file raises on load; anything else is a bug
+UNREADABLE_ENTRY_ERRORS = (
+    OSError,
+    EOFError,
+    pickle.UnpicklingError,
+    UnreadableEntryError,
+)
+
+
+def _torch_save(obj, path: str):
+    import torch
+
+    torch.save(obj, path)
+
+
+def _torch_load(path: str):
+    import torch
+
+    try:
+        return torch.load(path, weights_only=True)
+    except RuntimeError as e:
+        # e.g. "PytorchStreamReader failed reading zip archive" for a cut-off file
+        raise UnreadableEntryError(f"{path}: {e}") from e
+
+
+def conditioning_key(
+    clip_model: tuple[str, ...], clip_l: str, t5xxl: str, guidance: float
+) -> str:
+    """Stable content hash identifying one conditioning encode"""
+    payload = json.dumps([list(clip_model), clip_l, t5xxl, float(guidance)])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ConditioningCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        cache_dir: str | None = None,
+        save: Callable[[Any, str], None] = _torch_save,
+        load: Callable[[str], Any] = _torch_load,
+    ):
+        """
+        Args:
+            max_entries: size of the in-memory LRU tier
+            cache_dir: directory for the disk tier; memory only if None
+            save, load: (de)serialize one conditioning to/from a file; `load`
+                raises one of `UNREADABLE_ENTRY_ERRORS` for a corrupt file
+        """
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._save = save
+        self._load = load
+        self._memory: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pt")
+
+    def _remember(self, key: str, value: Any):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                CACHE_LOOKUPS.inc(tier="memory")
+                return self._memory[key]
+
+        if self.cache_dir is not None:
+            path = self._path(key)
+            if os.path.exists(path):
+                try:
+                    value = self._load(path)
+                except UNREADABLE_ENTRY_ERRORS as error:
+                    logger.warning(
+                        "Dropping unreadable cache entry %s: %r", path, error
+                    )
+                else:
+                    self._remember(key, value)
+                    CACHE_LOOKUPS.inc(tier="disk")
+                    return value
+
+        CACHE_LOOKUPS.inc(tier="miss")
+        return None
+
+    def put(self, key: str, value: Any):
+        self._remember(key, value)
+        if self.cache_dir is not None:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_path(path) as tmp_path:
+                self._save(value, tmp_path)
+
+    def get_or_encode(self, key: str, encode: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = encode()
+            self.put(key, value)
+        return value
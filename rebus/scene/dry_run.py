@@ -0,0 +1,168 @@
+"""
+Stubbed ComfyUI nodes for exercising the scene worker on CPU, without ComfyUI, torch
+or model weights.
+
+The stubs mirror the signatures and return shapes of the real nodes. Decoded
+"images" are dicts describing what would have been generated (prompts, seed,
+resolution, steps), so tests can check that each result belongs to its job.
+Class-level `calls` counters record how often each node method ran.
+
+Example:
+    worker = SceneWorker(DRY_RUN_NODE_CLASS_MAPPINGS, encode_image=encode_dry_run_image)
+"""
+
+import json
+from collections import Counter
+
+
+class _StubNode:
+    calls: Counter = Counter()
+
+    @classmethod
+    def _record(cls, method: str):
+        _StubNode.calls[f"{cls.__name__}.{method}"] += 1
+
+
+class DualCLIPLoader(_StubNode):
+    def load_clip(self, clip_name1, clip_name2, type):
+        self._record("load_clip")
+        return ({"clip": (clip_name1, clip_name2, type)},)
+
+
+class UNETLoader(_StubNode):
+    def load_unet(self, unet_name, weight_dtype):
+        self._record("load_unet")
+        return ({"unet": unet_name},)
+
+
+class VAELoader(_StubNode):
+    def load_vae(self, vae_name):
+        self._record("load_vae")
+        return ({"vae": vae_name},)
+
+
+class CLIPTextEncodeFlux(_StubNode):
+    def encode(self, clip, clip_l, t5xxl, guidance):
+        self._record("encode")
+        return ([[{"text": t5xxl}, {"pooled_output": clip_l, "guidance": guidance}]],)
+
+
+class MultiAreaConditioning(_StubNode):
+    def doStuff(self, extra_pnginfo, unique_id, **conditionings):
+        self._record("doStuff")
+        (node,) = [
+            node
+            for node in extra_pnginfo["workflow"]["nodes"]
+            if node["id"] == int(unique_id)
+        ]
+        properties = node["properties"]
+        return (
+            [
+                [conditioning[0][0], {**conditioning[0][1], "area": area}]
+                for conditioning, area in zip(
+                    conditionings.values(), properties["values"]
+                )
+            ],
+            properties["width"],
+            properties["height"],
+        )
+
+
+class EmptyLatentImage(_StubNode):
+    def generate(self, width, height, batch_size=1):
+        self._record("generate")
+        return ({"width": width, "height": height, "batch_size": batch_size},)
+
+
+class RandomNoise(_StubNode):
+    def get_noise(self, noise_seed):
+        self._record("get_noise")
+        return ({"seeds": [noise_seed]},)
+
+
+class RebusBatchNoise(_StubNode):
+    def batch(self, noise_seeds):
+        self._record("batch")
+        return ({"seeds": list(noise_seeds)},)
+
+
+class RebusBatchConditioning(_StubNode):
+    def batch(self, conditionings):
+        self._record("batch")
+        return (
+            [
+                [{"texts": [entry[0]["text"] for entry in entries]}, entries[0][1]]
+                for entries in zip(*conditionings)
+            ],
+        )
+
+
+class KSamplerSelect(_StubNode):
+    def get_sampler(self, sampler_name):
+        self._record("get_sampler")
+        return ({"sampler": sampler_name},)
+
+
+class BasicGuider(_StubNode):
+    def get_guider(self, model, conditioning):
+        self._record("get_guider")
+        return ({"model": model, "conditioning": conditioning},)
+
+
+class BasicScheduler(_StubNode):
+    def get_sigmas(self, model, scheduler, steps, denoise):
+        self._record("get_sigmas")
+        return ({"scheduler": scheduler, "steps": steps},)
+
+
+class SamplerCustomAdvanced(_StubNode):
+    def sample(self, noise, guider, sampler, sigmas, latent_image):
+        self._record("sample")
+        conditioning = guider["conditioning"]
+        samples = [
+            {
+                "prompts": [
+                    cond[0]["texts"][i] if "texts" in cond[0] else cond[0]["text"]
+                    for cond in conditioning
+                ],
+                "seed": seed,
+                "width": latent_image["width"],
+                "height": latent_image["height"],
+                "steps": sigmas["steps"],
+            }
+            for i, seed in enumerate(noise["seeds"])
+        ]
+        if len(samples) != latent_image["batch_size"]:
+            raise ValueError("Noise and latent batch sizes differ")
+        return (samples, samples)
+
+
+class VAEDecode(_StubNode):
+    def decode(self, vae, samples):
+        self._record("decode")
+        return (list(samples),)
+
+
+DRY_RUN_NODE_CLASS_MAPPINGS = {
+    cls.__name__: cls
+    for cls in (
+        DualCLIPLoader,
+        UNETLoader,
+        VAELoader,
+        CLIPTextEncodeFlux,
+        MultiAreaConditioning,
+        EmptyLatentImage,
+        RandomNoise,
+        RebusBatchNoise,
+        RebusBatchConditioning,
+        KSamplerSelect,
+        BasicGuider,
+        BasicScheduler,
+        SamplerCustomAdvanced,
+        VAEDecode,
+    )
+}
+
+
+def encode_dry_run_image(image: dict) -> bytes:
+    return json.dumps(image, sort_keys=True).encode()
@@ -10,11 +10,14 @@ import os
 import random
 import sys
 import json
+import logging
 import argparse
 import contextlib
 from typing import Sequence, Mapping, Any, Union
 import torch
 
+logger = logging.getLogger(__name__)
+
 
 def get_value_at_index(obj: Union[Sequence, Mapping], index: int) -> Any:
     """Returns the value at the given index of a sequence or mapping.
@@ -69,11 +72,11 @@ def find_path(name: str, path: str = None) -> str:
     return find_path(name, parent_directory)
 
 
-def add_comfyui_directory_to_sys_path() -> None:
+def add_comfyui_directory_to_sys_path(path: str = None) -> None:
     """
-    Add 'ComfyUI' to the sys.path
+    Add 'ComfyUI' to the sys.path, searching upwards from `path` (see `find_path`)
     """
-    comfyui_path = find_path("ComfyUI")
+    comfyui_path = find_path("ComfyUI", path)
     if comfyui_path is not None and os.path.isdir(comfyui_path):
         sys.path.append(comfyui_path)
         import __main__
@@ -121,18 +124,47 @@ def import_custom_nodes() -> None:
     init_extra_nodes(init_custom_nodes=True)
 
 
+_image_writers = {}
+
+
+def get_image_writer(directory: str):
+    """One background `ImageWriter` per output directory, flushed at exit"""
+    if directory not in _image_writers:
+        import atexit
+
+        from rebus.scene.image_writer import ImageEncoder, ImageWriter
+
+        writer = ImageWriter(
+            directory,
+            ImageEncoder(args.image_format, compress_level=args.compress_level),
+            naming=args.naming,
+            max_pending=args.max_pending_images,
+        )
+        atexit.register(writer.close)
+        _image_writers[directory] = writer
+    return _image_writers[directory]
+
+
+def close_image_writers() -> None:
+    while _image_writers:
+        _, writer = _image_writers.popitem()
+        writer.close()
+
+
+def _log_saved_image(future):
+    if (error := future.exception()) is not None:
+        logger.error("Failed to save image: %r", error)
+    else:
+        logger.info("Saved image to %s", future.result())
+
+
 def save_image_wrapper(context, cls):
     if args.output is None:
         return cls
 
-    from PIL import Image, ImageOps, ImageSequence
-    from PIL.PngImagePlugin import PngInfo
-
-    import numpy as np
+    from rebus.scene.image_writer import ImageEncoder
 
     class WrappedSaveImage(cls):
-        counter = 0
-
         def save_images(
             self, images, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None
         ):
@@ -145,80 +177,68 @@ def save_image_wrapper(context, cls):
                     raise ValueError("Cannot save multiple images to stdout")
                 filename_prefix += self.prefix_append
 
+                metadata = None
+                if not args.disable_metadata:
+                    metadata = {}
+                    if prompt is not None:
+                        metadata["prompt"] = prompt
+                    if extra_pnginfo is not None:
+                        metadata.update(extra_pnginfo)
+
+                if args.output == "-":
+                    encode = ImageEncoder(
+                        args.image_format, compress_level=args.compress_level
+                    )
+                    data = encode(images[0], metadata)
+                    # Hack to briefly restore stdout
+                    if context is not None:
+                        context.__exit__(None, None, None)
+                    try:
+                        sys.stdout.buffer.write(data)
+                    finally:
+                        if context is not None:
+                            context.__enter__()
+                    return {"ui": {"images": []}}
+
+                # Images are encoded and written in the background; the sampler
+                # never waits for them. Counter names are reserved up front, so
+                # ComfyUI's history can list them right away. Hash names depend on
+                # the encoded bytes, so those images are only logged once written.
                 results = list()
                 for batch_number, image in enumerate(images):
-                    i = 255.0 * image.cpu().numpy()
-                    img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-                    metadata = None
-                    if not args.disable_metadata:
-                        metadata = PngInfo()
-                        if prompt is not None:
-                            metadata.add_text("prompt", json.dumps(prompt))
-                        if extra_pnginfo is not None:
-                            for x in extra_pnginfo:
-                                metadata.add_text(x, json.dumps(extra_pnginfo[x]))
-
-                    if args.output == "-":
-                        # Hack to briefly restore stdout
-                        if context is not None:
-                            context.__exit__(None, None, None)
-                        try:
-                            img.save(
-                                sys.stdout.buffer,
-                                format="png",
-                                pnginfo=metadata,
-                                compress_level=self.compress_level,
-                            )
-                        finally:
-                            if context is not None:
-                                context.__enter__()
+                    filename = None
+                    if os.path.isdir(args.output):
+                        subfolder = args.output
+                        prefix = filename_prefix
+                        if len(images) == 1:
+                            filename = f"output.{args.image_format}"
                     else:
-                        subfolder = ""
+                        subfolder, prefix = os.path.split(args.output)
+                        if subfolder == "":
+                            subfolder = os.getcwd()
                         if len(images) == 1:
-                            if os.path.isdir(args.output):
-                                subfolder = args.output
-                                file = "output.png"
-                            else:
-                                subfolder, file = os.path.split(args.output)
-                                if subfolder == "":
-                                    subfolder = os.getcwd()
-                        else:
-                            if os.path.isdir(args.output):
-                                subfolder = args.output
-                                file = filename_prefix
-                            else:
-                                subfolder, file = os.path.split(args.output)
-
-                            if subfolder == "":
-                                subfolder = os.getcwd()
-
-                            files = os.listdir(subfolder)
-                            file_pattern = file
-                            while True:
-                                filename_with_batch_num = file_pattern.replace(
-                                    "%batch_num%", str(batch_number)
-                                )
-                                file = (
-                                    f"{filename_with_batch_num}_{self.counter:05}.png"
-                                )
-                                self.counter += 1
-
-                                if file not in files:
-                                    break
-
-                        img.save(
-                            os.path.join(subfolder, file),
-                            pnginfo=metadata,
-                            compress_level=self.compress_level,
-                        )
-                        print("Saved image to", os.path.join(subfolder, file))
-                        results.append(
-                            {
-                                "filename": file,
-                                "subfolder": subfolder,
-                                "type": self.type,
-                            }
-                        )
+                            filename = prefix
+
+                    writer = get_image_writer(subfolder)
+                    if filename is None:
+                        filename = writer.reserve_filename(prefix, batch_number)
+                    future = writer.submit(
+                        image.detach(),
+                        metadata,
+                        filename=filename,
+                        prefix=prefix,
+                        batch_number=batch_number,
+                    )
+                    future.add_done_callback(_log_saved_image)
+                    if filename is None:
+                        continue
+                    results.append(
+                        {
+                            "filename": filename,
+                            "subfolder": subfolder,
+                            "type": self.type,
+                        }
+                    )
 
                 return {"ui": {"images": results}}
 
@@ -267,6 +287,41 @@ parser.add_argument(
     help="Disables writing workflow metadata to the outputs",
 )
 
+parser.add_argument(
+    "--seed",
+    type=int,
+    default=None,
+    help="Noise seed of the first image; each further queued image adds 1 (default: random, printed)",
+)
+
+parser.add_argument(
+    "--image-format",
+    choices=["png", "webp"],
+    default="png",
+    help="Output image format; WebP is always lossless (default: png)",
+)
+
+parser.add_argument(
+    "--compress-level",
+    type=int,
+    default=4,
+    help="PNG compression level, 0 (fastest) to 9 (smallest) (default: 4)",
+)
+
+parser.add_argument(
+    "--naming",
+    choices=["counter", "hash"],
+    default="counter",
+    help="Name output files by a counter or a hash of their contents (default: counter)",
+)
+
+parser.add_argument(
+    "--max-pending-images",
+    type=int,
+    default=16,
+    help="Images queued for writing before generation waits on disk (default: 16)",
+)
+
 
 comfy_args = [sys.argv[0]]
 if __name__ == "__main__" and "--" in sys.argv:
@@ -319,7 +374,17 @@ def main(*func_args, **func_kwargs):
     else:
         defaults = dict(
             (arg, parser.get_default(arg))
-            for arg in ["queue_size", "comfyui_directory", "output", "disable_metadata"]
+            for arg in [
+                "queue_size",
+                "comfyui_directory",
+                "output",
+                "disable_metadata",
+                "image_format",
+                "compress_level",
+                "naming",
+                "max_pending_images",
+                "seed",
+            ]
         )
         ordered_args = dict(zip([], func_args))
 
@@ -391,8 +456,10 @@ def main(*func_args, **func_kwargs):
             width=1024, height=512, batch_size=1
         )
 
+        # explicit and printed, so that any generated scene can be reproduced
+        seed = args.seed if args.seed is not None else random.randint(0, 2**64 - 1)
+        print("Seed:", seed)
         randomnoise = NODE_CLASS_MAPPINGS["RandomNoise"]()
-        randomnoise_11 = randomnoise.get_noise(noise_seed=random.randint(1, 2**64))
 
         ksamplerselect = NODE_CLASS_MAPPINGS["KSamplerSelect"]()
         ksamplerselect_12 = ksamplerselect.get_sampler(sampler_name="dpmpp_2m")
@@ -406,10 +473,11 @@ def main(*func_args, **func_kwargs):
         samplercustomadvanced = NODE_CLASS_MAPPINGS["SamplerCustomAdvanced"]()
         vaedecode = NODE_CLASS_MAPPINGS["VAEDecode"]()
         for q in range(args.queue_size):
+            randomnoise_11 = randomnoise.get_noise(noise_seed=(seed + q) % 2**64)
             multiareaconditioning_2 = multiareaconditioning.doStuff(
                 resolutionX=1024,
                 resolutionY=512,
-                MultiAreaConditioning - Canvas=None,
+                **{"MultiAreaConditioning - Canvas": None},
                 index=0,
                 x=0,
                 y=0,
@@ -447,6 +515,9 @@ def main(*func_args, **func_kwargs):
                 vae=get_value_at_index(vaeloader_15, 0),
             )
 
+    close_image_writers()
+
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
@@ -0,0 +1,233 @@
+"""
+Background image encoding and writing.
+
+Encoding a 1024x512 PNG takes longer than many of the steps around it, and writing
+it can stall on a slow disk. `ImageWriter` moves both onto a small thread pool, so
+the sampler only waits when `max_pending` images are already queued.
+
+File names come from a counter per prefix (seeded by one scan of the output
+directory the first time the prefix is used) or from a hash of the encoded image,
+never from listing the directory per image. Files are written under a temporary
+name and renamed into place, so readers never see partial images.
+
+Example:
+    with ImageWriter("scenes/", ImageEncoder("webp")) as writer:
+        future = writer.submit(image, metadata={"prompt": graph})
+    print(future.result())
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from rebus import metrics
+from rebus.files import atomic_path
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WRITE_SECONDS = metrics.histogram(
+    "rebus_image_write_seconds", "Time to encode and write one image"
+)
+IMAGE_SUBMIT_WAIT_SECONDS = metrics.histogram(
+    "rebus_image_submit_wait_seconds",
+    "Time callers spent blocked because the image writer queue was full",
+)
+
+NAMINGS = ("counter", "hash")
+
+
+@dataclass(frozen=True)
+class ImageEncoder:
+    """
+    Encodes decoded images ([H, W, C] tensors or arrays, values in 0-1) with PIL.
+
+    Args:
+        format: "png" or "webp" (always lossless)
+        compress_level: PNG zlib level, 0 (fastest) to 9 (smallest)
+        webp_method: WebP effort, 0 (fastest) to 6 (smallest)
+    """
+
+    format: str = "png"
+    compress_level: int = 4
+    webp_method: int = 4
+
+    def __post_init__(self):
+        if self.format not in ("png", "webp"):
+            raise ValueError(f"Unsupported image format {self.format!r}")
+
+    @property
+    def extension(self) -> str:
+        return self.format
+
+    @property
+    def embeds_metadata(self) -> bool:
+        """PNG keeps metadata in text chunks; WebP gets a JSON sidecar file instead"""
+        return self.format == "png"
+
+    def __call__(self, image, metadata: dict | None = None) -> bytes:
+        import numpy as np
+        from PIL import Image
+
+        if hasattr(image, "cpu"):
+            image = image.cpu().numpy()
+        img = Image.fromarray(np.clip(255.0 * image, 0, 255).astype(np.uint8))
+        buffer = io.BytesIO()
+        if self.format == "png":
+            pnginfo = None
+            if metadata:
+                from PIL.PngImagePlugin import PngInfo
+
+                pnginfo = PngInfo()
+                for key, value in metadata.items():
+                    pnginfo.add_text(key, json.dumps(value))
+            img.save(
+                buffer,
+                format="png",
+                pnginfo=pnginfo,
+                compress_level=self.compress_level,
+            )
+        else:
+            img.save(buffer, format="webp", lossless=True, method=self.webp_method)
+        return buffer.getvalue()
+
+
+def _write_atomic(path: str, data: bytes):
+    with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(data)
+
+
+class ImageWriter:
+    def __init__(
+        self,
+        directory: str,
+        encode: Callable[[Any, dict | None], bytes] = ImageEncoder(),
+        naming: str = "counter",
+        prefix: str = "rebus",
+        max_pending: int = 16,
+        num_threads: int = 2,
+    ):
+        """
+        Args:
+            directory: where images are written; created if missing
+            encode: turns (image, metadata) into file bytes. Its `extension` and
+                `embeds_metadata` attributes are used when present
+            naming: "counter" for <prefix>_00042.<ext>, "hash" for
+                <prefix>_<sha256 of the file bytes>.<ext>
+            prefix: default file name prefix; "%batch_num%" is replaced by the
+                image's batch number
+            max_pending: images queued or in progress before `submit` blocks
+            num_threads: encoding threads
+        """
+        if naming not in NAMINGS:
+            raise ValueError(f"naming must be one of {NAMINGS}, got {naming!r}")
+        self.directory = directory
+        self.encode = encode
+        self.extension = getattr(encode, "extension", "png")
+        self.embeds_metadata = getattr(encode, "embeds_metadata", True)
+        self.naming = naming
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+        self._counters: dict[str, itertools.count] = {}  # prefix -> next numbers
+        self._counter_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(
+            num_threads, thread_name_prefix="image-writer"
+        )
+
+    def _first_free_number(self, prefix: str) -> int:
+        """One past the highest counter already used with `prefix` in the directory"""
+        pattern = re.compile(rf"{re.escape(prefix)}_(\d+)\.{re.escape(self.extension)}")
+        numbers = [
+            int(match.group(1))
+            for name in os.listdir(self.directory)
+            if (match := pattern.fullmatch(name))
+        ]
+        return max(numbers, default=-1) + 1
+
+    def _next_number(self, prefix: str) -> int:
+        with self._counter_lock:
+            counter = self._counters.get(prefix)
+            if counter is None:
+                counter = itertools.count(self._first_free_number(prefix))
+                self._counters[prefix] = counter
+            return next(counter)
+
+    def reserve_filename(
+        self, prefix: str | None = None, batch_number: int = 0
+    ) -> str | None:
+        """
+        The next file name for an image submitted with `prefix`, known before it is
+        written; None with "hash" naming, where the name depends on the file bytes
+        """
+        if self.naming != "counter":
+            return None
+        prefix = (prefix or self.prefix).replace("%batch_num%", str(batch_number))
+        # numbered at submission, so names follow generation order
+        return f"{prefix}_{self._next_number(prefix):05}.{self.extension}"
+
+    def submit(
+        self,
+        image,
+        metadata: dict | None = None,
+        filename: str | None = None,
+        prefix: str | None = None,
+        batch_number: int = 0,
+    ) -> Future:
+        """
+        Queues `image` for encoding and writing; the future resolves to its path.
+        Blocks only while `max_pending` images are already queued.
+
+        Args:
+            metadata: JSON-serializable values, e.g. {"prompt": ..., "workflow": ...}
+            filename: exact file name to use instead of `naming`, e.g. from
+                `reserve_filename`
+            prefix: file name prefix instead of the writer's
+        """
+        start = time.perf_counter()
+        self._slots.acquire()
+        IMAGE_SUBMIT_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+        if filename is None:
+            filename = self.reserve_filename(prefix, batch_number)
+        prefix = (prefix or self.prefix).replace("%batch_num%", str(batch_number))
+        try:
+            future = self._executor.submit(
+                self._write, image, metadata, filename, prefix
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _write(self, image, metadata: dict | None, filename: str | None, prefix: str):
+        with IMAGE_WRITE_SECONDS.time():
+            data = self.encode(image, metadata if self.embeds_metadata else None)
+            if filename is None:
+                digest = hashlib.sha256(data).hexdigest()[:32]
+                filename = f"{prefix}_{digest}.{self.extension}"
+            path = os.path.join(self.directory, filename)
+            _write_atomic(path, data)
+            if metadata and not self.embeds_metadata:
+                _write_atomic(f"{path}.json", json.dumps(metadata).encode())
+        logger.debug("Saved image to %s", path)
+        return path
+
+    def close(self):
+        """Waits for queued images to be written"""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "ImageWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
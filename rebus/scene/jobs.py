@@ -0,0 +1,119 @@
+"""
+Scene generation jobs, shared by the in-process worker and the ComfyUI HTTP client.
+"""
+
+from dataclasses import asdict, dataclass, field
+from uuid import uuid4
+
+
+@dataclass(frozen=True)
+class SceneModels:
+    """The model files a scene is generated with (defaults match comfy_generation.json)"""
+
+    clip_name1: str = "clip_l.safetensors"
+    clip_name2: str = "t5xxl_fp16.safetensors"
+    clip_type: str = "flux"
+    unet_name: str = "flux1-dev.safetensors"
+    weight_dtype: str = "default"
+    vae_name: str = "flux_vae.safetensors"
+
+
+@dataclass
+class AreaPrompt:
+    """A prompt applied to a rectangular area of the scene, in pixels"""
+
+    prompt: str
+    x: int
+    y: int
+    width: int
+    height: int
+    strength: float = 1.0
+
+
+@dataclass
+class SceneJob:
+    prompt: str  # full-scene prompt
+    area_prompts: list[AreaPrompt]
+    seed: int
+    width: int = 1024
+    height: int = 512
+    steps: int = 20
+    guidance: float = 3.5
+    scene_strength: float = 1.2  # strength of the full-scene prompt
+    sampler_name: str = "dpmpp_2m"
+    scheduler: str = "simple"
+    models: SceneModels = field(default_factory=SceneModels)
+    job_id: str = field(default_factory=lambda: uuid4().hex)
+
+
+@dataclass
+class SceneResult:
+    job: SceneJob
+    images: list[bytes]  # encoded images, one per generated image
+    paths: list[str] = field(default_factory=list)  # set if written to disk
+
+
+def job_to_dict(job: SceneJob) -> dict:
+    return asdict(job)
+
+
+def job_from_dict(data: dict) -> SceneJob:
+    """Inverse of `job_to_dict`; `models` may be omitted for the defaults"""
+    data = dict(data)
+    data["area_prompts"] = [AreaPrompt(**area) for area in data["area_prompts"]]
+    if "models" in data:
+        data["models"] = SceneModels(**data["models"])
+    return SceneJob(**data)
+
+
+# node id of MultiAreaConditioning in comfy_generation.json; the node reads its area
+# layout from the workflow's node properties, looked up by this id
+MULTI_AREA_NODE_ID = 2
+
+
+def multi_area_properties(job: SceneJob) -> dict:
+    """
+    MultiAreaConditioning node properties for `job`: the full-scene prompt covers
+    the whole canvas, followed by one area per area prompt
+    """
+    return {
+        "Node name for S&R": "MultiAreaConditioning",
+        "width": job.width,
+        "height": job.height,
+        "values": [[0, 0, job.width, job.height, job.scene_strength]]
+        + [[a.x, a.y, a.width, a.height, a.strength] for a in job.area_prompts],
+    }
+
+
+def multi_area_extra_pnginfo(job: SceneJob) -> dict:
+    """The `extra_pnginfo` MultiAreaConditioning needs to find its area layout"""
+    return {
+        "workflow": {
+            "nodes": [
+                {
+                    "id": MULTI_AREA_NODE_ID,
+                    "type": "MultiAreaConditioning",
+                    "properties": multi_area_properties(job),
+                }
+            ]
+        }
+    }
+
+
+def batch_key(job: SceneJob) -> tuple:
+    """
+    Jobs with equal keys can be sampled together in one latent batch: they share
+    models, resolution, sampler settings and area layout, and differ only in
+    prompts and seed
+    """
+    return (
+        job.models,
+        job.width,
+        job.height,
+        job.steps,
+        job.sampler_name,
+        job.scheduler,
+        job.guidance,
+        job.scene_strength,
+        tuple((a.x, a.y, a.width, a.height, a.strength) for a in job.area_prompts),
+    )
@@ -0,0 +1,101 @@
+"""
+Content-addressed store of generated scenes.
+
+A scene is fully determined by its workflow graph: prompts, area layout, seed,
+model files, sampler settings and resolution. `scene_key` hashes exactly that, so a
+job that was generated before (by any worker, in any run) maps to the same key and
+its stored images are returned instead of sampling again.
+
+Layout: <directory>/<key[:2]>/<key>/ holds job.json (the job that generated the
+images, seed included) and image_00.<ext>, image_01.<ext>, ... Entries are written
+to a temporary directory and renamed into place, so a crashed run never leaves a
+partial entry behind.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from rebus import metrics
+from rebus.files import temporary_path
+from rebus.scene.jobs import SceneJob, SceneResult, job_from_dict, job_to_dict
+from rebus.scene.workflow import SAVE_NODE_ID, build_workflow
+
+logger = logging.getLogger(__name__)
+
+# bump when the generation pipeline changes in ways the graph does not capture
+SCENE_KEY_VERSION = 1
+
+OUTPUT_CACHE_LOOKUPS = metrics.counter(
+    "rebus_scene_output_cache_total",
+    "Scene output store lookups, by result (hit/miss)",
+    ("result",),
+)
+
+
+def scene_key(job: SceneJob) -> str:
+    """Hash of everything that determines the images `job` generates"""
+    graph, extra_pnginfo = build_workflow(job)
+    # the output file name is the only part of the graph that varies per job id
+    graph[SAVE_NODE_ID]["inputs"].pop("filename_prefix")
+    content = json.dumps(
+        [SCENE_KEY_VERSION, graph, extra_pnginfo], sort_keys=True, default=str
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class SceneOutputStore:
+    def __init__(self, directory: str, image_extension: str = "png"):
+        self.directory = directory
+        self.image_extension = image_extension
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, job: SceneJob) -> SceneResult | None:
+        """The stored result for `job`, or None if it was never generated"""
+        path = self._path(scene_key(job))
+        paths = sorted(glob.glob(os.path.join(path, f"image_*.{self.image_extension}")))
+        if not paths:
+            OUTPUT_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        OUTPUT_CACHE_LOOKUPS.inc(result="hit")
+        images = []
+        for image_path in paths:
+            with open(image_path, "rb") as f:
+                images.append(f.read())
+        return SceneResult(job=job, images=images, paths=paths)
+
+    def get_job(self, key: str) -> SceneJob | None:
+        """The job that generated the entry at `key`"""
+        try:
+            with open(os.path.join(self._path(key), "job.json")) as f:
+                return job_from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def put(self, result: SceneResult) -> SceneResult:
+        """Stores `result`, returning it with `paths` pointing into the store"""
+        path = self._path(scene_key(result.job))
+        tmp_path = temporary_path(path)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, "job.json"), "w") as f:
+            json.dump(job_to_dict(result.job), f, indent=2)
+        for i, image in enumerate(result.images):
+            name = f"image_{i:02}.{self.image_extension}"
+            with open(os.path.join(tmp_path, name), "wb") as f:
+                f.write(image)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # another worker stored the same scene first; keep theirs
+            shutil.rmtree(tmp_path)
+            logger.debug("Scene %s already stored", os.path.basename(path))
+        paths = [
+            os.path.join(path, f"image_{i:02}.{self.image_extension}")
+            for i in range(len(result.images))
+        ]
+        return SceneResult(job=result.job, images=result.images, paths=paths)
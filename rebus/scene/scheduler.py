@@ -0,0 +1,296 @@
+"""
+Dispatches scene jobs across several ComfyUI servers.
+
+Each job goes to the healthy backend with the fewest jobs in flight, except that
+jobs stay with a backend that already has their models loaded (the last model set
+it ran) unless that backend is more than `affinity_slack` jobs busier. Swapping Flux
+weights costs far more than waiting for one or two jobs.
+
+A backend that cannot be reached or answers with a server error is marked
+unhealthy. A job it refused (a server error, or a refused connection) is retried
+on another backend right away. A job it may have accepted keeps being polled
+there, and is only resubmitted elsewhere once the backend has lost it: it
+restarted and no longer knows the prompt, or it stayed unreachable for
+`lost_after` seconds. That includes submissions whose connection failed midway;
+prompt ids are chosen by the scheduler, so the backend can be asked whether the
+prompt arrived. Jobs the server rejects or fails to run
+(e.g. a node error) are not retried, since every backend would fail them the same
+way. Unhealthy backends get no new jobs until a health check (`GET /system_stats`,
+every `health_interval` seconds) succeeds again.
+
+Example:
+    async with SceneScheduler(["http://gpu1:8188", "http://gpu2:8188"]) as scheduler:
+        results = await scheduler.run(jobs)
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Callable, Iterable
+from uuid import uuid4
+
+from rebus import metrics
+from rebus.scene.comfy_client import (
+    ComfyClient,
+    ComfyConnectionError,
+    ComfyError,
+    ComfyPromptLostError,
+    ComfyUnavailableError,
+)
+from rebus.scene.jobs import SceneJob, SceneModels, SceneResult
+from rebus.scene.output_cache import SceneOutputStore
+
+logger = logging.getLogger(__name__)
+
+DISPATCHES = metrics.counter(
+    "rebus_scheduler_dispatch_total",
+    "Scene jobs dispatched, by backend and outcome (ok/unavailable/lost/error)",
+    ("backend", "outcome"),
+)
+HEALTH_CHECKS = metrics.counter(
+    "rebus_scheduler_health_checks_total",
+    "Backend health checks, by backend and result (healthy/unhealthy)",
+    ("backend", "result"),
+)
+
+
+class NoBackendError(ComfyError):
+    """No healthy backend is left to run a job on"""
+
+
+class Backend:
+    def __init__(self, client: ComfyClient):
+        self.client = client
+        self.url = client.base_url
+        self.healthy = True
+        self.outstanding = 0  # jobs dispatched and not finished yet
+        self.models: SceneModels | None = None  # model set of the last job sent
+
+    def __repr__(self) -> str:
+        state = "healthy" if self.healthy else "unhealthy"
+        return f"Backend({self.url!r}, {state}, outstanding={self.outstanding})"
+
+
+class SceneScheduler:
+    def __init__(
+        self,
+        urls: Iterable[str],
+        max_attempts: int = 3,
+        affinity_slack: int = 2,
+        health_interval: float = 5.0,
+        client_factory: Callable[[str], ComfyClient] = ComfyClient,
+        output_store: SceneOutputStore | None = None,
+        lost_after: float = 60.0,
+    ):
+        """
+        Args:
+            urls: base URLs of the ComfyUI servers
+            max_attempts: backends a job is tried on before giving up
+            affinity_slack: how many more jobs in flight a backend with the job's
+                models loaded may have than the least busy one and still be chosen
+            health_interval: seconds between health checks; 0 disables them
+            client_factory: builds the client for a URL
+            output_store: if set, jobs already in the store are not generated
+                again, and new results are added to it
+            lost_after: seconds a backend running a job may stay unreachable
+                before the job is resubmitted elsewhere
+        """
+        self.backends = [Backend(client_factory(url)) for url in urls]
+        if not self.backends:
+            raise ValueError("SceneScheduler needs at least one backend")
+        self.max_attempts = max_attempts
+        self.affinity_slack = affinity_slack
+        self.health_interval = health_interval
+        self.output_store = output_store
+        self.lost_after = lost_after
+        self._health_task: asyncio.Task | None = None
+
+    def choose_backend(
+        self, job: SceneJob, exclude: Iterable[Backend] = ()
+    ) -> Backend | None:
+        """The backend `job` should run on next, or None if none is available"""
+        candidates = [b for b in self.backends if b.healthy and b not in exclude]
+        if not candidates:
+            return None
+        least = min(b.outstanding for b in candidates)
+        affine = [
+            b
+            for b in candidates
+            if b.models == job.models and b.outstanding <= least + self.affinity_slack
+        ]
+        # without an affine backend, prefer one that has no models loaded yet
+        return min(
+            affine or candidates,
+            key=lambda b: (b.outstanding, b.models is not None),
+        )
+
+    async def _run_on(self, backend: Backend, job: SceneJob) -> SceneResult:
+        """
+        Runs `job` on `backend`. Raises `ComfyUnavailableError` if the backend did
+        not accept the job, and `ComfyPromptLostError` if it accepted and then lost
+        it (or never received it); in both cases the job can be resubmitted
+        elsewhere.
+        """
+        start = time.perf_counter()
+        prompt_id = uuid4().hex
+        unconfirmed_since = None  # set while it is unknown whether the job arrived
+        try:
+            await backend.client.submit_job(job, prompt_id)
+        except ComfyConnectionError as e:
+            # the backend may have queued the prompt before the connection failed,
+            # so look for it there rather than resubmitting it elsewhere
+            unconfirmed_since = time.monotonic()
+            logger.warning(
+                "Submitting job %s to %s failed midway, checking for prompt %s: %s",
+                job.job_id,
+                backend.url,
+                prompt_id,
+                e,
+            )
+        unreachable_since = None
+        while True:
+            try:
+                result = await backend.client.collect(
+                    job, prompt_id, submitted_at=start
+                )
+            except ComfyPromptLostError:
+                if (
+                    unconfirmed_since is None
+                    or time.monotonic() - unconfirmed_since >= self.lost_after
+                ):
+                    raise
+                # the backend may still be handling the submission
+                await asyncio.sleep(backend.client.poll_interval)
+            except ComfyUnavailableError as e:
+                # the prompt may still be running; resubmitting now could run the
+                # job twice, so keep polling until the backend is back or gone
+                now = time.monotonic()
+                if unreachable_since is None:
+                    unreachable_since = now
+                    backend.healthy = False
+                    logger.warning(
+                        "Lost contact with %s while it runs job %s (prompt %s): %s",
+                        backend.url,
+                        job.job_id,
+                        prompt_id,
+                        e,
+                    )
+                elif now - unreachable_since >= self.lost_after:
+                    raise ComfyPromptLostError(
+                        f"{backend.url} unreachable for {self.lost_after}s while "
+                        f"running prompt {prompt_id}"
+                    ) from e
+                await asyncio.sleep(backend.client.poll_interval)
+            else:
+                if unreachable_since is not None:
+                    logger.info("Backend %s is reachable again", backend.url)
+                    backend.healthy = True
+                return result
+
+    async def submit(self, job: SceneJob) -> SceneResult:
+        """
+        Runs `job` on the best backend, retrying on others if a backend is
+        unavailable or loses it
+        """
+        if self.output_store is not None:
+            stored = await asyncio.to_thread(self.output_store.get, job)
+            if stored is not None:
+                return stored
+
+        tried: list[Backend] = []
+        while True:
+            backend = self.choose_backend(job, exclude=tried)
+            if backend is None and not tried:
+                # everything is marked unhealthy; a backend may have recovered
+                await self.check_health()
+                backend = self.choose_backend(job)
+            if backend is None:
+                raise NoBackendError(
+                    f"No healthy backend left for job {job.job_id} "
+                    f"(tried {[b.url for b in tried]})"
+                )
+
+            tried.append(backend)
+            backend.outstanding += 1
+            backend.models = job.models
+            try:
+                result = await self._run_on(backend, job)
+            except ComfyPromptLostError as e:
+                DISPATCHES.inc(backend=backend.url, outcome="lost")
+                logger.warning("Backend %s lost job %s: %s", backend.url, job.job_id, e)
+                error = e
+            except ComfyUnavailableError as e:
+                backend.healthy = False
+                DISPATCHES.inc(backend=backend.url, outcome="unavailable")
+                logger.warning("Backend %s unavailable: %s", backend.url, e)
+                error = e
+            except ComfyError as e:
+                # rejected or failed by the server itself; would fail anywhere
+                DISPATCHES.inc(backend=backend.url, outcome="error")
+                logger.warning("Job %s failed on %s: %s", job.job_id, backend.url, e)
+                raise
+            else:
+                DISPATCHES.inc(backend=backend.url, outcome="ok")
+                if self.output_store is not None:
+                    result = await asyncio.to_thread(self.output_store.put, result)
+                return result
+            finally:
+                backend.outstanding -= 1
+
+            if len(tried) >= self.max_attempts:
+                raise error
+            logger.info("Retrying job %s on another backend", job.job_id)
+
+    async def run(self, jobs: Iterable[SceneJob]) -> list[SceneResult]:
+        return await asyncio.gather(*[self.submit(job) for job in jobs])
+
+    async def check_health(self):
+        """Pings every backend and updates its health"""
+
+        async def check(backend: Backend):
+            try:
+                await backend.client.system_stats()
+            except ComfyError as e:
+                if backend.healthy:
+                    logger.warning("Backend %s failed health check: %s", backend.url, e)
+                backend.healthy = False
+            else:
+                if not backend.healthy:
+                    logger.info("Backend %s is healthy again", backend.url)
+                backend.healthy = True
+            HEALTH_CHECKS.inc(
+                backend=backend.url,
+                result="healthy" if backend.healthy else "unhealthy",
+            )
+
+        await asyncio.gather(*[check(backend) for backend in self.backends])
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    def start(self):
+        """Starts periodic health checks; needs a running event loop"""
+        if self.health_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.get_running_loop().create_task(
+                self._health_loop()
+            )
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for backend in self.backends:
+            backend.client.close()
+
+    async def __aenter__(self) -> "SceneScheduler":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
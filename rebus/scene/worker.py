@@ -0,0 +1,444 @@
+"""
+Long-lived scene generation worker.
+
+Loading the Flux CLIP, UNET and VAE weights costs far more than sampling one image,
+so the worker loads them once and then serves a queue of `SceneJob`s from a
+background thread.
+
+The worker drives ComfyUI nodes directly. Pass ComfyUI's `NODE_CLASS_MAPPINGS` (see
+`SceneWorker.from_comfyui`) to generate for real, or the stubbed nodes from
+`rebus.scene.dry_run` to exercise scheduling on CPU.
+
+Example:
+    with SceneWorker.from_comfyui(output_dir="scenes/") as worker:
+        future = worker.submit(job)
+        print(future.result().paths)
+"""
+
+import contextlib
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Mapping
+
+from rebus.scene.batching import IncompatibleBatchError, REBUS_NODE_CLASS_MAPPINGS
+from rebus.scene.conditioning_cache import ConditioningCache, conditioning_key
+from rebus.scene.output_cache import SceneOutputStore
+from rebus.scene.jobs import (
+    MULTI_AREA_NODE_ID,
+    SceneJob,
+    SceneModels,
+    SceneResult,
+    batch_key,
+    job_from_dict,
+    multi_area_extra_pnginfo,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_value_at_index(obj, index: int) -> Any:
+    """Same as `rebus.scene.generation.get_value_at_index`, without importing torch"""
+    try:
+        return obj[index]
+    except KeyError:
+        return obj["result"][index]
+
+
+def encode_png(image) -> bytes:
+    """Encodes a decoded [H, W, C] image tensor (values in 0-1) as PNG"""
+    import numpy as np
+    from PIL import Image
+
+    array = np.clip(255.0 * image.cpu().numpy(), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="png")
+    return buffer.getvalue()
+
+
+def _inference_mode():
+    try:
+        import torch
+    except ImportError:  # dry runs do not need torch
+        return contextlib.nullcontext()
+    return torch.inference_mode()
+
+
+_STOP = object()
+
+
+class SceneWorker:
+    def __init__(
+        self,
+        nodes: Mapping[str, type],
+        models: SceneModels | None = None,
+        output_dir: str | None = None,
+        encode_image: Callable[[Any], bytes] = encode_png,
+        image_extension: str = "png",
+        max_pending: int = 64,
+        conditioning_cache: ConditioningCache | None = None,
+        batch_size: int = 1,
+        batch_wait: float = 0.05,
+        output_store: SceneOutputStore | None = None,
+    ):
+        """
+        Args:
+            nodes: ComfyUI node classes by name (i.e. `NODE_CLASS_MAPPINGS`)
+            models: the model files to load once and keep resident; the default
+                `SceneModels()` if None
+            output_dir: if set, images are also written there and their paths
+                returned; not allowed together with `output_store`
+            encode_image: turns one decoded image into file bytes
+            max_pending: `submit` blocks once this many jobs are queued
+            conditioning_cache: reuses text encodings across jobs if set
+            batch_size: max number of queued jobs sampled together in one latent
+                batch; only jobs with the same `batch_key` are batched
+            batch_wait: how long to wait for more jobs to fill a batch, in seconds
+            output_store: if set, jobs already in the store are not generated
+                again, and new results are written to it; returned paths point
+                into the store
+        """
+        if output_dir is not None and output_store is not None:
+            raise ValueError("Pass either output_dir or output_store, not both")
+        self.nodes = {**REBUS_NODE_CLASS_MAPPINGS, **nodes}
+        self.models = models if models is not None else SceneModels()
+        self.output_dir = output_dir
+        self.encode_image = encode_image
+        self.image_extension = image_extension
+        self.conditioning_cache = conditioning_cache
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.output_store = output_store
+        self._jobs: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread: threading.Thread | None = None
+        self._loaded = False
+
+    @classmethod
+    def from_comfyui(cls, comfyui_directory: str | None = None, **kwargs):
+        """Creates a worker backed by a local ComfyUI installation's nodes"""
+        from rebus.scene import generation
+
+        generation.add_comfyui_directory_to_sys_path(comfyui_directory)
+        generation.add_extra_model_paths()
+        generation.import_custom_nodes()
+        from nodes import NODE_CLASS_MAPPINGS
+
+        return cls(NODE_CLASS_MAPPINGS, **kwargs)
+
+    def load_models(self):
+        """Loads the CLIP, UNET and VAE models; called once, before the first job"""
+        if self._loaded:
+            return
+        logger.info("Loading scene models %s", self.models)
+        with _inference_mode():
+            self._clip = get_value_at_index(
+                self.nodes["DualCLIPLoader"]().load_clip(
+                    clip_name1=self.models.clip_name1,
+                    clip_name2=self.models.clip_name2,
+                    type=self.models.clip_type,
+                ),
+                0,
+            )
+            self._unet = get_value_at_index(
+                self.nodes["UNETLoader"]().load_unet(
+                    unet_name=self.models.unet_name,
+                    weight_dtype=self.models.weight_dtype,
+                ),
+                0,
+            )
+            self._vae = get_value_at_index(
+                self.nodes["VAELoader"]().load_vae(vae_name=self.models.vae_name), 0
+            )
+
+        self._cliptextencodeflux = self.nodes["CLIPTextEncodeFlux"]()
+        self._multiareaconditioning = self.nodes["MultiAreaConditioning"]()
+        self._emptylatentimage = self.nodes["EmptyLatentImage"]()
+        self._randomnoise = self.nodes["RandomNoise"]()
+        self._ksamplerselect = self.nodes["KSamplerSelect"]()
+        self._basicguider = self.nodes["BasicGuider"]()
+        self._basicscheduler = self.nodes["BasicScheduler"]()
+        self._samplercustomadvanced = self.nodes["SamplerCustomAdvanced"]()
+        self._vaedecode = self.nodes["VAEDecode"]()
+        self._batchnoise = self.nodes["RebusBatchNoise"]()
+        self._batchconditioning = self.nodes["RebusBatchConditioning"]()
+        self._loaded = True
+
+    def _encode_text(self, text: str, guidance: float):
+        def encode():
+            return get_value_at_index(
+                self._cliptextencodeflux.encode(
+                    clip_l=text, t5xxl=text, guidance=guidance, clip=self._clip
+                ),
+                0,
+            )
+
+        if self.conditioning_cache is None:
+            return encode()
+        clip_model = (
+            self.models.clip_name1,
+            self.models.clip_name2,
+            self.models.clip_type,
+        )
+        key = conditioning_key(clip_model, text, text, guidance)
+        return self.conditioning_cache.get_or_encode(key, encode)
+
+    def _conditioning(self, job: SceneJob):
+        conditionings = [self._encode_text(job.prompt, job.guidance)] + [
+            self._encode_text(area.prompt, job.guidance) for area in job.area_prompts
+        ]
+        return get_value_at_index(
+            self._multiareaconditioning.doStuff(
+                extra_pnginfo=multi_area_extra_pnginfo(job),
+                unique_id=str(MULTI_AREA_NODE_ID),
+                **{f"conditioning{i}": c for i, c in enumerate(conditionings)},
+            ),
+            0,
+        )
+
+    def _sample(self, jobs: list[SceneJob]) -> list:
+        """
+        Runs the sampling graph for `jobs` (which must share a `batch_key`) as one
+        latent batch, returning one decoded image per job
+        """
+        job = jobs[0]
+        conditionings = [self._conditioning(job) for job in jobs]
+        if len(jobs) == 1:
+            conditioning = conditionings[0]
+            noise = self._randomnoise.get_noise(noise_seed=job.seed)
+        else:
+            conditioning = get_value_at_index(
+                self._batchconditioning.batch(conditionings=conditionings), 0
+            )
+            noise = self._batchnoise.batch(noise_seeds=[job.seed for job in jobs])
+
+        guider = self._basicguider.get_guider(
+            model=self._unet, conditioning=conditioning
+        )
+        sigmas = self._basicscheduler.get_sigmas(
+            scheduler=job.scheduler, steps=job.steps, denoise=1, model=self._unet
+        )
+        latent = self._emptylatentimage.generate(
+            width=job.width, height=job.height, batch_size=len(jobs)
+        )
+        samples = self._samplercustomadvanced.sample(
+            noise=get_value_at_index(noise, 0),
+            guider=get_value_at_index(guider, 0),
+            sampler=get_value_at_index(
+                self._ksamplerselect.get_sampler(sampler_name=job.sampler_name), 0
+            ),
+            sigmas=get_value_at_index(sigmas, 0),
+            latent_image=get_value_at_index(latent, 0),
+        )
+        decoded = self._vaedecode.decode(
+            samples=get_value_at_index(samples, 0), vae=self._vae
+        )
+        return list(get_value_at_index(decoded, 0))
+
+    def _write(self, job: SceneJob, images: list[bytes]) -> list[str]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = []
+        for i, image in enumerate(images):
+            path = os.path.join(
+                self.output_dir, f"{job.job_id}_{i:02}.{self.image_extension}"
+            )
+            with open(path, "wb") as f:
+                f.write(image)
+            paths.append(path)
+        return paths
+
+    def run_batch(self, jobs: list[SceneJob]) -> list[SceneResult]:
+        """
+        Generates `jobs` synchronously on the calling thread, as a single latent
+        batch. All jobs must share the same `batch_key`.
+        """
+        for job in jobs:
+            if job.models != self.models:
+                raise ValueError(
+                    f"Job {job.job_id} needs models {job.models}, "
+                    f"worker has {self.models}"
+                )
+        if len({batch_key(job) for job in jobs}) != 1:
+            raise ValueError("Jobs in a batch must share the same batch_key")
+
+        self.load_models()
+        with _inference_mode():
+            try:
+                decoded = self._sample(jobs)
+            except IncompatibleBatchError:
+                logger.debug("Cannot batch %d jobs; sampling one by one", len(jobs))
+                decoded = [image for job in jobs for image in self._sample([job])]
+
+        results = []
+        for job, image in zip(jobs, decoded, strict=True):
+            images = [self.encode_image(image)]
+            paths = self._write(job, images) if self.output_dir is not None else []
+            result = SceneResult(job=job, images=images, paths=paths)
+            if self.output_store is not None:
+                result = self.output_store.put(result)
+            results.append(result)
+        return results
+
+    def run_job(self, job: SceneJob) -> SceneResult:
+        """Generates `job` synchronously on the calling thread"""
+        return self.run_batch([job])[0]
+
+    def submit(self, job: SceneJob) -> Future:
+        """Queues `job` for the background thread; blocks if the queue is full"""
+        if self._thread is None:
+            raise RuntimeError("Worker is not running; call start() first")
+        future = Future()
+        if self.output_store is not None:
+            stored = self.output_store.get(job)
+            if stored is not None:
+                future.set_result(stored)
+                return future
+        self._jobs.put((job, future))
+        return future
+
+    def _next_pending(self) -> tuple[list[tuple[SceneJob, Future]], bool]:
+        """
+        Blocks for the next job, then collects up to `batch_size` jobs in total,
+        waiting at most `batch_wait` seconds for more to arrive. Also returns
+        whether the worker was asked to stop.
+        """
+        pending = []
+        deadline = None
+        while len(pending) < self.batch_size:
+            try:
+                if deadline is None:
+                    item = self._jobs.get()
+                    deadline = time.monotonic() + self.batch_wait
+                else:
+                    item = self._jobs.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return pending, True
+            pending.append(item)
+        return pending, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            pending, stopping = self._next_pending()
+            batches: dict[tuple, list[tuple[SceneJob, Future]]] = {}
+            for job, future in pending:
+                if future.set_running_or_notify_cancel():
+                    batches.setdefault(batch_key(job), []).append((job, future))
+
+            for batch in batches.values():
+                self._run_pending(batch)
+
+    def _run_pending(self, batch: list[tuple[SceneJob, Future]]):
+        """
+        Runs one batch and resolves its futures. If a batch of several jobs fails,
+        its jobs are retried one at a time, so one bad job only fails itself.
+        """
+        jobs = [job for job, _ in batch]
+        try:
+            results = self.run_batch(jobs)
+        except Exception as e:
+            if len(batch) > 1:
+                logger.warning(
+                    "Scene batch of %d jobs failed (%r); retrying one at a time",
+                    len(jobs),
+                    e,
+                )
+                for item in batch:
+                    self._run_pending([item])
+                return
+            logger.exception("Scene job %s failed", jobs[0].job_id)
+            batch[0][1].set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def start(self):
+        """Loads the models and starts serving submitted jobs"""
+        if self._thread is not None:
+            return
+        self.load_models()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Finishes the queued jobs, then stops the background thread"""
+        if self._thread is None:
+            return
+        self._jobs.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self) -> "SceneWorker":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Generate scenes for a JSONL file of jobs with resident models"
+    )
+    parser.add_argument("jobs", help="JSONL file, one SceneJob per line")
+    destination = parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument("--output-dir", "-o")
+    destination.add_argument(
+        "--store",
+        help="Content-addressed output store; jobs already in it are not regenerated",
+    )
+    parser.add_argument("--comfyui-directory", "-c", default=None)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Max number of compatible jobs to sample together (default: 1)",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Use stubbed nodes instead of ComfyUI"
+    )
+    args = parser.parse_args()
+
+    with open(args.jobs) as f:
+        jobs = [job_from_dict(json.loads(line)) for line in f if line.strip()]
+
+    if args.dry_run:
+        from rebus.scene.dry_run import (
+            DRY_RUN_NODE_CLASS_MAPPINGS,
+            encode_dry_run_image,
+        )
+
+        worker = SceneWorker(
+            DRY_RUN_NODE_CLASS_MAPPINGS,
+            output_dir=args.output_dir,
+            encode_image=encode_dry_run_image,
+            image_extension="json",
+            batch_size=args.batch_size,
+            output_store=args.store and SceneOutputStore(args.store, "json"),
+        )
+    else:
+        worker = SceneWorker.from_comfyui(
+            args.comfyui_directory,
+            output_dir=args.output_dir,
+            batch_size=args.batch_size,
+            output_store=args.store and SceneOutputStore(args.store),
+        )
+
+    with worker:
+        futures = [worker.submit(job) for job in jobs]
+        for future in futures:
+            for path in future.result().paths:
+                print(path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
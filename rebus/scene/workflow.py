@@ -0,0 +1,222 @@
+"""
+Builds scene jobs and ComfyUI workflow graphs from `RebusPuzzle`s.
+
+Each `RebusSubstring` gets its own area prompt. Areas are laid out left to right in
+the order the substrings appear in the phrase, as equal-width, slightly overlapping
+columns (the layout of comfy_generation.json). A full-scene prompt covers the
+whole canvas.
+
+`build_workflow` emits the same graph as comfy_generation.json in ComfyUI's API
+("prompt") format, ready to be POSTed to a ComfyUI server (see `comfy_client`).
+"""
+
+from collections.abc import Mapping
+
+from rebus.scene.jobs import (
+    MULTI_AREA_NODE_ID,
+    AreaPrompt,
+    SceneJob,
+    multi_area_extra_pnginfo,
+)
+from rebus.structs import RebusPuzzle
+
+# how much each area extends into its neighbours, relative to its column width
+AREA_OVERLAP = 0.125
+
+# node ids of the graph built by `build_workflow`, matching comfy_generation.json
+CLIP_NODE_ID = "6"
+SCENE_PROMPT_NODE_ID = "1"
+UNET_NODE_ID = "8"
+GUIDER_NODE_ID = "9"
+LATENT_NODE_ID = "10"
+NOISE_NODE_ID = "11"
+SAMPLER_SELECT_NODE_ID = "12"
+SCHEDULER_NODE_ID = "13"
+SAMPLER_NODE_ID = "14"
+VAE_NODE_ID = "15"
+DECODE_NODE_ID = "16"
+SAVE_NODE_ID = "17"
+AREA_PROMPT_NODE_ID_START = 100
+
+
+def _round_to_latent(pixels: float) -> int:
+    """Areas are applied on the latent grid, which is 8x smaller than the image"""
+    return int(round(pixels / 8)) * 8
+
+
+def layout_areas(num_areas: int, width: int) -> list[tuple[int, int]]:
+    """
+    (x, width) of `num_areas` equal, overlapping columns spanning `width`.
+    E.g. 3 areas on a 1024px canvas -> (0, 384), (320, 384), (640, 384)
+    """
+    if num_areas == 0:
+        return []
+    area_width = min(width, _round_to_latent(width / num_areas * (1 + AREA_OVERLAP)))
+    if num_areas == 1:
+        return [((width - area_width) // 2 // 8 * 8, area_width)]
+    step = (width - area_width) / (num_areas - 1)
+    return [(_round_to_latent(i * step), area_width) for i in range(num_areas)]
+
+
+def default_area_prompt(text: str) -> str:
+    return f"a {text}"
+
+
+def default_scene_prompt(area_prompts: list[str]) -> str:
+    return "A scene with " + ", ".join(area_prompts) + "."
+
+
+def scene_job_for_puzzle(
+    puzzle: RebusPuzzle,
+    seed: int,
+    scene_prompt: str | None = None,
+    descriptions: Mapping[str, str] | None = None,
+    width: int = 1024,
+    height: int = 512,
+    **job_kwargs,
+) -> SceneJob:
+    """
+    Args:
+        puzzle: the puzzle to draw; one area per substring
+        seed: noise seed; explicit so that every generated scene is reproducible
+        scene_prompt: full-scene prompt; by default lists the area prompts
+        descriptions: area prompt per substring text, e.g. {"gar": "a gar (fish)"};
+            substrings without one are prompted as "a <text>"
+        job_kwargs: passed on to `SceneJob` (steps, guidance, models, ...)
+    """
+    descriptions = descriptions or {}
+    substrings = sorted(puzzle.substrings, key=lambda s: (s.start, s.stop))
+    prompts = [
+        descriptions.get(s.text) or default_area_prompt(s.text) for s in substrings
+    ]
+    area_prompts = [
+        AreaPrompt(prompt=prompt, x=x, y=0, width=area_width, height=height)
+        for prompt, (x, area_width) in zip(prompts, layout_areas(len(prompts), width))
+    ]
+    return SceneJob(
+        prompt=scene_prompt or default_scene_prompt(prompts),
+        area_prompts=area_prompts,
+        seed=seed,
+        width=width,
+        height=height,
+        **job_kwargs,
+    )
+
+
+def build_workflow(job: SceneJob, filename_prefix: str = "rebus") -> tuple[dict, dict]:
+    """
+    Returns the ComfyUI API graph for `job`, and the `extra_pnginfo` that must be
+    submitted with it (MultiAreaConditioning reads its area layout from there)
+    """
+    models = job.models
+    graph = {
+        CLIP_NODE_ID: {
+            "class_type": "DualCLIPLoader",
+            "inputs": {
+                "clip_name1": models.clip_name1,
+                "clip_name2": models.clip_name2,
+                "type": models.clip_type,
+            },
+        },
+        UNET_NODE_ID: {
+            "class_type": "UNETLoader",
+            "inputs": {
+                "unet_name": models.unet_name,
+                "weight_dtype": models.weight_dtype,
+            },
+        },
+        VAE_NODE_ID: {
+            "class_type": "VAELoader",
+            "inputs": {"vae_name": models.vae_name},
+        },
+    }
+
+    def encode_node(text: str) -> dict:
+        return {
+            "class_type": "CLIPTextEncodeFlux",
+            "inputs": {
+                "clip_l": text,
+                "t5xxl": text,
+                "guidance": job.guidance,
+                "clip": [CLIP_NODE_ID, 0],
+            },
+        }
+
+    conditioning_node_ids = [SCENE_PROMPT_NODE_ID]
+    graph[SCENE_PROMPT_NODE_ID] = encode_node(job.prompt)
+    for i, area in enumerate(job.area_prompts):
+        node_id = str(AREA_PROMPT_NODE_ID_START + i)
+        graph[node_id] = encode_node(area.prompt)
+        conditioning_node_ids.append(node_id)
+
+    graph[str(MULTI_AREA_NODE_ID)] = {
+        "class_type": "MultiAreaConditioning",
+        "inputs": {
+            "resolutionX": job.width,
+            "resolutionY": job.height,
+            "index": 0,
+            "x": 0,
+            "y": 0,
+            "width": job.width,
+            "height": job.height,
+            "strength": job.scene_strength,
+            **{
+                f"conditioning{i}": [node_id, 0]
+                for i, node_id in enumerate(conditioning_node_ids)
+            },
+        },
+    }
+    graph.update(
+        {
+            GUIDER_NODE_ID: {
+                "class_type": "BasicGuider",
+                "inputs": {
+                    "model": [UNET_NODE_ID, 0],
+                    "conditioning": [str(MULTI_AREA_NODE_ID), 0],
+                },
+            },
+            LATENT_NODE_ID: {
+                "class_type": "EmptyLatentImage",
+                "inputs": {"width": job.width, "height": job.height, "batch_size": 1},
+            },
+            NOISE_NODE_ID: {
+                "class_type": "RandomNoise",
+                "inputs": {"noise_seed": job.seed},
+            },
+            SAMPLER_SELECT_NODE_ID: {
+                "class_type": "KSamplerSelect",
+                "inputs": {"sampler_name": job.sampler_name},
+            },
+            SCHEDULER_NODE_ID: {
+                "class_type": "BasicScheduler",
+                "inputs": {
+                    "scheduler": job.scheduler,
+                    "steps": job.steps,
+                    "denoise": 1,
+                    "model": [UNET_NODE_ID, 0],
+                },
+            },
+            SAMPLER_NODE_ID: {
+                "class_type": "SamplerCustomAdvanced",
+                "inputs": {
+                    "noise": [NOISE_NODE_ID, 0],
+                    "guider": [GUIDER_NODE_ID, 0],
+                    "sampler": [SAMPLER_SELECT_NODE_ID, 0],
+                    "sigmas": [SCHEDULER_NODE_ID, 0],
+                    "latent_image": [LATENT_NODE_ID, 0],
+                },
+            },
+            DECODE_NODE_ID: {
+                "class_type": "VAEDecode",
+                "inputs": {"samples": [SAMPLER_NODE_ID, 0], "vae": [VAE_NODE_ID, 0]},
+            },
+            SAVE_NODE_ID: {
+                "class_type": "SaveImage",
+                "inputs": {
+                    "filename_prefix": f"{filename_prefix}_{job.job_id}",
+                    "images": [DECODE_NODE_ID, 0],
+                },
+            },
+        }
+    )
+    return graph, multi_area_extra_pnginfo(job)
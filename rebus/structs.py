@@ -1,14 +1,31 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class RebusSubstring:
     text: str  # the substring itself
     start: int  # start index in the rebus phrase (without spaces)
     stop: int  # stop index in the rebus phrase (without spaces)
 
 
-@dataclass
+@dataclass(slots=True)
 class RebusPuzzle:
     phrase: str
     substrings: list[RebusSubstring]
+
+
+def puzzle_to_dict(puzzle: RebusPuzzle) -> dict:
+    return {
+        "phrase": puzzle.phrase,
+        "substrings": [
+            {"text": s.text, "start": s.start, "stop": s.stop}
+            for s in puzzle.substrings
+        ],
+    }
+
+
+def puzzle_from_dict(data: dict) -> RebusPuzzle:
+    return RebusPuzzle(
+        phrase=data["phrase"],
+        substrings=[RebusSubstring(**s) for s in data["substrings"]],
+    )
@@ -0,0 +1,139 @@
+"""
+Optional tracing spans, written as Chrome trace-event JSON.
+
+Tracing is disabled by default, in which case `span` returns a shared no-op context
+manager. When enabled, every span records a complete ("X") event that can be opened
+in chrome://tracing or https://ui.perfetto.dev.
+
+Spans inherit the args of their enclosing span, so a stage span nested in
+`find_substrings` is tagged with the phrase and substring it was checking. Use
+`annotate` to add args (e.g. cache status) to the innermost active span.
+
+Example:
+    with tracing.recording("trace.json"):
+        asyncio.run(find_substrings("garden flower blooming"))
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class _NoopArgs:
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+_NOOP_SPAN = nullcontext(_NoopArgs())
+
+# args of the innermost active span; children start from a copy of these
+_current_args: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    "rebus_trace_args", default=None
+)
+
+
+class Tracer:
+    def __init__(self):
+        self.events: list[dict] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._tids: dict[int, int] = {}
+
+    def _tid(self) -> int:
+        """
+        Concurrent asyncio tasks get their own track in the viewer, since their spans
+        overlap and would otherwise be drawn as (wrongly) nested
+        """
+        try:
+            key = id(asyncio.current_task())
+        except RuntimeError:  # no running event loop
+            key = threading.get_ident()
+        with self._lock:
+            return self._tids.setdefault(key, len(self._tids) + 1)
+
+    @contextmanager
+    def span(self, name: str, **args):
+        span_args = {**(_current_args.get() or {}), **args}
+        token = _current_args.set(span_args)
+        start = time.perf_counter()
+        try:
+            yield span_args
+        finally:
+            duration = time.perf_counter() - start
+            _current_args.reset(token)
+            event = {
+                "name": name,
+                "cat": "rebus",
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": duration * 1e6,
+                "pid": self._pid,
+                "tid": self._tid(),
+                "args": {key: str(value) for key, value in span_args.items()},
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def save(self, path: str):
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+_tracer: Tracer | None = None
+
+
+def span(name: str, **args):
+    """
+    Context manager timing the enclosed block; yields the span's args dict so that
+    callers can tag it. No-op unless tracing is enabled.
+    """
+    if _tracer is None:
+        return _NOOP_SPAN
+    return _tracer.span(name, **args)
+
+
+def annotate(**args):
+    """Adds args to the innermost active span, if any"""
+    if _tracer is None:
+        return
+    span_args = _current_args.get()
+    if span_args is not None:
+        span_args.update(args)
+
+
+def enable() -> Tracer:
+    """Starts recording spans into a fresh tracer"""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable() -> Tracer | None:
+    """Stops recording spans and returns the tracer that was active"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def is_enabled() -> bool:
+    return _tracer is not None
+
+
+@contextmanager
+def recording(path: str):
+    """Records spans for the duration of the block and writes them to `path`"""
+    tracer = enable()
+    try:
+        yield tracer
+    finally:
+        disable()
+        tracer.save(path)
@@ -1,39 +1,92 @@
-from nltk.corpus import wordnet
 from tenacity import (
     retry,
-    retry_if_exception_type,
+    retry_if_exception,
     stop_after_attempt,
     wait_exponential,
 )
-import anthropic
 import re
 
+from rebus import metrics, tracing
 from rebus.word.prompts import IS_VISUAL_WORD_PROMPT
 
+# `anthropic` takes over a second to import, so it is only imported (and the client
+# constructed) on first use, or eagerly via `get_client()` / `rebus.rebus.warmup()`
+_client = None
 
-ANTHROPIC_TIMEOUT_EXCEPTIONS = (
-    anthropic.RateLimitError,
-    anthropic.APIConnectionError,
-    anthropic.APITimeoutError,
-    anthropic.InternalServerError,
+# the model answering `IS_VISUAL_WORD_PROMPT`; changing it can change puzzles
+VISUAL_WORD_MODEL = "claude-3-5-sonnet-20241022"
+
+
+def get_client():
+    """Returns the shared AsyncAnthropic client, creating it on first use"""
+    global _client
+    if _client is None:
+        import anthropic
+
+        _client = anthropic.AsyncAnthropic(max_retries=0)
+    return _client
+
+
+def _is_transient_error(exception: BaseException) -> bool:
+    import anthropic
+
+    return isinstance(
+        exception,
+        (
+            anthropic.RateLimitError,
+            anthropic.APIConnectionError,
+            anthropic.APITimeoutError,
+            anthropic.InternalServerError,
+        ),
+    )
+
+
+CACHE_LOOKUPS = metrics.counter(
+    "rebus_visual_word_cache_total",
+    "is_visual_word cache lookups, by result (hit/miss)",
+    ("result",),
+)
+LLM_CALLS = metrics.counter(
+    "rebus_llm_calls_total", "LLM API attempts, by outcome", ("outcome",)
+)
+LLM_RETRIES = metrics.counter("rebus_llm_retries_total", "LLM API attempts retried")
+LLM_LATENCY = metrics.histogram(
+    "rebus_llm_latency_seconds", "Latency of individual LLM API attempts"
 )
 
-client = anthropic.AsyncAnthropic(max_retries=0)
+
+def _count_retry(retry_state):
+    LLM_RETRIES.inc()
 
 
 @retry(
-    retry=retry_if_exception_type(ANTHROPIC_TIMEOUT_EXCEPTIONS),
+    retry=retry_if_exception(_is_transient_error),
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
+    before_sleep=_count_retry,
 )
 async def _ask_if_visual_word(word: str) -> bool:
     """Ask claude whether a word is a 'visual' word according to our spec"""
-    response = await client.messages.create(
-        model="claude-3-5-sonnet-20241022",
-        messages=[{"role": "user", "content": IS_VISUAL_WORD_PROMPT.format(word=word)}],
-        temperature=0,
-        max_tokens=256,
-    )
+    import anthropic
+
+    client = get_client()
+    try:
+        with LLM_LATENCY.time(), tracing.span("llm_attempt"):
+            response = await client.messages.create(
+                model=VISUAL_WORD_MODEL,
+                messages=[
+                    {"role": "user", "content": IS_VISUAL_WORD_PROMPT.format(word=word)}
+                ],
+                temperature=0,
+                max_tokens=256,
+            )
+    except anthropic.RateLimitError:
+        LLM_CALLS.inc(outcome="rate_limited")  # HTTP 429
+        raise
+    except Exception:
+        LLM_CALLS.inc(outcome="error")
+        raise
+    LLM_CALLS.inc(outcome="ok")
     response_text = response.content[0].text
     # print(response_text)
 
@@ -57,13 +110,20 @@ async def is_visual_word(substring: str) -> bool:
 
     # Check cache first
     if substring in visual_word_cache:
+        CACHE_LOOKUPS.inc(result="hit")
+        tracing.annotate(cache="hit")
         return visual_word_cache[substring]
 
+    CACHE_LOOKUPS.inc(result="miss")
+    tracing.annotate(cache="miss")
     result = await _ask_if_visual_word(substring)
     visual_word_cache[substring] = result
     return result
+
+
 if __name__ == "__main__":
     import asyncio
+
     print("is_visual_word(gar)", asyncio.run(is_visual_word("gar")))
     print("is_visual_word(den)", asyncio.run(is_visual_word("den")))
     print("is_visual_word(looming)", asyncio.run(is_visual_word("looming")))
@@ -1,4 +1,40 @@
-from nltk.corpus import wordnet
+import os
+
+# env var pointing at a prebuilt snapshot (see `rebus.word.wordnet_snapshot`)
+SNAPSHOT_ENV_VAR = "REBUS_WORDNET_SNAPSHOT"
+
+_wordnet = None
+
+
+def get_wordnet():
+    """
+    Returns the WordNet reader, loading it on first use: the prebuilt snapshot if
+    `REBUS_WORDNET_SNAPSHOT` is set, otherwise nltk's corpus reader
+    """
+    global _wordnet
+    if _wordnet is None:
+        if snapshot_path := os.environ.get(SNAPSHOT_ENV_VAR):
+            use_snapshot(snapshot_path)
+        else:
+            from nltk.corpus import wordnet
+
+            wordnet.ensure_loaded()
+            _wordnet = wordnet
+    return _wordnet
+
+
+def use_snapshot(path: str):
+    """Serves all WordNet lookups from the prebuilt snapshot at `path`"""
+    global _wordnet
+    from rebus.word.wordnet_snapshot import WordNetSnapshot
+
+    _wordnet = WordNetSnapshot.load(path)
+
+
+def lexicon_version() -> str:
+    """Version of the WordNet data lookups are served from"""
+    return f"wordnet-{get_wordnet().get_version()}"
+
 
 def same_meaning(word_a: str, word_b: str) -> bool:
     """
@@ -6,6 +42,7 @@ def same_meaning(word_a: str, word_b: str) -> bool:
     Returns True if the words are semantically related (share meanings,
     or one is a more specific/general version of the other)
     """
+    wordnet = get_wordnet()
     synsets_a = wordnet.synsets(word_a.lower())
     synsets_b = wordnet.synsets(word_b.lower())
     if not synsets_a or not synsets_b:  # either word is not in WordNet
@@ -20,8 +57,10 @@ def same_meaning(word_a: str, word_b: str) -> bool:
 
     return False
 
+
 def is_word(substring: str) -> bool:
     """
     Checks if the given substring is a word
     """
+    wordnet = get_wordnet()
     return bool(wordnet.synsets(substring.lower()))
@@ -0,0 +1,176 @@
+"""
+Prebuilt WordNet snapshot for fast startup.
+
+nltk's WordNet reader parses the lemma index and exception lists from text files
+on first use, which takes seconds. A snapshot stores just what `is_word` and
+`same_meaning` need (lemma -> synset tables, morphology exception lists, and
+hypernym/hyponym links) in a single pickle that loads in a fraction of that.
+
+Build one with the WordNet corpus installed:
+    python -m rebus.word.wordnet_snapshot wordnet.pkl
+
+then point `REBUS_WORDNET_SNAPSHOT` at it (or call `rebus.word.wordnet.use_snapshot`).
+"""
+
+import argparse
+import pickle
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# the parts of speech searched by nltk's `synsets()` when no pos is given, in order
+POS_LIST = ("n", "v", "a", "r")
+# adjective satellites live in the adjective data file, so share their offset space
+_POS_CODES = {"n": 0, "v": 1, "a": 2, "s": 2, "r": 3}
+
+
+def synset_code(pos: str, offset: int) -> int:
+    """Packs a synset's (pos, offset) into a single int"""
+    return offset * 4 + _POS_CODES[pos]
+
+
+class SnapshotSynset:
+    """Just enough of nltk's `Synset` interface for `same_meaning`"""
+
+    __slots__ = ("_snapshot", "code")
+
+    def __init__(self, snapshot: "WordNetSnapshot", code: int):
+        self._snapshot = snapshot
+        self.code = code
+
+    def hypernyms(self) -> list["SnapshotSynset"]:
+        return self._snapshot._synsets(self._snapshot._hypernyms.get(self.code, ()))
+
+    def hyponyms(self) -> list["SnapshotSynset"]:
+        return self._snapshot._synsets(self._snapshot._hyponyms.get(self.code, ()))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SnapshotSynset) and self.code == other.code
+
+    def __hash__(self) -> int:
+        return hash(self.code)
+
+    def __repr__(self) -> str:
+        return f"SnapshotSynset({self.code})"
+
+
+class WordNetSnapshot:
+    """
+    Drop-in replacement for the parts of nltk's WordNet reader used by rebus.
+    `synsets` mirrors nltk's lookup, including its `morphy` lemmatization.
+    """
+
+    def __init__(self, data: dict):
+        if data["format_version"] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported WordNet snapshot format {data['format_version']}, "
+                f"expected {SNAPSHOT_FORMAT_VERSION}"
+            )
+        self.wordnet_version: str = data["wordnet_version"]
+        # pos -> lemma -> synset codes
+        self._index: dict[str, dict[str, tuple[int, ...]]] = data["index"]
+        # pos -> inflected form -> base forms
+        self._exceptions: dict[str, dict[str, list[str]]] = data["exceptions"]
+        # pos -> [(old suffix, new suffix), ...]
+        self._substitutions: dict[str, list[tuple[str, str]]] = data["substitutions"]
+        self._hypernyms: dict[int, tuple[int, ...]] = data["hypernyms"]
+        self._hyponyms: dict[int, tuple[int, ...]] = data["hyponyms"]
+        self._data = data
+
+    @classmethod
+    def build(cls, wordnet) -> "WordNetSnapshot":
+        """Builds a snapshot from an nltk WordNet corpus reader"""
+        index = {pos: {} for pos in POS_LIST}
+        for lemma, offsets_by_pos in wordnet._lemma_pos_offset_map.items():
+            for pos in POS_LIST:
+                if pos in offsets_by_pos:
+                    index[pos][lemma] = tuple(
+                        synset_code(pos, offset) for offset in offsets_by_pos[pos]
+                    )
+
+        hypernyms, hyponyms = {}, {}
+        for synset in wordnet.all_synsets():
+            code = synset_code(synset.pos(), synset.offset())
+            if related := synset.hypernyms():
+                hypernyms[code] = tuple(
+                    synset_code(s.pos(), s.offset()) for s in related
+                )
+            if related := synset.hyponyms():
+                hyponyms[code] = tuple(
+                    synset_code(s.pos(), s.offset()) for s in related
+                )
+
+        return cls(
+            {
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "wordnet_version": wordnet.get_version(),
+                "index": index,
+                "exceptions": {
+                    pos: dict(wordnet._exception_map[pos]) for pos in POS_LIST
+                },
+                "substitutions": {
+                    pos: list(wordnet.MORPHOLOGICAL_SUBSTITUTIONS[pos])
+                    for pos in POS_LIST
+                },
+                "hypernyms": hypernyms,
+                "hyponyms": hyponyms,
+            }
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "WordNetSnapshot":
+        with open(path, "rb") as f:
+            return cls(pickle.load(f))
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(self._data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def get_version(self) -> str:
+        return self.wordnet_version
+
+    def _synsets(self, codes) -> list[SnapshotSynset]:
+        return [SnapshotSynset(self, code) for code in codes]
+
+    def _morphy(self, form: str, pos: str) -> list[str]:
+        """Same algorithm as `nltk.corpus.reader.wordnet.WordNetCorpusReader._morphy`"""
+        exceptions = self._exceptions[pos]
+        if form in exceptions:
+            forms = exceptions[form]
+        else:
+            forms = [
+                form[: -len(old)] + new
+                for old, new in self._substitutions[pos]
+                if form.endswith(old)
+            ]
+
+        index = self._index[pos]
+        result = []
+        for candidate in [form] + forms:
+            if candidate in index and candidate not in result:
+                result.append(candidate)
+        return result
+
+    def synsets(self, lemma: str) -> list[SnapshotSynset]:
+        lemma = lemma.lower()
+        return [
+            SnapshotSynset(self, code)
+            for pos in POS_LIST
+            for form in self._morphy(lemma, pos)
+            for code in self._index[pos][form]
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a prebuilt WordNet snapshot")
+    parser.add_argument("output", help="Where to write the snapshot pickle")
+    args = parser.parse_args()
+
+    from nltk.corpus import wordnet
+
+    snapshot = WordNetSnapshot.build(wordnet)
+    snapshot.save(args.output)
+    print(f"Saved WordNet {snapshot.wordnet_version} snapshot to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""
+Durable work queue of phrases, backed by a SQLite file.
+
+Workers in any number of processes claim batches of phrases under a lease, keep
+the lease alive with heartbeats while they work, and commit each `RebusPuzzle`
+together with marking its job done in one transaction.
+A lease that expires (its worker crashed or hung) is re-issued to the next worker
+that claims. A job that fails or loses its lease `max_attempts` times is moved to
+the dead-letter state with its last error, instead of being retried forever.
+
+Example:
+    python -m rebus.work_queue queue.db enqueue phrases.txt
+    python -m rebus.work_queue queue.db work --processes 4
+    python -m rebus.work_queue queue.db status
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from uuid import uuid4
+
+from rebus import metrics
+from rebus.files import read_phrases
+from rebus.rebus import find_puzzle
+from rebus.structs import RebusPuzzle, puzzle_from_dict, puzzle_to_dict
+
+logger = logging.getLogger(__name__)
+
+WORK_QUEUE_JOBS = metrics.counter(
+    "rebus_work_queue_jobs_total",
+    "Work queue jobs finished by this process, by outcome (done/retry/dead/lost)",
+    ("outcome",),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    phrase TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL DEFAULT 'pending',  -- pending/leased/done/dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+CREATE TABLE IF NOT EXISTS results (
+    job_id INTEGER PRIMARY KEY REFERENCES jobs (id),
+    puzzle TEXT NOT NULL  -- JSON, see `puzzle_to_dict`
+);
+"""
+
+
+@dataclass(frozen=True)
+class Lease:
+    job_id: int
+    phrase: str
+    attempt: int  # 1 for the first claim of the job
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+class WorkQueue:
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = 300.0,
+        max_attempts: int = 3,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            path: SQLite database file; created if missing
+            lease_seconds: how long a claim lasts without a heartbeat
+            max_attempts: claims per job before it is dead-lettered
+            clock: current time in seconds; overridable for tests
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.clock = clock
+        # autocommit mode; transactions are opened explicitly by `_transaction`.
+        # Workers call in from `asyncio.to_thread`, so the connection is shared
+        # across threads, one caller at a time.
+        self._db = sqlite3.connect(
+            path, timeout=30.0, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.RLock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE takes the write lock up front, so two workers can never claim
+        # the same rows
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def enqueue(self, phrases: Iterable[str]) -> int:
+        """Adds phrases not already queued; returns how many were added"""
+        now = self.clock()
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs (phrase, updated) VALUES (?, ?)",
+                ((phrase, now) for phrase in phrases),
+            )
+            return db.total_changes - before
+
+    def claim(self, worker_id: str, batch_size: int = 1) -> list[Lease]:
+        """Leases up to `batch_size` pending jobs, or jobs whose lease expired"""
+        now = self.clock()
+        with self._transaction() as db:
+            dead = db.execute(
+                "UPDATE jobs SET state = 'dead', lease_owner = NULL, updated = ?,"
+                " last_error = COALESCE(last_error, 'lease expired')"
+                " WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            ).rowcount
+            rows = db.execute(
+                "SELECT id, phrase, attempts FROM jobs"
+                " WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)"
+                " ORDER BY id LIMIT ?",
+                (now, batch_size),
+            ).fetchall()
+            db.executemany(
+                "UPDATE jobs SET state = 'leased', lease_owner = ?, lease_expires = ?,"
+                " attempts = attempts + 1, updated = ? WHERE id = ?",
+                ((worker_id, now + self.lease_seconds, now, row[0]) for row in rows),
+            )
+        if dead:
+            WORK_QUEUE_JOBS.inc(dead, outcome="dead")
+            logger.warning("Dead-lettered %d jobs whose leases expired", dead)
+        return [
+            Lease(job_id, phrase, attempts + 1) for job_id, phrase, attempts in rows
+        ]
+
+    def heartbeat(self, worker_id: str, job_ids: Iterable[int]) -> set[int]:
+        """Extends the worker's leases; returns the ids it still holds"""
+        job_ids = list(job_ids)
+        now = self.clock()
+        with self._transaction() as db:
+            held = set()
+            for job_id in job_ids:
+                cursor = db.execute(
+                    "UPDATE jobs SET lease_expires = ?"
+                    " WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+                    (now + self.lease_seconds, job_id, worker_id),
+                )
+                if cursor.rowcount:
+                    held.add(job_id)
+        return held
+
+    def complete(self, worker_id: str, job_id: int, puzzle: RebusPuzzle) -> bool:
+        """
+        Stores the job's puzzle and marks it done, atomically. Returns False (and
+        stores nothing) if the worker no longer holds the job's lease.
+        """
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET state = 'done', lease_owner = NULL, updated = ?"
+                " WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+                (self.clock(), job_id, worker_id),
+            )
+            if cursor.rowcount:
+                db.execute(
+                    "INSERT OR REPLACE INTO results (job_id, puzzle) VALUES (?, ?)",
+                    (job_id, json.dumps(puzzle_to_dict(puzzle))),
+                )
+        outcome = "done" if cursor.rowcount else "lost"
+        WORK_QUEUE_JOBS.inc(outcome=outcome)
+        return outcome == "done"
+
+    def fail(self, worker_id: str, job_id: int, error: str):
+        """Releases the job for a retry, or dead-letters it after `max_attempts`"""
+        with self._transaction() as db:
+            row = db.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'dead'"
+                " ELSE 'pending' END, lease_owner = NULL, last_error = ?, updated = ?"
+                " WHERE id = ? AND state = 'leased' AND lease_owner = ?"
+                " RETURNING state",
+                (self.max_attempts, error, self.clock(), job_id, worker_id),
+            ).fetchone()
+        if row is not None:
+            WORK_QUEUE_JOBS.inc(outcome="dead" if row[0] == "dead" else "retry")
+
+    def requeue_dead(self) -> int:
+        """Gives dead-lettered jobs a fresh set of attempts"""
+        with self._transaction() as db:
+            return db.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, updated = ?"
+                " WHERE state = 'dead'",
+                (self.clock(),),
+            ).rowcount
+
+    def counts(self) -> dict[str, int]:
+        """Number of jobs per state"""
+        counts = dict.fromkeys(("pending", "leased", "done", "dead"), 0)
+        with self._lock:
+            counts.update(
+                self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+            )
+        return counts
+
+    def has_unfinished(self) -> bool:
+        counts = self.counts()
+        return counts["pending"] + counts["leased"] > 0
+
+    def results(self) -> Iterator[RebusPuzzle]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT puzzle FROM results ORDER BY job_id"
+            ).fetchall()
+        for (puzzle,) in rows:
+            yield puzzle_from_dict(json.loads(puzzle))
+
+    def dead_letters(self) -> list[tuple[str, int, str | None]]:
+        """(phrase, attempts, last error) of dead-lettered jobs"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT phrase, attempts, last_error FROM jobs WHERE state = 'dead'"
+                " ORDER BY id"
+            ).fetchall()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def run_worker(
+    queue: WorkQueue,
+    worker_id: str | None = None,
+    batch_size: int = 8,
+    process: Callable[[str], Awaitable[RebusPuzzle]] = find_puzzle,
+    heartbeat_interval: float | None = None,
+    idle_wait: float = 1.0,
+) -> int:
+    """
+    Claims and processes batches until no job is pending or leased by anyone.
+    Returns the number of jobs this worker completed. Queue calls (which may wait
+    up to 30s on another process's lock) run in a thread, off the event loop.
+
+    If renewing the leases fails, the batch is abandoned and the error raised: its
+    leases will expire, and other workers take the jobs over.
+
+    Args:
+        process: turns a phrase into its puzzle; the phrases of a batch are
+            processed concurrently
+        heartbeat_interval: seconds between lease renewals; a third of the lease
+            by default
+        idle_wait: how long to wait before claiming again when other workers
+            hold every remaining job (their leases may still expire)
+    """
+    worker_id = worker_id or default_worker_id()
+    heartbeat_interval = heartbeat_interval or queue.lease_seconds / 3
+    completed = 0
+
+    async def heartbeat(in_progress: set[int]):
+        while True:
+            await asyncio.sleep(heartbeat_interval)
+            job_ids = set(in_progress)
+            held = await asyncio.to_thread(queue.heartbeat, worker_id, job_ids)
+            for job_id in job_ids - held:
+                logger.warning("%s lost the lease on job %d", worker_id, job_id)
+
+    async def run(lease: Lease, in_progress: set[int]):
+        nonlocal completed
+        try:
+            puzzle = await process(lease.phrase)
+        except Exception as e:
+            logger.exception("Job %d (%r) failed", lease.job_id, lease.phrase)
+            error = f"{type(e).__name__}: {e}"
+            await asyncio.to_thread(queue.fail, worker_id, lease.job_id, error)
+        else:
+            # awaited before the +=, which would otherwise read a stale count
+            done = await asyncio.to_thread(
+                queue.complete, worker_id, lease.job_id, puzzle
+            )
+            completed += done
+        finally:
+            in_progress.discard(lease.job_id)
+
+    while True:
+        leases = await asyncio.to_thread(queue.claim, worker_id, batch_size)
+        if not leases:
+            if not await asyncio.to_thread(queue.has_unfinished):
+                return completed
+            await asyncio.sleep(idle_wait)
+            continue
+        logger.info("%s claimed %d jobs", worker_id, len(leases))
+
+        in_progress = {lease.job_id for lease in leases}
+        heartbeat_task = asyncio.create_task(heartbeat(in_progress))
+        jobs = asyncio.gather(*[run(lease, in_progress) for lease in leases])
+        try:
+            done, _ = await asyncio.wait(
+                [heartbeat_task, jobs], return_when=asyncio.FIRST_COMPLETED
+            )
+            if jobs not in done:  # the heartbeat died; leases will silently expire
+                error = heartbeat_task.exception()
+                logger.error(
+                    "%s could not renew its leases (%r); abandoning jobs %s",
+                    worker_id,
+                    error,
+                    sorted(in_progress),
+                )
+                raise error
+            await jobs
+        finally:
+            heartbeat_task.cancel()
+            jobs.cancel()
+            await asyncio.gather(heartbeat_task, jobs, return_exceptions=True)
+
+
+def _work(path: str, batch_size: int, lease_seconds: float, max_attempts: int):
+    logging.basicConfig(level=logging.INFO)
+    with WorkQueue(path, lease_seconds, max_attempts) as queue:
+        completed = asyncio.run(run_worker(queue, batch_size=batch_size))
+    logger.info("Worker %d completed %d jobs", os.getpid(), completed)
+
+
+def main():
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description="Durable queue of phrase jobs")
+    parser.add_argument("db", help="SQLite queue file")
+    parser.add_argument("--lease-seconds", type=float, default=300.0)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="Add phrases from a text file")
+    enqueue.add_argument("phrases", help="One phrase per line")
+    work = commands.add_parser("work", help="Process jobs until the queue is empty")
+    work.add_argument("--processes", type=int, default=1)
+    work.add_argument("--batch-size", type=int, default=8)
+    commands.add_parser("status", help="Show job counts and dead letters")
+    commands.add_parser("requeue-dead", help="Retry dead-lettered jobs")
+    export = commands.add_parser("export", help="Write finished puzzles as JSONL")
+    export.add_argument("output")
+    args = parser.parse_args()
+
+    with WorkQueue(args.db, args.lease_seconds, args.max_attempts) as queue:
+        if args.command == "enqueue":
+            added = queue.enqueue(read_phrases(args.phrases))
+            print(f"Added {added} phrases")
+        elif args.command == "status":
+            print(json.dumps(queue.counts()))
+            for phrase, attempts, error in queue.dead_letters():
+                print(f"dead: {phrase!r} after {attempts} attempts: {error}")
+        elif args.command == "requeue-dead":
+            print(f"Requeued {queue.requeue_dead()} jobs")
+        elif args.command == "export":
+            with open(args.output, "w") as f:
+                for puzzle in queue.results():
+                    f.write(json.dumps(puzzle_to_dict(puzzle)) + "\n")
+
+    if args.command == "work":
+        processes = [
+            multiprocessing.Process(
+                target=_work,
+                args=(args.db, args.batch_size, args.lease_seconds, args.max_attempts),
+            )
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Local stand-in for a ComfyUI server, for testing scene clients and schedulers
+without a GPU.
+
+Implements the endpoints `ComfyClient` uses (/prompt, /queue, /history, /view,
+/system_stats) and runs submitted prompts one at a time on a background thread,
+taking `job_seconds` each. The "image" of a prompt is a JSON description of what
+would have been drawn (prompts, seed, resolution, models).
+
+Example:
+    with StubComfyServer(job_seconds=0.01) as server:
+        async with ComfyClient(server.url) as client:
+            ...
+"""
+
+import json
+import queue
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+
+_STOP = object()
+
+
+def describe_graph(graph: dict) -> dict:
+    """What an image generated from `graph` would show"""
+    nodes = {node["class_type"]: node["inputs"] for node in graph.values()}
+    encoders = [
+        (int(node_id), node["inputs"]["t5xxl"])
+        for node_id, node in graph.items()
+        if node["class_type"] == "CLIPTextEncodeFlux"
+    ]
+    return {
+        "prompts": [text for _, text in sorted(encoders)],
+        "seed": nodes["RandomNoise"]["noise_seed"],
+        "width": nodes["EmptyLatentImage"]["width"],
+        "height": nodes["EmptyLatentImage"]["height"],
+        "steps": nodes["BasicScheduler"]["steps"],
+        "unet": nodes["UNETLoader"]["unet_name"],
+    }
+
+
+class StubComfyServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, job_seconds=0.0):
+        self.job_seconds = job_seconds
+        self.healthy = True  # if False, every endpoint answers 503
+        self.fail_jobs = False  # if True, prompts finish with an error status
+        self.hang_jobs = False  # if True, prompts never finish
+        # if True, POST /prompt closes the connection without answering, after
+        # queuing the prompt (`drop_submit_responses`) or without (`drop_submissions`)
+        self.drop_submit_responses = False
+        self.drop_submissions = False
+        self.submitted: list[dict] = []  # graphs, in submission order
+        self.loaded_unets: list[str] = []  # UNET loads, i.e. model swaps
+        self._lock = threading.Lock()
+        self._pending: queue.Queue = queue.Queue()
+        self._queue: list[str] = []  # prompt ids not finished yet
+        self._running: str | None = None
+        self._graphs: dict[str, dict] = {}
+        self._history: dict[str, dict] = {}
+        self._images: dict[str, bytes] = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._threads: list[threading.Thread] = []
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _execute(self):
+        current_unet = None
+        while (prompt_id := self._pending.get()) is not _STOP:
+            with self._lock:
+                if prompt_id not in self._queue:
+                    continue  # lost in a restart
+                self._running = prompt_id
+                graph = self._graphs[prompt_id]
+            description = describe_graph(graph)
+            if description["unet"] != current_unet:
+                current_unet = description["unet"]
+                self.loaded_unets.append(current_unet)
+            time.sleep(self.job_seconds)
+            while self.hang_jobs and prompt_id in self._queue:
+                time.sleep(0.01)
+
+            filename = f"{prompt_id}.json"
+            with self._lock:
+                if prompt_id not in self._queue:
+                    continue  # lost in a restart
+                if self.fail_jobs:
+                    status, outputs = "error", {}
+                else:
+                    status = "success"
+                    self._images[filename] = json.dumps(
+                        description, sort_keys=True
+                    ).encode()
+                    outputs = {
+                        node_id: {
+                            "images": [
+                                {
+                                    "filename": filename,
+                                    "subfolder": "",
+                                    "type": "output",
+                                }
+                            ]
+                        }
+                        for node_id, node in graph.items()
+                        if node["class_type"] == "SaveImage"
+                    }
+                self._history[prompt_id] = {
+                    "prompt": [0, prompt_id, graph, {}, []],
+                    "outputs": outputs,
+                    "status": {
+                        "status_str": status,
+                        "completed": status == "success",
+                        "messages": [],
+                    },
+                }
+                self._queue.remove(prompt_id)
+                self._running = None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+
+            def _send(self, status: int, body, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length))
+                if not server.healthy:
+                    return self._send(503, {"error": "unavailable"})
+                if self.path != "/prompt":
+                    return self._send(404, {"error": "not found"})
+                if server.drop_submissions:
+                    self.close_connection = True
+                    return
+                prompt_id = payload.get("prompt_id") or uuid4().hex
+                with server._lock:
+                    server.submitted.append(payload["prompt"])
+                    server._graphs[prompt_id] = payload["prompt"]
+                    server._queue.append(prompt_id)
+                    number = len(server.submitted)
+                server._pending.put(prompt_id)
+                if server.drop_submit_responses:
+                    self.close_connection = True
+                    return
+                self._send(
+                    200, {"prompt_id": prompt_id, "number": number, "node_errors": {}}
+                )
+
+            def do_GET(self):
+                if not server.healthy:
+                    return self._send(503, {"error": "unavailable"})
+                url = urllib.parse.urlsplit(self.path)
+                with server._lock:
+                    if url.path == "/system_stats":
+                        return self._send(200, {"system": {}, "devices": []})
+                    if url.path == "/prompt":
+                        remaining = len(server._queue)
+                        return self._send(
+                            200, {"exec_info": {"queue_remaining": remaining}}
+                        )
+                    if url.path == "/queue":
+                        running = [
+                            [0, prompt_id, {}, {}, []]
+                            for prompt_id in server._queue
+                            if prompt_id == server._running
+                        ]
+                        pending = [
+                            [0, prompt_id, {}, {}, []]
+                            for prompt_id in server._queue
+                            if prompt_id != server._running
+                        ]
+                        return self._send(
+                            200, {"queue_running": running, "queue_pending": pending}
+                        )
+                    if url.path.startswith("/history/"):
+                        prompt_id = url.path.removeprefix("/history/")
+                        entry = server._history.get(prompt_id)
+                        return self._send(200, {prompt_id: entry} if entry else {})
+                    if url.path == "/view":
+                        filename = urllib.parse.parse_qs(url.query)["filename"][0]
+                        if filename not in server._images:
+                            return self._send(404, {"error": "not found"})
+                        return self._send(
+                            200, server._images[filename], "application/octet-stream"
+                        )
+                self._send(404, {"error": "not found"})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def restart(self):
+        """Simulates a server restart: all queued and finished prompts are lost"""
+        with self._lock:
+            self._queue.clear()
+            self._history.clear()
+            self._running = None
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, daemon=True),
+            threading.Thread(target=self._execute, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._pending.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self) -> "StubComfyServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
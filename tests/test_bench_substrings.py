@@ -0,0 +1,86 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+import rebus.word.wordnet
+
+BENCH_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "benchmarks", "bench_substrings.py"
+)
+
+
+def load_bench():
+    spec = importlib.util.spec_from_file_location("bench_substrings", BENCH_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeSynset:
+    def hypernyms(self):
+        return []
+
+    def hyponyms(self):
+        return []
+
+
+class FakeWordNet:
+    """Knows a handful of words, so the benchmark runs without the corpus"""
+
+    def __init__(self, words):
+        self._synsets = {word: [FakeSynset()] for word in words}
+
+    def synsets(self, lemma):
+        return self._synsets.get(lemma, [])
+
+    def get_version(self):
+        return "fake-1.0"
+
+
+@pytest.fixture
+def bench(monkeypatch):
+    wordnet = FakeWordNet(["gar", "garden", "den", "bloom", "red", "barn", "bar"])
+    monkeypatch.setattr(rebus.word.wordnet, "_wordnet", wordnet)
+    return load_bench()
+
+
+def test_benchmarks_run_on_tiny_corpus(bench):
+    results = bench.run_benchmarks(
+        corpora={"medium": ["garden bloom", "red barn"]},
+        word_pairs=[("gar", "garden")],
+    )
+    substrings = results["find_substrings[medium]"]
+    assert substrings["items"] == 2
+    assert substrings["classifier_calls"] > 0
+    assert substrings["wordnet_lookups"] > 0
+    assert substrings["cpu_time_ratio"] >= 0
+    assert "build_visual_genome_phrases" in results
+
+    assert bench.check_against_baseline(results, results, tolerance=0.25) == []
+    faster = {
+        name: {**result, "cpu_time_ratio": -1.0} for name, result in results.items()
+    }
+    assert bench.check_against_baseline(results, faster, tolerance=0.25)
+
+
+def test_check_without_baseline_exits_with_message(bench, tmp_path):
+    baseline = str(tmp_path / "missing.json")
+    with pytest.raises(SystemExit, match="run with --update"):
+        bench.main(["--check", "--baseline", baseline])
+
+
+def test_call_counts_match_committed_baseline():
+    try:
+        lexicon = rebus.word.wordnet.lexicon_version()
+    except LookupError:
+        pytest.skip("WordNet corpus not installed")
+    bench = load_bench()
+    with open(bench.BASELINE_PATH) as f:
+        baseline = json.load(f)
+    if any(result["lexicon_version"] != lexicon for result in baseline.values()):
+        pytest.skip(f"baseline was not recorded with {lexicon}")
+
+    results = bench.run_benchmarks()
+    assert bench.check_against_baseline(results, baseline, tolerance=None) == []
@@ -0,0 +1,68 @@
+import pytest
+
+from rebus.columnar import _HEADER, PuzzleTable
+from rebus.structs import RebusPuzzle, RebusSubstring
+
+PUZZLES = [
+    RebusPuzzle(
+        phrase="garden flower blooming",
+        substrings=[
+            RebusSubstring(text="gar", start=0, stop=3),
+            RebusSubstring(text="den", start=3, stop=6),
+            RebusSubstring(text="loom", start=13, stop=17),
+        ],
+    ),
+    RebusPuzzle(phrase="no substrings here", substrings=[]),
+    RebusPuzzle(
+        phrase="café terrace",
+        substrings=[RebusSubstring(text="terra", start=4, stop=9)],
+    ),
+]
+
+
+def test_from_puzzles_round_trip():
+    table = PuzzleTable.from_puzzles(PUZZLES)
+    assert len(table) == len(PUZZLES)
+    assert list(table) == PUZZLES
+    assert table[-1] == PUZZLES[-1]
+    assert table.spans(0) == [(0, 3), (3, 6), (13, 17)]
+    with pytest.raises(IndexError):
+        table[len(PUZZLES)]
+
+
+def test_save_and_memory_map(tmp_path):
+    path = str(tmp_path / "puzzles.bin")
+    PuzzleTable.from_puzzles(PUZZLES).save(path)
+    with PuzzleTable.open(path) as table:
+        assert len(table) == len(PUZZLES)
+        assert table[2] == PUZZLES[2]
+        assert table.phrase(1) == "no substrings here"
+        assert list(table) == PUZZLES
+
+
+def test_mismatched_substring_is_rejected():
+    puzzle = RebusPuzzle(
+        phrase="garden", substrings=[RebusSubstring(text="den", start=0, stop=3)]
+    )
+    with pytest.raises(ValueError):
+        PuzzleTable.from_puzzles([puzzle])
+
+
+def test_file_columns_are_little_endian(tmp_path):
+    path = str(tmp_path / "puzzles.bin")
+    PuzzleTable.from_puzzles(PUZZLES).save(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    first_phrase_end = _HEADER.size + 8  # phrase_offsets[1]
+    assert data[first_phrase_end : first_phrase_end + 8] == (
+        len(PUZZLES[0].phrase).to_bytes(8, "little")
+    )
+
+
+def test_byteswapping_round_trip(tmp_path, monkeypatch):
+    # exercises the big-endian host path: swap on save, swap back on open
+    monkeypatch.setattr("rebus.columnar._NATIVE_LITTLE_ENDIAN", False)
+    path = str(tmp_path / "puzzles.bin")
+    PuzzleTable.from_puzzles(PUZZLES).save(path)
+    with PuzzleTable.open(path) as table:
+        assert list(table) == PUZZLES
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from rebus.files import atomic_path, read_phrases
+
+
+def test_atomic_path_replaces_on_success(tmp_path):
+    path = str(tmp_path / "out.txt")
+    with atomic_path(path) as tmp:
+        with open(tmp, "w") as f:
+            f.write("new")
+        assert not os.path.exists(path)
+
+    assert open(path).read() == "new"
+    assert os.listdir(tmp_path) == ["out.txt"]
+
+
+def test_atomic_path_keeps_old_file_on_error(tmp_path):
+    path = tmp_path / "out.txt"
+    path.write_text("old")
+    with pytest.raises(RuntimeError):
+        with atomic_path(str(path)) as tmp:
+            with open(tmp, "w") as f:
+                f.write("partial")
+            raise RuntimeError("interrupted")
+
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["out.txt"]
+
+
+def test_read_phrases(tmp_path):
+    path = tmp_path / "phrases.txt"
+    path.write_text("garden bloom\n\n  red barn \n")
+    assert read_phrases(str(path)) == ["garden bloom", "red barn"]
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+
+import pytest
+
+from rebus.scene.image_writer import ImageEncoder, ImageWriter
+
+
+class FakeEncoder:
+    extension = "bin"
+    embeds_metadata = False
+
+    def __init__(self, release: threading.Event | None = None):
+        self.release = release
+
+    def __call__(self, image, metadata=None) -> bytes:
+        if self.release is not None:
+            self.release.wait(timeout=5)
+        return bytes(image)
+
+
+def test_counter_naming_continues_after_existing_files(tmp_path):
+    (tmp_path / "rebus_00007.bin").write_bytes(b"old")
+
+    with ImageWriter(str(tmp_path), FakeEncoder()) as writer:
+        futures = [writer.submit([i]) for i in range(3)]
+    paths = [future.result() for future in futures]
+
+    assert [os.path.basename(path) for path in paths] == [
+        "rebus_00008.bin",
+        "rebus_00009.bin",
+        "rebus_00010.bin",
+    ]
+    for i, path in enumerate(paths):
+        with open(path, "rb") as f:
+            assert f.read() == bytes([i])
+    assert (tmp_path / "rebus_00007.bin").read_bytes() == b"old"
+
+
+def test_counters_are_per_prefix(tmp_path):
+    for name in ("rebus_00007.bin", "other_00041.bin", "xrebus_00050.bin"):
+        (tmp_path / name).write_bytes(b"old")
+
+    with ImageWriter(str(tmp_path), FakeEncoder()) as writer:
+        first, other = writer.submit([0]), writer.submit([1], prefix="other")
+
+    assert os.path.basename(first.result()) == "rebus_00008.bin"
+    assert os.path.basename(other.result()) == "other_00042.bin"
+
+
+def test_hash_naming(tmp_path):
+    with ImageWriter(str(tmp_path), FakeEncoder(), naming="hash", prefix="p") as w:
+        first, second = w.submit([1, 2]).result(), w.submit([1, 2]).result()
+
+    digest = hashlib.sha256(bytes([1, 2])).hexdigest()[:32]
+    assert first == second == os.path.join(str(tmp_path), f"p_{digest}.bin")
+    assert sorted(os.listdir(tmp_path)) == [f"p_{digest}.bin"]
+
+
+def test_reserved_filename_is_known_before_writing(tmp_path):
+    release = threading.Event()
+    with ImageWriter(str(tmp_path), FakeEncoder(release)) as writer:
+        filename = writer.reserve_filename("img_%batch_num%", batch_number=1)
+        future = writer.submit([5], filename=filename)
+        assert filename == "img_1_00000.bin"
+        assert not future.done()
+        other = writer.submit([6])
+        release.set()
+    assert os.path.basename(future.result()) == filename
+    assert os.path.basename(other.result()) == "rebus_00000.bin"
+
+    with ImageWriter(str(tmp_path), FakeEncoder(), naming="hash") as writer:
+        assert writer.reserve_filename() is None
+
+
+def test_explicit_filename_prefix_and_sidecar_metadata(tmp_path):
+    with ImageWriter(str(tmp_path), FakeEncoder()) as writer:
+        named = writer.submit([0], {"prompt": {"1": {}}}, filename="out.bin")
+        batched = writer.submit([1], prefix="img_%batch_num%", batch_number=3)
+
+    assert os.path.basename(named.result()) == "out.bin"
+    assert json.loads((tmp_path / "out.bin.json").read_text()) == {"prompt": {"1": {}}}
+    assert os.path.basename(batched.result()) == "img_3_00000.bin"
+
+
+def test_submit_blocks_when_queue_is_full(tmp_path):
+    release = threading.Event()
+    writer = ImageWriter(
+        str(tmp_path), FakeEncoder(release), max_pending=2, num_threads=1
+    )
+    writer.submit([0])
+    writer.submit([1])
+
+    submitted = threading.Event()
+    thread = threading.Thread(target=lambda: (writer.submit([2]), submitted.set()))
+    thread.start()
+    assert not submitted.wait(timeout=0.1)
+
+    release.set()
+    thread.join(timeout=5)
+    assert submitted.is_set()
+    writer.close()
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_encoder_options():
+    assert ImageEncoder("webp").extension == "webp"
+    assert not ImageEncoder("webp").embeds_metadata
+    assert ImageEncoder().embeds_metadata
+    with pytest.raises(ValueError):
+        ImageEncoder("jpeg")
+    with pytest.raises(ValueError):
+        ImageWriter("unused", naming="random")
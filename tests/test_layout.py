@@ -0,0 +1,78 @@
+import pytest
+
+from rebus.layout import SUFFIX_GROUPS, PhraseLayout, cached_layout
+from rebus.rebus import has_potential_suffix
+
+PHRASES = [
+    "",
+    "word",
+    "garden flower blooming",
+    "carpenter ants marching",
+    "  hello  world  ",
+    "he!!o world##",
+    "hello123 world456",
+    "a b c",
+    "one\ttwo\nthree",
+    "café world",
+]
+
+
+def reference_parent_word(start_idx: int, end_idx: int, candidate: str) -> str:
+    """The original word-by-word scan of `get_parent_word`"""
+    current_idx = 0
+    for word in candidate.split():
+        if current_idx <= start_idx <= end_idx <= current_idx + len(word):
+            return word
+        current_idx += len(word)
+    return ""
+
+
+def reference_has_potential_suffix(chars: list[str], start: int, length: int) -> bool:
+    """The original `has_potential_suffix`, rebuilding the suffix set per call"""
+    if len(chars) - (start + length) < 1:
+        return False
+    next_chars = "".join(chars[start + length : start + length + 3])
+    potential_suffixes = set()
+    for group in SUFFIX_GROUPS:
+        for suffix in group:
+            potential_suffixes.add(suffix)
+            for i in range(1, len(suffix)):
+                potential_suffixes.add(suffix[i:])
+    return any(next_chars.startswith(suffix) for suffix in potential_suffixes)
+
+
+@pytest.mark.parametrize("phrase", PHRASES)
+def test_parent_word_matches_scan(phrase):
+    layout = PhraseLayout(phrase)
+    for start in range(-2, len(phrase) + 3):
+        for stop in range(-2, len(phrase) + 3):
+            assert layout.parent_word(start, stop) == reference_parent_word(
+                start, stop, phrase
+            ), (phrase, start, stop)
+
+
+@pytest.mark.parametrize("phrase", PHRASES + ["blessing", "nationless ably"])
+def test_suffix_table_matches_scan(phrase):
+    layout = PhraseLayout(phrase)
+    chars = list(layout.text)
+    assert layout.text == "".join(c for c in phrase if c.isalpha())
+    for start in range(len(chars)):
+        for length in range(len(chars) - start + 1):
+            expected = reference_has_potential_suffix(chars, start, length)
+            assert layout.has_potential_suffix(start + length) == expected
+            assert has_potential_suffix(chars, start, length) == expected
+
+
+def test_layout_arrays():
+    layout = PhraseLayout("gar den")
+    assert layout.text == "garden"
+    assert list(layout.word_starts) == [0, 3]
+    assert list(layout.word_stops) == [3, 6]
+    assert list(layout.word_ids) == [0, 0, 0, 1, 1, 1, 1]
+
+
+def test_cached_layout_skips_suffix_table():
+    layout = cached_layout("gar den")
+    assert layout.parent_word(0, 2) == "gar"
+    assert layout._suffix_starts is None  # not needed for parent words
+    assert cached_layout("gar den") is layout
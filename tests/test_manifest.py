@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+from rebus.manifest import Manifest, process_corpus
+from rebus.structs import RebusPuzzle, RebusSubstring
+
+DEPENDENCIES = {
+    "lexicon": "wordnet-3.0",
+    "visual_word_prompt": "abc",
+    "visual_word_model": "model",
+    "algorithm": "1",
+}
+
+
+class FakeProcess:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, phrase: str) -> RebusPuzzle:
+        self.calls.append(phrase)
+        return RebusPuzzle(phrase, [RebusSubstring(phrase[:3], 0, 3)])
+
+
+def run(phrases, path, dependencies=DEPENDENCIES, **kwargs):
+    process = FakeProcess()
+    puzzles, diff = asyncio.run(
+        process_corpus(phrases, path, process, dependencies, **kwargs)
+    )
+    return process.calls, puzzles, diff
+
+
+def test_rerun_processes_only_new_phrases(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    calls, puzzles, diff = run(["garden", "carpet", "garden"], path)
+    assert sorted(calls) == ["carpet", "garden"]
+    assert [p.phrase for p in puzzles] == ["garden", "carpet", "garden"]
+    assert diff.summary() == "new 2, stale 0, failed 0, unchanged 0, removed 0"
+
+    calls, puzzles, diff = run(["carpet", "bandage", "garden"], path)
+    assert calls == ["bandage"]
+    assert [p.substrings[0].text for p in puzzles] == ["car", "ban", "gar"]
+    assert diff.summary() == "new 1, stale 0, failed 0, unchanged 2, removed 0"
+
+    calls, _, diff = run(["bandage"], path)
+    assert calls == []
+    assert sorted(diff.removed) == ["carpet", "garden"]
+    assert len(Manifest.load(path).entries) == 1
+
+
+def test_changed_dependency_reprocesses_everything(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    run(["garden", "carpet"], path)
+
+    changed = {**DEPENDENCIES, "visual_word_prompt": "def"}
+    calls, _, diff = run(["garden", "carpet"], path, changed)
+
+    assert sorted(calls) == ["carpet", "garden"]
+    assert diff.changed_dependencies == {"visual_word_prompt"}
+    assert diff.summary() == (
+        "new 0, stale 2, failed 0, unchanged 0, removed 0 (changed: visual_word_prompt)"
+    )
+
+
+def test_failed_phrase_recorded_and_retried(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+
+    async def flaky(phrase: str) -> RebusPuzzle:
+        if phrase == "bad":
+            raise RuntimeError("API down")
+        return RebusPuzzle(phrase, [])
+
+    puzzles, _ = asyncio.run(
+        process_corpus(
+            ["garden", "bad", "carpet"], path, flaky, DEPENDENCIES, concurrency=1
+        )
+    )
+    assert [p and p.phrase for p in puzzles] == ["garden", None, "carpet"]
+    assert Manifest.load(path).error("bad") == "RuntimeError: API down"
+
+    calls, puzzles, diff = run(["garden", "bad", "carpet"], path)
+    assert calls == ["bad"]
+    assert diff.failed == ["bad"]
+    assert diff.unchanged == ["garden", "carpet"]
+    assert puzzles[1].phrase == "bad"
+
+
+def test_checkpoints_append_to_journal(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    run(["garden", "carpet"], path, checkpoint_every=1)
+    run(["garden", "carpet", "bandage"], path, checkpoint_every=1)
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert json.loads(lines[0]) == {"format_version": 2}
+    assert len(lines) == 4  # header and one line per phrase, nothing rewritten
+
+    # a truncated last line (interrupted append) is ignored
+    with open(path, "a") as f:
+        f.write('{"key": "abc", "phr')
+    assert len(Manifest.load(path).entries) == 3
+
+
+def test_superseded_lines_compacted_on_load(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    for version in "123":
+        run(["garden"], path, {**DEPENDENCIES, "algorithm": version})
+    assert Manifest.load(path).journal_lines == 3
+
+    run(["garden"], path, {**DEPENDENCIES, "algorithm": "4"})
+    with open(path) as f:
+        assert len(f.read().splitlines()) == 3  # header, compacted entry, new entry
+    assert len(Manifest.load(path).entries) == 1
+
+
+def test_loads_single_document_manifest(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = Manifest()
+    manifest.record(RebusPuzzle("garden", []), DEPENDENCIES)
+    with open(path, "w") as f:
+        json.dump({"format_version": 1, "entries": manifest.entries}, f)
+
+    calls, puzzles, _ = run(["garden", "carpet"], path)
+    assert calls == ["carpet"]
+    assert [p.phrase for p in puzzles] == ["garden", "carpet"]
+
+    reloaded = Manifest.load(path)
+    assert reloaded.format_version == 2
+    assert reloaded.puzzle("garden").phrase == "garden"
+    assert reloaded.puzzle("carpet").phrase == "carpet"
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import urllib.request
+
+import pytest
+
+import rebus.rebus
+from rebus.metrics import MetricsRegistry, serve
+
+
+def test_counter_and_histogram_prometheus_text():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Calls made", ("outcome",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+    calls.inc(outcome="ok")
+    calls.inc(2, outcome="ok")
+    calls.inc(outcome="rate_limited")
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    text = registry.render_prometheus()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{outcome="ok"} 3' in text
+    assert 'calls_total{outcome="rate_limited"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "latency_seconds_count 2" in text
+
+
+def test_labels_must_match():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Calls made", ("outcome",))
+    with pytest.raises(ValueError):
+        calls.inc()
+    with pytest.raises(ValueError):
+        registry.histogram("calls_total", "Same name, different type")
+
+
+def test_snapshot_is_json_serializable():
+    registry = MetricsRegistry()
+    registry.histogram("latency_seconds", "Latency", ("stage",)).observe(
+        0.2, stage="is_word"
+    )
+    snapshot = json.loads(json.dumps(registry.snapshot()))
+    (sample,) = snapshot["metrics"]["latency_seconds"]["samples"]
+    assert sample["labels"] == {"stage": "is_word"}
+    assert sample["count"] == 1
+
+
+def test_serve():
+    registry = MetricsRegistry()
+    registry.counter("calls_total", "Calls made").inc()
+    server = serve(port=0, registry=registry)
+    try:
+        host, port = server.server_address[:2]
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert "calls_total 1" in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_failed_find_substrings_is_recorded(monkeypatch):
+    def broken_is_word(substring):
+        raise RuntimeError("lexicon unavailable")
+
+    monkeypatch.setattr(rebus.rebus, "is_word", broken_is_word)
+    latency = rebus.rebus.STAGE_LATENCY
+    before = latency.count(stage="find_substrings")
+    with pytest.raises(RuntimeError):
+        asyncio.run(rebus.rebus.find_substrings("garden"))
+    assert latency.count(stage="find_substrings") == before + 1
+
+
+def test_histogram_bucket_bounds_are_inclusive():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.1, 1.0, 2.0):
+        latency.observe(value)
+
+    (sample,) = registry.snapshot()["metrics"]["latency_seconds"]["samples"]
+    assert sample["buckets"] == {"0.1": 1, "1.0": 2, "+Inf": 3}
+
+
+def test_substring_stages_observed_once_per_phrase(monkeypatch):
+    async def is_visual_word(substring):
+        return True
+
+    monkeypatch.setattr(rebus.rebus, "is_word", lambda s: s in ("gar", "den"))
+    monkeypatch.setattr(rebus.rebus, "same_meaning", lambda a, b: False)
+    monkeypatch.setattr(rebus.rebus, "is_visual_word", is_visual_word)
+    latency = rebus.rebus.STAGE_LATENCY
+    before = {
+        stage: latency.count(stage=stage)
+        for stage in ("is_word", "is_visual_word", "find_substrings")
+    }
+    substrings = asyncio.run(rebus.rebus.find_substrings("garden"))
+    assert [s.text for s in substrings] == ["gar", "den"]
+    for stage, count in before.items():
+        assert latency.count(stage=stage) == count + 1
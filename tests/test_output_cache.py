@@ -0,0 +1,113 @@
+import asyncio
+import dataclasses
+from functools import partial
+
+import pytest
+
+from rebus.scene.comfy_client import ComfyClient
+from rebus.scene.dry_run import (
+    DRY_RUN_NODE_CLASS_MAPPINGS,
+    _StubNode,
+    encode_dry_run_image,
+)
+from rebus.scene.jobs import SceneModels, SceneResult, job_to_dict
+from rebus.scene.output_cache import SceneOutputStore, scene_key
+from rebus.scene.scheduler import SceneScheduler
+from rebus.scene.worker import SceneWorker
+from rebus.scene.workflow import scene_job_for_puzzle
+from rebus.structs import RebusPuzzle, RebusSubstring
+
+from comfy_stub import StubComfyServer
+
+PUZZLE = RebusPuzzle(
+    phrase="garden",
+    substrings=[RebusSubstring("gar", 0, 3), RebusSubstring("den", 3, 6)],
+)
+
+
+def test_scene_key():
+    job = scene_job_for_puzzle(PUZZLE, seed=1)
+    same = scene_job_for_puzzle(PUZZLE, seed=1)
+    assert job.job_id != same.job_id
+    assert scene_key(job) == scene_key(same)
+
+    variants = [
+        dataclasses.replace(job, seed=2),
+        dataclasses.replace(job, steps=30),
+        dataclasses.replace(job, width=512),
+        dataclasses.replace(job, prompt="A different scene."),
+        dataclasses.replace(job, models=SceneModels(unet_name="other.safetensors")),
+        scene_job_for_puzzle(PUZZLE, seed=1, descriptions={"gar": "a gar (fish)"}),
+    ]
+    keys = {scene_key(variant) for variant in variants}
+    assert len(keys) == len(variants)
+    assert scene_key(job) not in keys
+
+
+def test_store_round_trip(tmp_path):
+    store = SceneOutputStore(str(tmp_path), "json")
+    job = scene_job_for_puzzle(PUZZLE, seed=1)
+    assert store.get(job) is None
+
+    stored = store.put(SceneResult(job=job, images=[b"one", b"two"]))
+    again = scene_job_for_puzzle(PUZZLE, seed=1)
+    result = store.get(again)
+
+    assert result.job is again
+    assert result.images == [b"one", b"two"]
+    assert result.paths == stored.paths
+    assert job_to_dict(store.get_job(scene_key(job))) == job_to_dict(job)
+
+    # storing the same scene again keeps the first entry
+    store.put(SceneResult(job=again, images=[b"other"]))
+    assert store.get(job).images == [b"one", b"two"]
+
+
+def test_worker_skips_stored_jobs(tmp_path):
+    _StubNode.calls.clear()
+    store = SceneOutputStore(str(tmp_path), "json")
+    with SceneWorker(
+        DRY_RUN_NODE_CLASS_MAPPINGS,
+        encode_image=encode_dry_run_image,
+        output_store=store,
+    ) as worker:
+        first = [worker.submit(scene_job_for_puzzle(PUZZLE, seed=s)) for s in range(3)]
+        first = [future.result() for future in first]
+        second = [worker.submit(scene_job_for_puzzle(PUZZLE, seed=s)) for s in range(4)]
+        second = [future.result() for future in second]
+
+    assert _StubNode.calls["SamplerCustomAdvanced.sample"] == 4
+    assert [r.images for r in second[:3]] == [r.images for r in first]
+    assert all(r.paths for r in second)
+
+
+def test_worker_writes_to_one_destination(tmp_path):
+    store = SceneOutputStore(str(tmp_path / "store"), "json")
+    with pytest.raises(ValueError):
+        SceneWorker(
+            DRY_RUN_NODE_CLASS_MAPPINGS,
+            output_dir=str(tmp_path / "out"),
+            output_store=store,
+        )
+
+
+def test_scheduler_skips_stored_jobs(tmp_path):
+    store = SceneOutputStore(str(tmp_path), "json")
+    jobs = [scene_job_for_puzzle(PUZZLE, seed=seed) for seed in range(3)]
+
+    with StubComfyServer() as server:
+
+        async def main():
+            async with SceneScheduler(
+                [server.url],
+                client_factory=partial(ComfyClient, poll_interval=0.005),
+                output_store=store,
+            ) as scheduler:
+                first = await scheduler.run(jobs)
+                second = await scheduler.run(jobs)
+                return first, second
+
+        first, second = asyncio.run(main())
+
+    assert len(server.submitted) == 3
+    assert [r.images for r in second] == [r.images for r in first]
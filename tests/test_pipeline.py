@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import rebus.rebus
+from rebus import pipeline as pipeline_module
+from rebus.pipeline import Pipeline, Stage, phrase_seed, rebus_stages
+from rebus.scene.jobs import SceneResult
+from rebus.structs import RebusSubstring
+
+
+def test_items_flow_through_stages():
+    async def double(x):
+        await asyncio.sleep(0.001)
+        return 2 * x
+
+    async def keep_multiples_of_four(x):
+        if x == 6:
+            raise ValueError("boom")
+        return x if x % 4 == 0 else None
+
+    pipeline = Pipeline(
+        [
+            Stage("double", double, concurrency=3),
+            Stage("filter", keep_multiples_of_four, 2),
+        ]
+    )
+    results = asyncio.run(pipeline.run(range(10)))
+
+    assert sorted(results) == [0, 4, 8, 12, 16]
+    assert pipeline.stats["double"].processed == 10
+    assert pipeline.stats["filter"].errors == 1
+    assert pipeline.stats["filter"].dropped == 4
+    stats = pipeline.format_stats()
+    assert stats.startswith("double ") and "| filter " in stats
+    assert "errors 1" in stats
+
+
+def test_slow_stage_throttles_earlier_stages():
+    started = []
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def fast(x):
+            started.append(x)
+            return x
+
+        async def slow(x):
+            await gate.wait()
+            return x
+
+        pipeline = Pipeline(
+            [Stage("fast", fast, 2, queue_size=4), Stage("slow", slow, 1, queue_size=2)]
+        )
+        stream = pipeline.stream(range(100))
+        first = asyncio.create_task(stream.__anext__())
+        await asyncio.sleep(0.05)
+        # fast's queue + workers, slow's queue + worker, and the output queue
+        assert len(started) <= 2 + 2 + 1
+        assert pipeline.snapshot()["fast"]["queue_depth"] == 4
+        # the gauge follows puts too, though "fast" takes nothing out meanwhile
+        assert pipeline_module.PIPELINE_QUEUE_DEPTH.value(stage="fast") == 4
+        gate.set()
+        results = [await first] + [result async for result in stream]
+        return results
+
+    assert sorted(asyncio.run(main())) == list(range(100))
+    assert len(started) == 100
+
+
+def test_failing_input_raises():
+    def phrases():
+        yield "one"
+        raise OSError("corpus unreadable")
+
+    async def identity(x):
+        return x
+
+    with pytest.raises(OSError, match="corpus unreadable"):
+        asyncio.run(Pipeline([Stage("identity", identity)]).run(phrases()))
+
+
+def test_rebus_stages(monkeypatch):
+    async def fake_find_substrings(phrase):
+        if phrase == "xyz":
+            return []
+        return [RebusSubstring(phrase[:3], 0, 3)]
+
+    async def generate(job):
+        return SceneResult(job=job, images=[job.prompt.encode()])
+
+    monkeypatch.setattr(rebus.rebus, "find_substrings", fake_find_substrings)
+    pipeline = Pipeline(rebus_stages(generate, steps=4))
+    results = asyncio.run(pipeline.run(["garden", "xyz", "carpet"]))
+
+    assert sorted(puzzle.phrase for puzzle, _ in results) == ["carpet", "garden"]
+    for puzzle, result in results:
+        assert result.job.seed == phrase_seed(puzzle.phrase)
+        assert result.job.steps == 4
+        assert result.job.area_prompts[0].prompt == f"a {puzzle.phrase[:3]}"
+    assert pipeline.stats["substrings"].dropped == 1
+    stages = rebus_stages(generate, queue_size=3)
+    assert [stage.queue_size for stage in stages] == [3, 3]
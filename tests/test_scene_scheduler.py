@@ -0,0 +1,186 @@
+import asyncio
+import contextlib
+import json
+from functools import partial
+
+import pytest
+
+from rebus.scene.comfy_client import ComfyClient, ComfyError, ComfyUnavailableError
+from rebus.scene.jobs import SceneModels
+from rebus.scene.scheduler import NoBackendError, SceneScheduler
+from rebus.scene.workflow import scene_job_for_puzzle
+from rebus.structs import RebusPuzzle, RebusSubstring
+
+from comfy_stub import StubComfyServer
+
+PUZZLE = RebusPuzzle(
+    phrase="garden",
+    substrings=[RebusSubstring("gar", 0, 3), RebusSubstring("den", 3, 6)],
+)
+DEV = SceneModels()
+SCHNELL = SceneModels(unet_name="flux1-schnell.safetensors")
+
+
+@pytest.fixture
+def servers():
+    with contextlib.ExitStack() as stack:
+        yield [stack.enter_context(StubComfyServer(job_seconds=0.02)) for _ in range(3)]
+
+
+def make_scheduler(servers, **kwargs) -> SceneScheduler:
+    return SceneScheduler(
+        [server.url for server in servers],
+        client_factory=partial(ComfyClient, poll_interval=0.005),
+        **kwargs,
+    )
+
+
+def run(scheduler: SceneScheduler, jobs):
+    async def main():
+        async with scheduler:
+            return await scheduler.run(jobs)
+
+    return asyncio.run(main())
+
+
+def test_jobs_spread_across_backends(servers):
+    jobs = [scene_job_for_puzzle(PUZZLE, seed=seed) for seed in range(12)]
+    results = run(make_scheduler(servers, affinity_slack=0), jobs)
+
+    assert [json.loads(r.images[0])["seed"] for r in results] == list(range(12))
+    assert [len(server.submitted) for server in servers] == [4, 4, 4]
+
+
+def test_model_sets_stay_on_their_backends(servers):
+    jobs = [
+        scene_job_for_puzzle(PUZZLE, seed=seed, models=models)
+        for seed in range(6)
+        for models in (DEV, SCHNELL)
+    ]
+    results = run(make_scheduler(servers, affinity_slack=4), jobs)
+
+    assert len(results) == 12
+    for server in servers:
+        # each backend loads one model set and never swaps
+        assert len(server.loaded_unets) <= 1
+
+
+def test_failed_backend_jobs_retried_elsewhere(servers):
+    servers[0].healthy = False
+    scheduler = make_scheduler(servers, health_interval=0)
+    jobs = [scene_job_for_puzzle(PUZZLE, seed=seed) for seed in range(6)]
+    results = run(scheduler, jobs)
+
+    assert len(results) == 6
+    assert servers[0].submitted == []
+    assert sum(len(server.submitted) for server in servers) == 6
+    assert [backend.healthy for backend in scheduler.backends] == [False, True, True]
+
+
+def test_recovered_backend_used_again(servers):
+    scheduler = make_scheduler(servers, health_interval=0)
+    for server in servers:
+        server.healthy = False
+
+    async def main():
+        async with scheduler:
+            # tried on every backend, which are then marked unhealthy
+            with pytest.raises(ComfyUnavailableError):
+                await scheduler.submit(scene_job_for_puzzle(PUZZLE, seed=0))
+            with pytest.raises(NoBackendError):
+                await scheduler.submit(scene_job_for_puzzle(PUZZLE, seed=0))
+            servers[1].healthy = True
+            return await scheduler.submit(scene_job_for_puzzle(PUZZLE, seed=1))
+
+    result = asyncio.run(main())
+    assert json.loads(result.images[0])["seed"] == 1
+    assert len(servers[1].submitted) == 1
+
+
+def test_failed_job_not_retried(servers):
+    for server in servers:
+        server.fail_jobs = True
+    scheduler = make_scheduler(servers, health_interval=0)
+
+    with pytest.raises(ComfyError, match="failed"):
+        run(scheduler, [scene_job_for_puzzle(PUZZLE, seed=0)])
+    assert sum(len(server.submitted) for server in servers) == 1
+
+
+def test_poll_failure_does_not_resubmit(servers):
+    servers[0].job_seconds = 0.2
+    scheduler = make_scheduler(servers, health_interval=0)
+
+    async def main():
+        async with scheduler:
+            task = asyncio.create_task(
+                scheduler.submit(scene_job_for_puzzle(PUZZLE, seed=0))
+            )
+            await asyncio.sleep(0.05)
+            servers[0].healthy = False  # polls fail while the job runs
+            await asyncio.sleep(0.05)
+            servers[0].healthy = True
+            return await task
+
+    result = asyncio.run(main())
+    assert json.loads(result.images[0])["seed"] == 0
+    assert [len(server.submitted) for server in servers] == [1, 0, 0]
+    assert scheduler.backends[0].healthy
+
+
+def test_lost_prompt_resubmitted_elsewhere(servers):
+    servers[0].hang_jobs = True
+    scheduler = make_scheduler(servers, health_interval=0)
+
+    async def main():
+        async with scheduler:
+            task = asyncio.create_task(
+                scheduler.submit(scene_job_for_puzzle(PUZZLE, seed=0))
+            )
+            await asyncio.sleep(0.05)
+            servers[0].restart()
+            return await task
+
+    result = asyncio.run(main())
+    assert json.loads(result.images[0])["seed"] == 0
+    assert [len(server.submitted) for server in servers] == [1, 1, 0]
+
+
+def test_unreachable_backend_job_resubmitted_after_lost_after(servers):
+    servers[0].hang_jobs = True
+    scheduler = make_scheduler(servers, health_interval=0, lost_after=0.1)
+
+    async def main():
+        async with scheduler:
+            task = asyncio.create_task(
+                scheduler.submit(scene_job_for_puzzle(PUZZLE, seed=0))
+            )
+            await asyncio.sleep(0.05)
+            servers[0].healthy = False
+            return await task
+
+    try:
+        result = asyncio.run(main())
+    finally:
+        servers[0].restart()  # unblock the stub's executor
+    assert json.loads(result.images[0])["seed"] == 0
+    assert [len(server.submitted) for server in servers] == [1, 1, 0]
+    assert not scheduler.backends[0].healthy
+
+
+def test_dropped_submit_response_does_not_resubmit(servers):
+    servers[0].drop_submit_responses = True
+    scheduler = make_scheduler(servers, health_interval=0)
+    result = run(scheduler, [scene_job_for_puzzle(PUZZLE, seed=0)])[0]
+
+    assert json.loads(result.images[0])["seed"] == 0
+    assert [len(server.submitted) for server in servers] == [1, 0, 0]
+
+
+def test_dropped_submission_resubmitted_after_lost_after(servers):
+    servers[0].drop_submissions = True
+    scheduler = make_scheduler(servers, health_interval=0, lost_after=0.1)
+    result = run(scheduler, [scene_job_for_puzzle(PUZZLE, seed=0)])[0]
+
+    assert json.loads(result.images[0])["seed"] == 0
+    assert [len(server.submitted) for server in servers] == [0, 1, 0]
@@ -0,0 +1,180 @@
+import json
+import logging
+import pickle
+
+import pytest
+
+from rebus.scene.dry_run import (
+    DRY_RUN_NODE_CLASS_MAPPINGS,
+    _StubNode,
+    encode_dry_run_image,
+)
+from rebus.scene.conditioning_cache import ConditioningCache
+from rebus.scene.jobs import AreaPrompt, SceneJob, SceneModels
+from rebus.scene.worker import SceneWorker
+
+
+def make_job(seed: int, **kwargs) -> SceneJob:
+    return SceneJob(
+        prompt="A gar fish swims to a dark den. A loom for weaving is beside.",
+        area_prompts=[
+            AreaPrompt("a gar (fish)", x=0, y=0, width=384, height=512),
+            AreaPrompt("a den (cave)", x=320, y=0, width=384, height=512),
+            AreaPrompt("a loom for weaving fabric", x=640, y=0, width=384, height=512),
+        ],
+        seed=seed,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def worker(tmp_path):
+    _StubNode.calls.clear()
+    with SceneWorker(
+        DRY_RUN_NODE_CLASS_MAPPINGS,
+        output_dir=str(tmp_path),
+        encode_image=encode_dry_run_image,
+        image_extension="json",
+    ) as worker:
+        yield worker
+
+
+def test_models_loaded_once_for_many_jobs(worker):
+    jobs = [make_job(seed) for seed in range(5)]
+    results = [future.result() for future in [worker.submit(job) for job in jobs]]
+
+    assert _StubNode.calls["DualCLIPLoader.load_clip"] == 1
+    assert _StubNode.calls["UNETLoader.load_unet"] == 1
+    assert _StubNode.calls["VAELoader.load_vae"] == 1
+    assert _StubNode.calls["SamplerCustomAdvanced.sample"] == 5
+
+    for job, result in zip(jobs, results):
+        assert result.job is job
+        (image,) = [json.loads(image) for image in result.images]
+        assert image["seed"] == job.seed
+        assert image["prompts"][1:] == [area.prompt for area in job.area_prompts]
+        (path,) = result.paths
+        with open(path, "rb") as f:
+            assert f.read() == result.images[0]
+
+
+def test_job_for_other_models_fails(worker):
+    job = make_job(0, models=SceneModels(unet_name="flux1-schnell.safetensors"))
+    with pytest.raises(ValueError):
+        worker.submit(job).result()
+
+
+def test_conditioning_cache_skips_repeated_encodes(tmp_path):
+    def save(obj, path):
+        with open(path, "w") as f:
+            json.dump(obj, f)
+
+    def load(path):
+        with open(path) as f:
+            return json.load(f)
+
+    def run(jobs):
+        cache = ConditioningCache(
+            cache_dir=str(tmp_path / "cache"), save=save, load=load
+        )
+        with SceneWorker(
+            DRY_RUN_NODE_CLASS_MAPPINGS,
+            encode_image=encode_dry_run_image,
+            conditioning_cache=cache,
+        ) as worker:
+            return [worker.submit(job).result() for job in jobs]
+
+    _StubNode.calls.clear()
+    results = run([make_job(0), make_job(1)])
+    # one full-scene prompt and three area prompts, shared by both jobs
+    assert _StubNode.calls["CLIPTextEncodeFlux.encode"] == 4
+    assert json.loads(results[1].images[0])["prompts"][1] == "a gar (fish)"
+
+    # a fresh worker is served from the disk tier
+    _StubNode.calls.clear()
+    run([make_job(2)])
+    assert _StubNode.calls["CLIPTextEncodeFlux.encode"] == 0
+
+
+def test_conditioning_cache_drops_corrupt_entries_only(tmp_path, caplog):
+    def save(obj, path):
+        with open(path, "wb") as f:
+            pickle.dump(obj, f)
+
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    cache = ConditioningCache(cache_dir=str(tmp_path), save=save, load=load)
+    cache.put("ab12", [1.0, 2.0])
+    with open(cache._path("ab12"), "r+b") as f:
+        f.truncate(3)
+
+    fresh = ConditioningCache(cache_dir=str(tmp_path), save=save, load=load)
+    with caplog.at_level(logging.WARNING):
+        assert fresh.get("ab12") is None
+    assert "Dropping unreadable cache entry" in caplog.text
+
+    def broken_load(path):
+        raise TypeError("bug in the loader")
+
+    broken = ConditioningCache(cache_dir=str(tmp_path), save=save, load=broken_load)
+    with pytest.raises(TypeError):
+        broken.get("ab12")
+
+
+def test_conditioning_cache_drops_corrupt_torch_entries(tmp_path):
+    torch = pytest.importorskip("torch")
+
+    cache = ConditioningCache(cache_dir=str(tmp_path))
+    cache.put("ab12", [torch.ones(2)])
+    with open(cache._path("ab12"), "r+b") as f:
+        f.truncate(64)
+
+    assert ConditioningCache(cache_dir=str(tmp_path)).get("ab12") is None
+
+
+def test_compatible_jobs_are_sampled_in_one_batch():
+    _StubNode.calls.clear()
+    jobs = [make_job(seed) for seed in range(4)]
+    jobs[1].area_prompts[0].prompt = "a cat"
+    jobs.append(make_job(4, width=512))  # different resolution, own batch
+    with SceneWorker(
+        DRY_RUN_NODE_CLASS_MAPPINGS,
+        encode_image=encode_dry_run_image,
+        batch_size=8,
+        batch_wait=1.0,
+    ) as worker:
+        futures = [worker.submit(job) for job in jobs]
+        results = [future.result() for future in futures]
+
+    assert _StubNode.calls["SamplerCustomAdvanced.sample"] == 2
+    for job, result in zip(jobs, results):
+        (image,) = [json.loads(image) for image in result.images]
+        assert result.job is job
+        assert image["seed"] == job.seed
+        assert image["width"] == job.width
+        assert image["prompts"][1] == job.area_prompts[0].prompt
+
+
+def test_failing_job_does_not_fail_its_batch():
+    class FlakyWorker(SceneWorker):
+        def _sample(self, jobs):
+            if any(job.seed == 13 for job in jobs):
+                raise RuntimeError("NaN in latents")
+            return super()._sample(jobs)
+
+    _StubNode.calls.clear()
+    jobs = [make_job(seed) for seed in (11, 12, 13, 14)]
+    with FlakyWorker(
+        DRY_RUN_NODE_CLASS_MAPPINGS,
+        encode_image=encode_dry_run_image,
+        batch_size=8,
+        batch_wait=1.0,
+    ) as worker:
+        futures = [worker.submit(job) for job in jobs]
+        with pytest.raises(RuntimeError):
+            futures[2].result()
+        results = [futures[i].result() for i in (0, 1, 3)]
+
+    assert [result.job.seed for result in results] == [11, 12, 14]
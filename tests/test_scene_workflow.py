@@ -0,0 +1,160 @@
+import asyncio
+import json
+
+import pytest
+
+from rebus.scene.comfy_client import (
+    ComfyClient,
+    ComfyError,
+    ComfyTimeoutError,
+    ComfyUnavailableError,
+)
+from rebus.scene.jobs import MULTI_AREA_NODE_ID
+from rebus.scene.workflow import (
+    SAVE_NODE_ID,
+    build_workflow,
+    layout_areas,
+    scene_job_for_puzzle,
+)
+from rebus.structs import RebusPuzzle, RebusSubstring
+
+from comfy_stub import StubComfyServer
+
+PUZZLE = RebusPuzzle(
+    phrase="garden loom",
+    substrings=[
+        RebusSubstring("loom", 6, 10),
+        RebusSubstring("gar", 0, 3),
+        RebusSubstring("den", 3, 6),
+    ],
+)
+
+
+def test_layout_areas():
+    assert layout_areas(3, 1024) == [(0, 384), (320, 384), (640, 384)]
+    assert layout_areas(1, 1024) == [(0, 1024)]
+    assert layout_areas(0, 1024) == []
+    for x, width in layout_areas(5, 1024):
+        assert x % 8 == 0 and width % 8 == 0
+        assert x + width <= 1024
+
+
+def test_scene_job_orders_areas_by_position():
+    job = scene_job_for_puzzle(PUZZLE, seed=7, descriptions={"gar": "a gar (fish)"})
+
+    assert [area.prompt for area in job.area_prompts] == [
+        "a gar (fish)",
+        "a den",
+        "a loom",
+    ]
+    assert [area.x for area in job.area_prompts] == [0, 320, 640]
+    assert job.prompt == "A scene with a gar (fish), a den, a loom."
+    assert job.seed == 7
+
+
+def test_build_workflow():
+    job = scene_job_for_puzzle(PUZZLE, seed=7)
+    graph, extra_pnginfo = build_workflow(job)
+
+    multi_area = graph[str(MULTI_AREA_NODE_ID)]["inputs"]
+    conditioning_ids = [multi_area[f"conditioning{i}"][0] for i in range(4)]
+    texts = [graph[node_id]["inputs"]["t5xxl"] for node_id in conditioning_ids]
+    assert texts == [job.prompt, "a gar", "a den", "a loom"]
+
+    # every link points at a node in the graph
+    for node in graph.values():
+        for value in node["inputs"].values():
+            if isinstance(value, list):
+                assert value[0] in graph
+
+    (node,) = extra_pnginfo["workflow"]["nodes"]
+    assert node["id"] == MULTI_AREA_NODE_ID
+    assert len(node["properties"]["values"]) == 4
+    json.dumps(graph)
+
+
+@pytest.fixture
+def server():
+    with StubComfyServer(job_seconds=0.01) as server:
+        yield server
+
+
+def test_generate_against_stub(server):
+    jobs = [scene_job_for_puzzle(PUZZLE, seed=seed) for seed in range(6)]
+    progress = []
+
+    async def main():
+        async with ComfyClient(server.url, max_connections=2, poll_interval=0.01) as c:
+            return await asyncio.gather(
+                *[
+                    c.generate(job, on_progress=lambda *args: progress.append(args))
+                    for job in jobs
+                ]
+            )
+
+    results = asyncio.run(main())
+
+    assert len(server.submitted) == 6
+    for job, result in zip(jobs, results):
+        assert result.job is job
+        (image,) = [json.loads(image) for image in result.images]
+        assert image["seed"] == job.seed
+        assert image["prompts"] == [job.prompt, "a gar", "a den", "a loom"]
+    assert sum(status == "success" for _, status in progress) == 6
+    assert all(
+        graph[SAVE_NODE_ID]["class_type"] == "SaveImage" for graph in server.submitted
+    )
+
+
+def test_failed_job_raises(server):
+    server.fail_jobs = True
+
+    async def main():
+        async with ComfyClient(server.url, poll_interval=0.01) as client:
+            await client.generate(scene_job_for_puzzle(PUZZLE, seed=0))
+
+    with pytest.raises(ComfyError, match="failed"):
+        asyncio.run(main())
+
+
+def test_unhealthy_server_raises(server):
+    server.healthy = False
+
+    async def main():
+        async with ComfyClient(server.url) as client:
+            await client.system_stats()
+
+    with pytest.raises(ComfyError, match="503"):
+        asyncio.run(main())
+
+
+def test_prompt_lost_in_restart_raises(server):
+    server.hang_jobs = True
+
+    async def main():
+        async with ComfyClient(server.url, poll_interval=0.01) as client:
+            graph, extra_pnginfo = build_workflow(scene_job_for_puzzle(PUZZLE, seed=0))
+            prompt_id = await client.submit_graph(graph, extra_pnginfo)
+            wait = asyncio.create_task(client.wait(prompt_id))
+            await asyncio.sleep(0.05)
+            server.restart()
+            await wait
+
+    with pytest.raises(ComfyUnavailableError, match="lost prompt"):
+        asyncio.run(main())
+
+
+def test_wait_times_out(server):
+    server.hang_jobs = True
+
+    async def main():
+        async with ComfyClient(
+            server.url, poll_interval=0.01, job_timeout=0.05
+        ) as client:
+            await client.generate(scene_job_for_puzzle(PUZZLE, seed=0))
+
+    try:
+        with pytest.raises(ComfyTimeoutError):
+            asyncio.run(main())
+    finally:
+        server.restart()  # unblock the stub's executor
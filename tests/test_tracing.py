@@ -0,0 +1,37 @@
+import asyncio
+import json
+
+from rebus import tracing
+
+
+def test_disabled_spans_are_noops():
+    assert not tracing.is_enabled()
+    with tracing.span("outer", phrase="garden") as span_args:
+        span_args["cache"] = "hit"
+        tracing.annotate(cache="miss")
+
+
+def test_recording_writes_chrome_trace(tmp_path):
+    path = tmp_path / "trace.json"
+
+    async def check(substring):
+        with tracing.span("is_valid_substring", substring=substring):
+            await asyncio.sleep(0)
+            tracing.annotate(cache="miss")
+
+    async def run():
+        with tracing.span("find_substrings", phrase="garden"):
+            await asyncio.gather(check("gar"), check("den"))
+
+    with tracing.recording(str(path)):
+        asyncio.run(run())
+    assert not tracing.is_enabled()
+
+    events = json.loads(path.read_text())["traceEvents"]
+    assert {event["ph"] for event in events} == {"X"}
+    children = [event for event in events if event["name"] == "is_valid_substring"]
+    assert sorted(event["args"]["substring"] for event in children) == ["den", "gar"]
+    assert all(event["args"]["phrase"] == "garden" for event in children)
+    assert all(event["args"]["cache"] == "miss" for event in children)
+    # concurrent tasks are drawn on separate tracks
+    assert len({event["tid"] for event in children}) == 2
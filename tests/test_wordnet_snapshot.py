@@ -0,0 +1,80 @@
+from rebus.word.wordnet_snapshot import WordNetSnapshot
+
+
+class FakeSynset:
+    def __init__(self, pos, offset):
+        self._pos, self._offset = pos, offset
+        self.hypernym_list, self.hyponym_list = [], []
+
+    def pos(self):
+        return self._pos
+
+    def offset(self):
+        return self._offset
+
+    def hypernyms(self):
+        return self.hypernym_list
+
+    def hyponyms(self):
+        return self.hyponym_list
+
+
+class FakeWordNet:
+    """The parts of nltk's WordNetCorpusReader that snapshot building reads"""
+
+    MORPHOLOGICAL_SUBSTITUTIONS = {
+        "n": [("s", ""), ("ies", "y")],
+        "v": [("s", ""), ("ing", ""), ("ing", "e")],
+        "a": [("er", "")],
+        "r": [],
+    }
+
+    def __init__(self):
+        self.animal = FakeSynset("n", 100)
+        self.dog = FakeSynset("n", 200)
+        self.berry = FakeSynset("n", 300)
+        self.bloom = FakeSynset("v", 400)
+        self.tall = FakeSynset("s", 500)
+        self.dog.hypernym_list.append(self.animal)
+        self.animal.hyponym_list.append(self.dog)
+        self._lemma_pos_offset_map = {
+            "animal": {"n": [100]},
+            "dog": {"n": [200]},
+            "berry": {"n": [300]},
+            "bloom": {"v": [400]},
+            "tall": {"a": [500], "s": [500]},
+        }
+        self._exception_map = {"n": {"mice": ["mouse"]}, "v": {}, "a": {}, "r": {}}
+
+    def all_synsets(self):
+        return [self.animal, self.dog, self.berry, self.bloom, self.tall]
+
+    def get_version(self):
+        return "fake-1.0"
+
+
+def build_snapshot(tmp_path):
+    path = str(tmp_path / "wordnet.pkl")
+    WordNetSnapshot.build(FakeWordNet()).save(path)
+    return WordNetSnapshot.load(path)
+
+
+def test_snapshot_lookups_apply_morphology(tmp_path):
+    snapshot = build_snapshot(tmp_path)
+    assert snapshot.get_version() == "fake-1.0"
+    assert len(snapshot.synsets("dog")) == 1
+    assert snapshot.synsets("Dogs") == snapshot.synsets("dog")
+    assert snapshot.synsets("berries") == snapshot.synsets("berry")
+    assert snapshot.synsets("blooming") == snapshot.synsets("bloom")
+    assert snapshot.synsets("taller") == snapshot.synsets("tall")
+    assert snapshot.synsets("mice") == []  # exception target not in the index
+    assert snapshot.synsets("cat") == []
+
+
+def test_snapshot_relations(tmp_path):
+    snapshot = build_snapshot(tmp_path)
+    (dog,) = snapshot.synsets("dog")
+    (animal,) = snapshot.synsets("animal")
+    assert dog.hypernyms() == [animal]
+    assert animal.hyponyms() == [dog]
+    assert dog.hyponyms() == []
@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from rebus.structs import RebusPuzzle, RebusSubstring
+from rebus.work_queue import WorkQueue, run_worker
+
+PHRASES = [f"phrase {i}" for i in range(10)]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def puzzle_for(phrase: str) -> RebusPuzzle:
+    return RebusPuzzle(phrase, [RebusSubstring(phrase[:3], 0, 3)])
+
+
+async def fake_process(phrase: str) -> RebusPuzzle:
+    await asyncio.sleep(0.001)
+    if phrase == "bad":
+        raise ValueError("no luck")
+    return puzzle_for(phrase)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    with WorkQueue(str(tmp_path / "queue.db"), lease_seconds=10, clock=clock) as q:
+        yield q
+
+
+def test_enqueue_is_idempotent(queue):
+    assert queue.enqueue(PHRASES) == 10
+    assert queue.enqueue(PHRASES[:5] + ["new"]) == 1
+    assert queue.counts() == {"pending": 11, "leased": 0, "done": 0, "dead": 0}
+
+
+def test_claims_do_not_overlap(queue):
+    queue.enqueue(PHRASES)
+    first = queue.claim("a", 4)
+    second = queue.claim("b", 4)
+    third = queue.claim("c", 4)
+
+    assert [len(first), len(second), len(third)] == [4, 4, 2]
+    phrases = [lease.phrase for lease in first + second + third]
+    assert sorted(phrases) == sorted(PHRASES)
+    assert queue.claim("d", 4) == []
+
+
+def test_expired_lease_is_reissued(queue, clock):
+    queue.enqueue(["garden"])
+    (lease,) = queue.claim("a")
+    clock.now += 5
+    assert queue.heartbeat("a", [lease.job_id]) == {lease.job_id}
+    clock.now += 9
+    assert queue.claim("b") == []  # heartbeat kept the lease alive
+
+    clock.now += 2
+    (reissued,) = queue.claim("b")
+    assert reissued.job_id == lease.job_id and reissued.attempt == 2
+    assert queue.heartbeat("a", [lease.job_id]) == set()
+
+    assert not queue.complete("a", lease.job_id, puzzle_for("garden"))
+    assert queue.complete("b", lease.job_id, puzzle_for("garden"))
+    assert list(queue.results()) == [puzzle_for("garden")]
+    assert queue.counts()["done"] == 1
+
+
+def test_failures_are_retried_then_dead_lettered(queue, clock):
+    queue.enqueue(["bad", "slow"])
+    for attempt in range(1, 4):
+        leases = {lease.phrase: lease for lease in queue.claim("a", 2)}
+        assert leases["bad"].attempt == attempt
+        queue.fail("a", leases["bad"].job_id, "ValueError: no luck")
+        if "slow" in leases:
+            clock.now += 11  # let the lease on "slow" expire
+    clock.now += 11
+    assert queue.claim("a", 2) == []
+
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 0, "dead": 2}
+    assert queue.dead_letters() == [
+        ("bad", 3, "ValueError: no luck"),
+        ("slow", 3, "lease expired"),
+    ]
+    assert not queue.has_unfinished()
+    assert queue.requeue_dead() == 2
+    assert len(queue.claim("a", 2)) == 2
+
+
+def test_run_worker(queue):
+    queue.enqueue(PHRASES + ["bad"])
+    completed = asyncio.run(
+        run_worker(queue, "w", batch_size=4, process=fake_process, idle_wait=0)
+    )
+
+    assert completed == 10
+    assert sorted(p.phrase for p in queue.results()) == sorted(PHRASES)
+    assert queue.dead_letters() == [("bad", 3, "ValueError: no luck")]
+
+
+def test_dead_heartbeat_abandons_batch(queue, monkeypatch):
+    queue.enqueue(["garden", "carpet"])
+    started = []
+
+    async def slow_process(phrase: str) -> RebusPuzzle:
+        started.append(phrase)
+        await asyncio.sleep(10)
+        return puzzle_for(phrase)
+
+    def broken_heartbeat(worker_id, job_ids):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(queue, "heartbeat", broken_heartbeat)
+    with pytest.raises(sqlite3.OperationalError, match="disk I/O"):
+        asyncio.run(
+            run_worker(queue, "w", process=slow_process, heartbeat_interval=0.01)
+        )
+
+    assert sorted(started) == ["carpet", "garden"]
+    # nothing completed; the leases expire and other workers take over
+    assert queue.counts() == {"pending": 0, "leased": 2, "done": 0, "dead": 0}
+
+
+def _work(path: str):
+    with WorkQueue(path) as queue:
+        asyncio.run(run_worker(queue, batch_size=3, process=fake_process))
+
+
+def test_multiple_worker_processes(tmp_path):
+    path = str(tmp_path / "queue.db")
+    phrases = [f"phrase {i}" for i in range(60)]
+    with WorkQueue(path) as queue:
+        queue.enqueue(phrases)
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_work, args=(path,)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    with WorkQueue(path) as queue:
+        assert queue.counts()["done"] == 60
+        assert sorted(p.phrase for p in queue.results()) == sorted(phrases)